@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TaPAS: tools around openwind for real-time and batch synthesis of wind
+instruments.
+
+The submodules are imported on first access to their classes, so that
+`import tapas` stays cheap and does not import openwind (see
+:py:mod:`tapas.lazy`).
+"""
+
+import importlib
+
+
+_EXPORTS = {'RingBuffer': 'streaming',
+            'StreamingEngine': 'streaming',
+            'InstrumentCache': 'instrument_cache',
+            'ImpedanceCache': 'impedance_cache',
+            'AudioSink': 'audio',
+            'WavWriter': 'audio',
+            'PeakLimiter': 'audio',
+            'LinearResampler': 'audio',
+            'PolyphaseResampler': 'resampling',
+            'resample': 'resampling',
+            'AudioRateTemporalSolver': 'audio_rate',
+            'write_impedance_binary': 'impedance_store',
+            'read_impedance_binary': 'impedance_store',
+            'read_campaign': 'impedance_store',
+            'BoreFamily': 'dataset',
+            'generate_dataset': 'dataset',
+            'load_dataset': 'dataset',
+            'ImpedanceSurrogate': 'surrogate',
+            'MultiNoteSolver': 'multi_note',
+            'ParallelFrequentialSolver': 'parallel',
+            'adaptive_impedance': 'adaptive',
+            'ClimateSweep': 'climate',
+            'RationalImpedance': 'rational',
+            'fit_impedance': 'rational',
+            'ReducedFrequentialSolver': 'reduced',
+            'tmm_impedance': 'tmm',
+            'transfer_matrices': 'tmm',
+            'chain_product': 'tmm',
+            'bore_segments': 'tmm',
+            'FactorizationTimer': 'factorization',
+            'PardisoFactorization': 'factorization',
+            'TimedFrequentialSolver': 'factorization',
+            'TimedInverseFrequentialResponse': 'factorization',
+            'LazyFields': 'fields',
+            'run_sweep': 'sweep',
+            'curve_grid': 'sweep',
+            'load_variant': 'sweep',
+            'get_state': 'checkpoint',
+            'set_state': 'checkpoint',
+            'save_state': 'checkpoint',
+            'read_state': 'checkpoint',
+            'load_state': 'checkpoint',
+            'resume_simulation': 'checkpoint',
+            'DiskRecordingDevice': 'recording',
+            'EnsembleTemporalSolver': 'ensemble',
+            'SampledCurve': 'curves',
+            'sampled_curves': 'curves',
+            'run_sampled_simulation': 'curves',
+            'import_openwind': 'lazy',
+            'enable_lazy_imports': 'lazy'}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        module = importlib.import_module('.' + _EXPORTS[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__,
+                                                                    name))
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch rendering from the command line, see :py:func:`tapas.batch.main`.
+"""
+
+import sys
+
+from .batch import main
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Adaptive frequency sampling of the input impedance.
+
+Dense uniform frequency axes are mostly used to resolve the narrow peaks of
+the impedance. :py:func:`adaptive_impedance` starts from a coarse axis and
+bisects only the intervals where the impedance is not well interpolated:
+
+- the intervals on which the reflection coefficient `R = (Z - Zc)/(Z + Zc)`
+  turns by more than `max_phase_step` are always bisected (`R` turns once
+  between two resonances);
+- the impedance is computed at the middle of the other intervals and
+  compared to the cubic spline interpolation of the current samples; the
+  interval is refined until the deviation is below `atol + rtol*|Z|` (with
+  `Z` normalized by the characteristic impedance).
+
+The interpolation is made on `R`, which stays bounded and varies smoothly
+through the resonances, where `Z` has sharp peaks.
+
+The result is the non-uniform axis, the impedance on it and an interpolant
+valid on the whole range:
+
+.. code-block:: python
+
+    f_solver = FrequentialSolver(instru_phy, [20, 2000])
+    result = adaptive_impedance(f_solver, 20, 2000, rtol=1e-3)
+    result.n_solves, len(result.frequencies)
+    result(np.arange(20, 2000, 0.1))     # interpolated impedance
+"""
+
+import warnings
+
+import numpy as np
+from scipy.interpolate import CubicSpline
+
+
+def _reflection(impedance):
+    # the reflection coefficient of a normalized impedance
+    return (impedance - 1) / (impedance + 1)
+
+
+def _impedance(reflection):
+    return (1 + reflection) / (1 - reflection)
+
+
+class AdaptiveImpedance:
+    """
+    The impedance computed on an adaptive frequency axis.
+
+    It is callable: `result(frequencies)` interpolates the impedance with
+    a cubic spline of the reflection coefficient.
+
+    Parameters
+    ----------
+    frequencies : array of float
+        The increasing frequency axis, in Hz.
+    impedance : array of complex
+        The impedance at these frequencies.
+    Zc : float
+        The characteristic impedance at the entrance.
+    n_solves : int
+        The number of frequencies solved.
+
+    Attributes
+    ----------
+    converged : bool
+        False if the refinement stopped because of `max_solves` or
+        `min_step` before reaching the tolerance.
+    """
+
+    def __init__(self, frequencies, impedance, Zc, n_solves, converged=True):
+        self.frequencies = np.asarray(frequencies)
+        self.impedance = np.asarray(impedance)
+        self.Zc = Zc
+        self.n_solves = n_solves
+        self.converged = converged
+        self._spline = CubicSpline(self.frequencies,
+                                   _reflection(self.impedance / Zc))
+
+    def __repr__(self):
+        return ("<tapas.adaptive.AdaptiveImpedance({} frequencies from {:g} to "
+                "{:g} Hz, {} solves)>".format(len(self.frequencies),
+                                              self.frequencies[0],
+                                              self.frequencies[-1],
+                                              self.n_solves))
+
+    def __call__(self, frequencies):
+        frequencies = np.asarray(frequencies)
+        if (np.min(frequencies) < self.frequencies[0]
+                or np.max(frequencies) > self.frequencies[-1]):
+            raise ValueError('The frequencies must be in the range [{:g}, {:g}]'
+                             .format(self.frequencies[0], self.frequencies[-1]))
+        return self.Zc * _impedance(self._spline(frequencies))
+
+    def _extrema(self, k, sign):
+        # the local extrema of |Z| on the grid, refined on the interpolant
+        modulus = sign*np.abs(self.impedance)
+        candidates = np.nonzero((modulus[1:-1] > modulus[:-2])
+                                & (modulus[1:-1] >= modulus[2:]))[0] + 1
+        freqs, values = list(), list()
+        for index in candidates[:k]:
+            fine = np.linspace(self.frequencies[index - 1],
+                               self.frequencies[index + 1], 201)
+            fine_values = self(fine)
+            best = np.argmax(sign*np.abs(fine_values))
+            freqs.append(fine[best])
+            values.append(fine_values[best])
+        return np.array(freqs), np.array(values)
+
+    def resonance_peaks(self, k=5):
+        """
+        The first maxima of the modulus of the impedance.
+
+        Parameters
+        ----------
+        k : int, optional
+            The number of peaks. Default is 5.
+
+        Returns
+        -------
+        frequencies : array of float
+        impedance : array of complex
+            The impedance at the peaks.
+        """
+        return self._extrema(k, 1)
+
+    def antiresonance_peaks(self, k=5):
+        """
+        The first minima of the modulus of the impedance.
+
+        Parameters
+        ----------
+        k : int, optional
+            The number of antiresonances. Default is 5.
+
+        Returns
+        -------
+        frequencies : array of float
+        impedance : array of complex
+            The impedance at the antiresonances.
+        """
+        return self._extrema(k, -1)
+
+
+def adaptive_impedance(f_solver, fmin=None, fmax=None, rtol=1e-3, atol=1e-3,
+                       n_initial=64, max_phase_step=np.pi/2, min_step=1e-3,
+                       max_solves=None):
+    """
+    Compute the impedance on a frequency axis refined around its features.
+
+    The mesh of the solver is kept: it must be adapted to `fmax`, i.e. the
+    solver must be created with frequencies up to at least `fmax`.
+
+    Parameters
+    ----------
+    f_solver : :py:class:`FrequentialSolver<openwind.frequential.frequential_solver.FrequentialSolver>`
+        The solver of the instrument. It is given back with its frequency
+        axis, matrices and impedance: the adaptive ones are only in the
+        result.
+    fmin, fmax : float, optional
+        The frequency range. Default is None (the range of the frequency axis
+        of the solver).
+    rtol, atol : float, optional
+        The relative and absolute (relatively to the characteristic
+        impedance) tolerances on the interpolated impedance. Default is 1e-3.
+    n_initial : int, optional
+        The number of intervals of the initial uniform axis. Default is 64.
+    max_phase_step : float, optional
+        The maximal rotation of the reflection coefficient between two
+        successive frequencies, in rad. Default is pi/2.
+    min_step : float, optional
+        The smallest interval bisected, in Hz. Default is 1e-3.
+    max_solves : int, optional
+        The maximal number of frequencies solved. Default is None (no limit).
+
+    Returns
+    -------
+    :py:class:`AdaptiveImpedance`
+    """
+    if f_solver.compute_method == 'modal':
+        raise ValueError("The modal method evaluates any frequency directly, "
+                         "use FrequentialSolver.evaluate_impedance_at().")
+    fmin = np.min(f_solver.frequencies) if fmin is None else fmin
+    fmax = np.max(f_solver.frequencies) if fmax is None else fmax
+    if fmax > np.max(f_solver.frequencies):
+        warnings.warn('The mesh of the solver is adapted to {:g} Hz < fmax = '
+                      '{:g} Hz.'.format(np.max(f_solver.frequencies), fmax))
+    Zc = f_solver.get_ZC_adim()
+    original = (f_solver.frequencies, getattr(f_solver, 'impedance', None))
+    try:
+        return _refine(f_solver, Zc, fmin, fmax, rtol, atol, n_initial,
+                       max_phase_step, min_step, max_solves)
+    finally:
+        f_solver.frequencies, impedance = original
+        f_solver._construct_matrices_pipes()
+        f_solver._construct_matrices_connectors()
+        f_solver.impedance = impedance
+
+
+def _refine(f_solver, Zc, fmin, fmax, rtol, atol, n_initial, max_phase_step,
+            min_step, max_solves):
+    """The refinement loop of :py:func:`adaptive_impedance`."""
+
+    def solve(frequencies):
+        # the mesh is kept: only the frequency dependent matrices are rebuilt
+        f_solver.frequencies = f_solver._check_frequencies(frequencies,
+                                                           f_solver.compute_method)
+        f_solver._construct_matrices_pipes()
+        f_solver._construct_matrices_connectors()
+        f_solver.solve()
+        return f_solver.impedance / Zc
+
+    freqs = np.linspace(fmin, fmax, n_initial + 1)
+    values = solve(freqs)
+    n_solves = len(freqs)
+    # the intervals to check, given by their left bounds
+    pending = np.ones(n_initial, dtype=bool)
+    converged = True
+    while np.any(pending):
+        left = np.nonzero(pending)[0]
+        width = freqs[left + 1] - freqs[left]
+        left = left[width > 2*min_step]
+        if len(left) < np.count_nonzero(pending):
+            converged = False
+        if max_solves is not None and n_solves + len(left) > max_solves:
+            left = left[:max(0, max_solves - n_solves)]
+            converged = False
+        if len(left) == 0:
+            break
+        middles = 0.5*(freqs[left] + freqs[left + 1])
+        predicted = _impedance(CubicSpline(freqs, _reflection(values))(middles))
+        new_values = solve(middles)
+        n_solves += len(middles)
+
+        error = np.abs(predicted - new_values)
+        phase_step = np.abs(np.angle(_reflection(values[left + 1])
+                                     / _reflection(values[left])))
+        # the interpolation error decreases at least as h**3: once bisected,
+        # the halves of an interval up to 8 times out of tolerance are kept
+        tolerance = atol + rtol*np.abs(new_values)
+        refine = (error > 8*tolerance) | (phase_step > max_phase_step)
+
+        # insert the middles and flag their two halves
+        order = np.argsort(np.concatenate([freqs, middles]), kind='stable')
+        freqs = np.concatenate([freqs, middles])[order]
+        values = np.concatenate([values, new_values])[order]
+        is_new = np.zeros(len(freqs), dtype=bool)
+        is_new[np.nonzero(order >= len(order) - len(middles))[0]] = True
+        position = np.nonzero(is_new)[0]
+        pending = np.zeros(len(freqs) - 1, dtype=bool)
+        pending[position[refine] - 1] = True
+        pending[position[refine]] = True
+        if max_solves is not None and n_solves >= max_solves and np.any(pending):
+            converged = False
+            break
+
+    return AdaptiveImpedance(freqs, values * Zc, Zc, n_solves, converged)
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming export of simulated signals to audio files.
+
+Contrary to :py:func:`openwind.temporal.utils.export_mono`, which needs the
+whole signal in memory, the :py:class:`AudioSink` receives the signal chunk by
+chunk (typically from the callback of
+:py:meth:`TemporalSolver.run_simulation()\
+<openwind.temporal.temporal_solver.TemporalSolver.run_simulation>`), resamples
+it to an audio rate, normalizes it and writes it incrementally in a WAV file.
+The memory used does not depend on the duration of the simulation.
+"""
+
+import struct
+
+import numpy as np
+from scipy.signal import butter, sosfilt, sosfilt_zi
+
+from .streaming import find_channel
+from .resampling import PolyphaseResampler
+
+
+SAMPLE_FORMATS = {'int16': (1, 16), 'int24': (1, 24), 'float32': (3, 32)}
+"""dict: The available sample formats with their WAV format tag and width."""
+
+
+class WavWriter:
+    """
+    Write a WAV file incrementally.
+
+    The header is written with empty sizes when the file is opened and is
+    completed by :py:meth:`close`.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the file.
+    samplerate : int
+        The sample rate in Hz.
+    sample_format : {'int16', 'int24', 'float32'}, optional
+        The format of the samples. Default is 'int16'.
+    """
+
+    def __init__(self, filename, samplerate, sample_format='int16'):
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError("Unknown sample format '{}', chose between {}"
+                             .format(sample_format, list(SAMPLE_FORMATS)))
+        self.filename = filename
+        self.samplerate = int(round(samplerate))
+        self.sample_format = sample_format
+        self.n_frames = 0
+        self._format_tag, self._bits = SAMPLE_FORMATS[sample_format]
+        self._file = open(filename, 'wb')
+        self._write_header()
+
+    def __repr__(self):
+        return ("<tapas.audio.WavWriter('{}', samplerate={}, sample_format='{}',"
+                " n_frames={})>".format(self.filename, self.samplerate,
+                                        self.sample_format, self.n_frames))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write_header(self):
+        block_align = self._bits // 8
+        is_float = self._format_tag == 3
+        fmt_size = 18 if is_float else 16
+        data_size = self.n_frames * block_align
+        # the 'fact' chunk is required for non-PCM data
+        fact_size = 12 if is_float else 0
+        # chunks must have an even size: a pad byte follows odd data
+        riff_size = 4 + (8 + fmt_size) + fact_size + (8 + data_size + data_size % 2)
+        header = b'RIFF' + struct.pack('<I', riff_size) + b'WAVE'
+        header += b'fmt ' + struct.pack('<IHHIIHH', fmt_size, self._format_tag,
+                                        1, self.samplerate,
+                                        self.samplerate*block_align,
+                                        block_align, self._bits)
+        if is_float:
+            header += struct.pack('<H', 0)
+            header += b'fact' + struct.pack('<II', 4, self.n_frames)
+        header += b'data' + struct.pack('<I', data_size)
+        self._file.write(header)
+
+    def write(self, samples):
+        """
+        Append samples to the file.
+
+        Parameters
+        ----------
+        samples : array of float
+            The samples, between -1 and 1 (integer formats are clipped).
+        """
+        samples = np.asarray(samples, dtype=float)
+        if self.sample_format == 'float32':
+            data = samples.astype('<f4')
+        elif self.sample_format == 'int16':
+            data = np.round(np.clip(samples, -1, 1) * 32767).astype('<i2')
+        else:
+            values = np.round(np.clip(samples, -1, 1) * 8388607).astype('<i4')
+            data = values.view(np.uint8).reshape(-1, 4)[:, :3]
+        self._file.write(data.tobytes())
+        self.n_frames += len(samples)
+
+    def close(self):
+        """Complete the header with the final sizes and close the file."""
+        if self._file.closed:
+            return
+        if (self.n_frames * self._bits // 8) % 2:
+            self._file.write(b'\x00')
+        self._file.seek(0)
+        self._write_header()
+        self._file.close()
+
+
+class LinearResampler:
+    """
+    Change the sample rate of a signal given chunk by chunk.
+
+    It is the streaming version of :py:func:`openwind.temporal.utils.resample`:
+    a Butterworth anti-aliasing filter followed by a linear interpolation. The
+    states of the filter and of the interpolation are kept between the chunks.
+
+    Parameters
+    ----------
+    input_rate, output_rate : float
+        The sample rates of the input and output signals, in Hz.
+    cutoff_freq : float, optional
+        The cutoff frequency of the anti-aliasing filter. Default is 90% of
+        the output Nyquist frequency.
+    order : int, optional
+        The order of the filter. Default is 5.
+    """
+
+    def __init__(self, input_rate, output_rate, cutoff_freq=None, order=5):
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self._step = input_rate / output_rate
+        if cutoff_freq is None:
+            cutoff_freq = 0.45*output_rate
+        normal_cutoff = cutoff_freq / (0.5*input_rate)
+        if normal_cutoff < 1:
+            self._sos = butter(order, normal_cutoff, btype='low', output='sos')
+            self._zi = np.zeros_like(sosfilt_zi(self._sos))
+        else:
+            # Can't antialias beyond the Nyquist frequency!
+            self._sos = None
+        self._last = 0.0
+        self._pos = 0.0
+
+    def process(self, chunk):
+        """
+        Resample a new chunk of the signal.
+
+        Parameters
+        ----------
+        chunk : array of float
+            The next input samples.
+
+        Returns
+        -------
+        array of float
+            The output samples which can be computed from the input received.
+        """
+        chunk = np.asarray(chunk, dtype=float)
+        if len(chunk) == 0:
+            return np.zeros(0)
+        if self._sos is not None:
+            chunk, self._zi = sosfilt(self._sos, chunk, zi=self._zi)
+        # position -1 is the last sample of the previous chunk
+        extended = np.concatenate(([self._last], chunk))
+        n_out = int(np.floor((len(chunk) - 1 - self._pos) / self._step)) + 1
+        positions = self._pos + self._step*np.arange(max(n_out, 0))
+        out = np.interp(positions + 1, np.arange(len(extended)), extended)
+        self._pos += self._step*max(n_out, 0) - len(chunk)
+        self._last = chunk[-1]
+        return out
+
+    def flush(self):
+        """
+        Returns
+        -------
+        array of float
+            The output samples still pending (none for this resampler).
+        """
+        return np.zeros(0)
+
+
+class PeakLimiter:
+    """
+    Running peak normalization with a look-ahead limiter.
+
+    The gain is `target / peak` where `peak` is the highest absolute value
+    met so far, including the `lookahead` next samples. The output is delayed
+    by `lookahead` samples, which allows to decrease the gain smoothly (linear
+    ramp over the look-ahead window) before a louder peak instead of clipping
+    it. The output never exceeds `target`.
+
+    Parameters
+    ----------
+    lookahead : int
+        The length of the look-ahead window, in samples.
+    target : float, optional
+        The highest absolute value of the output. Default is 0.98 (-0.2 dBFS).
+    reference_peak : float, optional
+        Initial value of the running peak. Without it, the first samples are
+        amplified up to the target level, whatever their amplitude with
+        respect to the rest of the signal. Giving the expected peak of the
+        signal (from a previous or shorter simulation) preserves the attack.
+    max_gain : float, optional
+        The highest gain applied. Default is 1e6.
+    """
+
+    def __init__(self, lookahead, target=0.98, reference_peak=None, max_gain=1e6):
+        self.lookahead = int(lookahead)
+        self.target = target
+        self.max_gain = max_gain
+        self.peak = reference_peak if reference_peak else 0.0
+        initial_gain = self._required_gain(np.array([self.peak]))[0]
+        self._delay = np.zeros(self.lookahead)
+        self._gains = np.full(self.lookahead, initial_gain)
+
+    def _required_gain(self, peaks):
+        return self.target / np.maximum(peaks, self.target/self.max_gain)
+
+    def process(self, chunk):
+        """
+        Normalize a new chunk of the signal.
+
+        Parameters
+        ----------
+        chunk : array of float
+            The next input samples.
+
+        Returns
+        -------
+        array of float
+            The output samples, delayed by `lookahead` samples (the same
+            number of samples as the chunk).
+        """
+        chunk = np.asarray(chunk, dtype=float)
+        n = len(chunk)
+        if n == 0:
+            return np.zeros(0)
+        peaks = np.maximum.accumulate(np.maximum(np.abs(chunk), self.peak))
+        self.peak = peaks[-1]
+        L = self.lookahead
+        gains = np.concatenate((self._gains, self._required_gain(peaks)))
+        samples = np.concatenate((self._delay, chunk))
+        if L == 0:
+            applied = gains
+        else:
+            # mean of the required gains over the look-ahead window
+            cumul = np.concatenate(([0], np.cumsum(gains)))
+            j = np.arange(n)
+            applied = (cumul[j + L + 1] - cumul[j + 1]) / L
+            # the gains never increase: the mean is below the gain of the
+            # sample, up to the rounding errors of the cumulative sum
+            applied = np.minimum(applied, gains[:n])
+        self._delay = samples[n:]
+        self._gains = gains[n:]
+        return samples[:n] * applied
+
+    def flush(self):
+        """
+        Returns
+        -------
+        array of float
+            The samples still in the look-ahead window.
+        """
+        return self.process(np.zeros(self.lookahead))
+
+
+RESAMPLERS = {'polyphase': PolyphaseResampler, 'linear': LinearResampler}
+"""dict: The resamplers available in :py:class:`AudioSink`."""
+
+
+class AudioSink:
+    """
+    Write a simulated signal to a WAV file, chunk by chunk.
+
+    The sink resamples the signal to `samplerate` (with a
+    :py:class:`PolyphaseResampler<tapas.resampling.PolyphaseResampler>` by
+    default), normalizes it with a
+    :py:class:`PeakLimiter` and appends it to a :py:class:`WavWriter`. It can
+    be fed directly with :py:meth:`write`, or used as the callback of a
+    temporal simulation:
+
+    .. code-block:: python
+
+        with AudioSink('flute.wav', samplerate=48000, sample_format='int24') as sink:
+            t_solver.run_simulation(15, callback=sink.callback)
+
+    Parameters
+    ----------
+    filename : str
+        The name of the WAV file.
+    samplerate : int, optional
+        The sample rate of the file, in Hz. Default is 44100.
+    sample_format : {'int16', 'int24', 'float32'}, optional
+        The format of the samples. Default is 'int16'.
+    input_rate : float, optional
+        The sample rate of the input signal, in Hz. When the sink is used as a
+        callback, it is deduced from the time step of the solver.
+    channel : str, optional
+        The recorded quantity written by :py:meth:`callback`. Default is
+        'bell_radiation_pressure'.
+    lookahead : float, optional
+        The duration of the look-ahead window of the limiter, in seconds.
+        Default is 5 ms.
+    target_level : float, optional
+        The highest absolute value of the output. Default is 0.98.
+    reference_peak : float, optional
+        The expected peak of the input signal, see :py:class:`PeakLimiter`.
+    chunk_size : int, optional
+        The number of input samples accumulated by :py:meth:`callback` before
+        being processed. Default is 4096.
+    resampler : {'polyphase', 'linear'}, optional
+        The resampling method: the windowed-sinc
+        :py:class:`PolyphaseResampler<tapas.resampling.PolyphaseResampler>` or
+        the cheaper :py:class:`LinearResampler`. Default is 'polyphase'.
+    """
+
+    def __init__(self, filename, samplerate=44100, sample_format='int16',
+                 input_rate=None, channel='bell_radiation_pressure',
+                 lookahead=5e-3, target_level=0.98, reference_peak=None,
+                 chunk_size=4096, resampler='polyphase'):
+        if resampler not in RESAMPLERS:
+            raise ValueError("Unknown resampler '{}', chose between {}"
+                             .format(resampler, list(RESAMPLERS)))
+        self.resampler_type = resampler
+        self.samplerate = samplerate
+        self.channel = channel
+        self.writer = WavWriter(filename, samplerate, sample_format)
+        self.limiter = PeakLimiter(int(round(lookahead*samplerate)),
+                                   target=target_level,
+                                   reference_peak=reference_peak)
+        self.resampler = None
+        self.input_rate = None
+        if input_rate:
+            self._set_input_rate(input_rate)
+        self._chunk = np.zeros(int(chunk_size))
+        self._n_chunk = 0
+        self._component = None
+
+    def __repr__(self):
+        return ("<tapas.audio.AudioSink('{}', samplerate={}, input_rate={}, "
+                "duration={:.3f}s)>".format(self.writer.filename,
+                                            self.samplerate, self.input_rate,
+                                            self.get_duration()))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _set_input_rate(self, input_rate):
+        self.input_rate = input_rate
+        self.resampler = RESAMPLERS[self.resampler_type](input_rate,
+                                                         self.samplerate)
+
+    def get_duration(self):
+        """
+        Returns
+        -------
+        float
+            The duration already written in the file, in seconds.
+        """
+        return self.writer.n_frames / self.samplerate
+
+    def write(self, samples):
+        """
+        Process and write new samples of the signal.
+
+        Parameters
+        ----------
+        samples : array of float
+            The next input samples, at `input_rate`.
+        """
+        if self.resampler is None:
+            raise ValueError('The input rate must be given before writing.')
+        out = self.limiter.process(self.resampler.process(samples))
+        self.writer.write(out)
+
+    def callback(self, t_solver):
+        """
+        Record the channel after each time step of a simulation.
+
+        It has the same use as :py:meth:`RecordingDevice.callback()\
+        <openwind.temporal.recording_device.RecordingDevice.callback>`.
+
+        Parameters
+        ----------
+        t_solver : :py:class:`TemporalSolver<openwind.temporal.temporal_solver.TemporalSolver>`
+            The solver running the simulation.
+        """
+        if self._component is None:
+            self._component, self._key = find_channel(t_solver, self.channel)
+            if self.resampler is None:
+                dt = t_solver.get_dt() * t_solver.scaling.get_time()
+                self._set_input_rate(1/dt)
+        self._chunk[self._n_chunk] = self._component.get_values_to_record()[self._key]
+        self._n_chunk += 1
+        if self._n_chunk == len(self._chunk):
+            self.write(self._chunk)
+            self._n_chunk = 0
+
+    def close(self):
+        """Write the pending samples and close the file."""
+        if self.resampler is not None:
+            if self._n_chunk > 0:
+                self.write(self._chunk[:self._n_chunk])
+                self._n_chunk = 0
+            self.writer.write(self.limiter.process(self.resampler.flush()))
+            self.writer.write(self.limiter.flush())
+        self.writer.close()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Temporal simulation with a time step locked to an audio sample rate.
+
+By default, the time step of a :py:class:`TemporalSolver\
+<openwind.temporal.temporal_solver.TemporalSolver>` follows from the mesh
+through the CFL condition, and its output must be resampled before being
+played. The :py:class:`AudioRateTemporalSolver` chooses instead
+`dt = 1/(samplerate*oversampling)`, so that one audio sample is exactly
+`oversampling` time steps.
+"""
+
+import time
+
+import numpy as np
+from openwind import TemporalSolver
+
+
+DEFAULT_SHORTEST_LBD = 0.17
+"""float: The default `shortestLbd` of :py:class:`Mesh<openwind.discretization.mesh.Mesh>`."""
+
+
+class AudioRateTemporalSolver(TemporalSolver):
+    """
+    Temporal solver whose time step is an integer fraction of an audio rate.
+
+    With `oversampling='auto'`, the oversampling factor is the smallest
+    integer `K` such that `dt = 1/(samplerate*K)` respects the CFL condition
+    `dt <= cfl_alpha*dt_max`: it is the largest time step hitting the audio
+    rate. With a fixed `K` too small for the CFL condition of the mesh, the
+    mesh of the pipes is coarsened (larger `shortestLbd`, or larger `l_ele`
+    if given) until the condition is satisfied.
+
+    Contrary to the parent class, :py:meth:`run_simulation` never changes the
+    time step: the duration is rounded to an integer number of audio samples.
+    The output of the solver, recorded every `oversampling` steps, is then
+    directly at the audio rate.
+
+    .. code-block:: python
+
+        t_solver = AudioRateTemporalSolver(instru_phy, samplerate=48000,
+                                           oversampling='auto')
+        print(t_solver.cost_per_sample())
+
+    Parameters
+    ----------
+    instru_physics : :py:class:`InstrumentPhysics<openwind.continuous.instrument_physics.InstrumentPhysics>`
+        Description of the instrument.
+    samplerate : float, optional
+        The audio sample rate, in Hz. Default is 44100.
+    oversampling : int or 'auto', optional
+        The number of time steps per audio sample. Default is 'auto'.
+    cfl_alpha : float, optional
+        Coefficient used to guarantee the respect of the CFL condition, see
+        :py:class:`TemporalSolver\
+        <openwind.temporal.temporal_solver.TemporalSolver>`. Default is 0.9.
+    max_coarsening : int, optional
+        The maximal number of times the mesh is rebuilt to satisfy the CFL
+        condition with a fixed oversampling. Default is 10.
+    **kwargs : keyword arguments
+        The other options of :py:class:`TemporalSolver\
+        <openwind.temporal.temporal_solver.TemporalSolver>` (scheme and
+        discretization parameters).
+
+    Attributes
+    ----------
+    oversampling : int
+        The number of time steps per audio sample.
+    wall_time : float
+        The computation time of the simulations run, in seconds.
+    n_steps_run : int
+        The number of time steps computed by the simulations run.
+    """
+
+    def __init__(self, instru_physics, samplerate=44100, oversampling='auto',
+                 cfl_alpha=0.9, max_coarsening=10, **kwargs):
+        if samplerate <= 0:
+            raise ValueError('The sample rate must be positive.')
+        if oversampling != 'auto' and (int(oversampling) != oversampling
+                                       or oversampling < 1):
+            raise ValueError("The oversampling must be a positive integer or "
+                             "'auto', not {}".format(oversampling))
+        self.samplerate = samplerate
+        self.cfl_alpha = cfl_alpha
+        self._solver_kwargs = kwargs
+        super().__init__(instru_physics, cfl_alpha=cfl_alpha, **kwargs)
+
+        if oversampling == 'auto':
+            # small tolerance: a bound hit exactly must not add one step
+            K = int(np.ceil(1/(samplerate*self.get_cfl_dt()) - 1e-9))
+        else:
+            K = int(oversampling)
+            for _ in range(max_coarsening):
+                ratio = 1/(samplerate*K) / self.get_cfl_dt()
+                if ratio <= 1:
+                    break
+                self._coarsen_mesh(1.02*ratio)
+            if 1/(samplerate*K) > self.get_cfl_dt():
+                raise ValueError('Impossible to satisfy the CFL condition with '
+                                 'an oversampling of {} in {} iterations, the '
+                                 'time step is limited by {}.'
+                                 .format(K, max_coarsening,
+                                         self.cfl_of_components[0][0]))
+        self.oversampling = max(K, 1)
+        self._set_dt(1/(samplerate*self.oversampling) / self.scaling.get_time())
+        self.wall_time = 0.0
+        self.n_steps_run = 0
+
+    def __repr__(self):
+        return ("<tapas.audio_rate.AudioRateTemporalSolver(samplerate={}, "
+                "oversampling={}, dt={:.3e}s, n_dof={})>"
+                .format(self.samplerate, self.oversampling,
+                        1/(self.samplerate*self.oversampling), self.get_n_dof()))
+
+    def get_cfl_dt(self):
+        """
+        Returns
+        -------
+        float
+            The largest time step allowed by the CFL condition of the mesh,
+            times `cfl_alpha` (in s).
+        """
+        _, max_dt = self.cfl_of_components[0]
+        return self.cfl_alpha * max_dt * self.scaling.get_time()
+
+    def _coarsen_mesh(self, factor):
+        label = self.cfl_of_components[0][0]
+        if label not in [t_pipe.label for t_pipe in self.t_pipes]:
+            raise ValueError('The time step is limited by {}, it can not be '
+                             'increased by coarsening the mesh.'.format(label))
+        kwargs = self._solver_kwargs
+        l_ele = kwargs.get('l_ele')
+        if isinstance(l_ele, (int, float)):
+            kwargs['l_ele'] = l_ele * factor
+        elif l_ele is None:
+            kwargs['shortestLbd'] = factor * kwargs.get('shortestLbd',
+                                                        DEFAULT_SHORTEST_LBD)
+        else:
+            raise ValueError('The mesh given element by element (l_ele={}) can'
+                             ' not be coarsened automatically.'.format(l_ele))
+        TemporalSolver.__init__(self, self.instru_physics,
+                                cfl_alpha=self.cfl_alpha, **kwargs)
+
+    def get_n_dof(self):
+        """
+        Returns
+        -------
+        int
+            The number of degrees of freedom (pressure and flow) of the pipes.
+        """
+        return sum(t_pipe.nH1 + t_pipe.nL2 for t_pipe in self.t_pipes)
+
+    def run_simulation(self, duration, callback=None,
+                       enable_tracker_display=True, energy_check=False):
+        """
+        Run the simulation for a given duration, without changing dt.
+
+        Parameters
+        ----------
+        duration : float
+            Duration of the simulation, rounded to an integer number of audio
+            samples.
+        callback : callable, optional
+            A function to call after each step, taking this solver as an
+            argument. To obtain the audio signal, record one step over
+            :py:attr:`oversampling` (when `t_solver.cur_step % oversampling`
+            equals `oversampling - 1`).
+        enable_tracker_display : bool, optional
+            Whether to print the progression. Default is True.
+        energy_check : bool, optional
+            Whether to check that the scheme is energy-consistent. Default is
+            False.
+        """
+        n_samples = int(round(duration * self.samplerate))
+        self.run_simulation_steps(n_samples*self.oversampling, callback,
+                                  enable_tracker_display, energy_check)
+
+    def run_simulation_steps(self, n_steps, *args, **kwargs):
+        tic = time.perf_counter()
+        super().run_simulation_steps(n_steps, *args, **kwargs)
+        self.wall_time += time.perf_counter() - tic
+        self.n_steps_run += n_steps
+
+    run_simulation_steps.__doc__ = TemporalSolver.run_simulation_steps.__doc__
+
+    def cost_per_sample(self):
+        """
+        The computational cost of one audio sample.
+
+        Returns
+        -------
+        dict
+            - 'steps': the number of time steps per audio sample
+            - 'dof_updates': the number of degrees of freedom updated per \
+            audio sample
+            - 'seconds': the measured computation time per audio sample \
+            (NaN before any simulation)
+            - 'real_time_factor': the simulated duration over the computation \
+            time (NaN before any simulation)
+        """
+        if self.n_steps_run == 0:
+            seconds = np.nan
+        else:
+            seconds = self.wall_time * self.oversampling / self.n_steps_run
+        return {'steps': self.oversampling,
+                'dof_updates': self.oversampling * self.get_n_dof(),
+                'seconds': seconds,
+                'real_time_factor': 1/(seconds*self.samplerate)}
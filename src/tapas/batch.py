@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Headless batch rendering of instruments.
+
+For each geometry file, :py:func:`render_instrument` runs the pipeline of the
+notebook without any plot: input impedance computed and written in a text
+file, then a temporal simulation written in a WAV file by an
+:py:class:`AudioSink<tapas.audio.AudioSink>`. Openwind is imported through
+:py:func:`tapas.lazy.import_openwind`, so matplotlib is not even loaded. :py:func:`run_batch` distributes
+the files over a process pool; the command line entry point is
+:py:func:`main`:
+
+.. code-block:: shell
+
+    python -m tapas candidates/*.csv -o renders -j 8 --duration 2
+
+Each stage is timed, and the timings of all the files are gathered in a
+`summary.json` file in the output directory.
+"""
+
+import argparse
+import collections
+import contextlib
+import glob
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+
+STAGES = ['load', 'impedance', 'write_impedance', 'discretize', 'simulate']
+"""list of str: The timed stages of :py:func:`render_instrument`."""
+
+
+def _headless():
+    # The plots are never shown: matplotlib is only imported if openwind
+    # really uses it, and then with a non-interactive backend.
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+
+
+class _StageTimer:
+    """Measure the duration of the successive stages of a job."""
+
+    def __init__(self):
+        self.timings = dict()
+
+    @contextlib.contextmanager
+    def __call__(self, stage):
+        tic = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = time.perf_counter() - tic
+
+
+def render_instrument(main_bore, output_dir, holes_valves=list(),
+                      fingering_chart=list(), note=None, player='TUTORIAL_REED',
+                      temperature=25, frequencies=np.arange(50, 2000, 1),
+                      duration=1.0, samplerate=44100, sample_format='int16',
+                      losses=False, impedance=True, audio=True, cache_dir=None,
+                      verbose=False, name=None):
+    """
+    Compute the impedance and the sound of one instrument.
+
+    The outputs are named after the geometry file: `<name>_impedance.txt` and
+    `<name>.wav`, unless another `name` is given. The exceptions are caught, so that a failing instrument does
+    not stop a batch.
+
+    Parameters
+    ----------
+    main_bore : str
+        The file describing the main bore.
+    output_dir : str
+        The directory in which the outputs are written.
+    holes_valves, fingering_chart : str or list, optional
+        The holes and the fingering chart, see :py:class:`InstrumentGeometry\
+        <openwind.technical.instrument_geometry.InstrumentGeometry>`.
+    note : str, optional
+        The fingering used. Default is None (all holes open).
+    player : str, optional
+        The name of the default :py:class:`Player\
+        <openwind.technical.player.Player>` of the simulation. Default is
+        'TUTORIAL_REED'.
+    temperature : float, optional
+        The temperature in °C. Default is 25.
+    frequencies : array of float, optional
+        The frequency axis of the impedance. Default is 50 to 2000 Hz by 1 Hz.
+    duration : float, optional
+        The simulated duration, in seconds. Default is 1.
+    samplerate : int, optional
+        The sample rate of the WAV file. Default is 44100.
+    sample_format : {'int16', 'int24', 'float32'}, optional
+        The format of the WAV file. Default is 'int16'.
+    losses : {False, 'diffrepr'}, optional
+        The losses model of the simulation (the impedance always includes the
+        viscothermal losses). Default is False.
+    impedance, audio : bool, optional
+        Whether to compute the impedance and the sound. Default is True.
+    cache_dir : str, optional
+        The directory of the :py:class:`InstrumentCache\
+        <tapas.instrument_cache.InstrumentCache>`. Default is None: the
+        instruments are assembled at every run.
+    verbose : bool, optional
+        If False, the messages printed by openwind are discarded. Default is
+        False.
+    name : str, optional
+        The name of the outputs, which can include subdirectories of
+        `output_dir`. Default is None: the name of the geometry file.
+
+    Returns
+    -------
+    dict
+        The name of the geometry file ('geometry'), 'status' ('ok' or
+        'failed'), the duration of each stage in seconds ('timings'), the
+        files written ('outputs') and the traceback of the error if any
+        ('error').
+    """
+    _headless()
+    result = {'geometry': main_bore, 'status': 'ok', 'timings': dict(),
+              'outputs': list(), 'error': None}
+    if name is None:
+        name = os.path.splitext(os.path.basename(main_bore))[0]
+    timer = _StageTimer()
+    output = sys.stdout if verbose else open(os.devnull, 'w')
+    tic = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(os.path.join(output_dir, name)),
+                    exist_ok=True)
+        with contextlib.redirect_stdout(output):
+            with timer('load'):
+                from .lazy import import_openwind
+                openwind = import_openwind()
+                from .instrument_cache import InstrumentCache
+                from .audio import AudioSink
+                cache = InstrumentCache(cache_dir) if cache_dir else None
+
+            geometry = dict(main_bore=main_bore, holes_valves=holes_valves,
+                            fingering_chart=fingering_chart)
+            if impedance:
+                with timer('impedance'):
+                    if cache is None:
+                        instru_geom = openwind.InstrumentGeometry(**geometry)
+                        instru_phy = openwind.InstrumentPhysics(
+                            instru_geom, temperature, openwind.Player(), True)
+                        f_solver = openwind.FrequentialSolver(instru_phy,
+                                                              frequencies,
+                                                              note=note)
+                    else:
+                        f_solver = cache.frequential_solver(
+                            frequencies, temperature=temperature, note=note,
+                            **geometry)
+                    f_solver.solve()
+                with timer('write_impedance'):
+                    filename = os.path.join(output_dir, name + '_impedance.txt')
+                    f_solver.write_impedance(filename)
+                    result['outputs'].append(filename)
+
+            if audio:
+                with timer('discretize'):
+                    my_player = openwind.Player(player)
+                    if note is not None:
+                        my_player.update_score([(note, 0)])
+                    if cache is None:
+                        instru_geom = openwind.InstrumentGeometry(**geometry)
+                        instru_phy = openwind.InstrumentPhysics(
+                            instru_geom, temperature, my_player, losses)
+                        t_solver = openwind.TemporalSolver(instru_phy)
+                    else:
+                        t_solver = cache.temporal_solver(
+                            player=my_player, temperature=temperature,
+                            losses=losses, **geometry)
+                with timer('simulate'):
+                    filename = os.path.join(output_dir, name + '.wav')
+                    with AudioSink(filename, samplerate=samplerate,
+                                   sample_format=sample_format) as sink:
+                        t_solver.run_simulation(duration, callback=sink.callback,
+                                                enable_tracker_display=False)
+                    result['outputs'].append(filename)
+    except Exception:
+        result['status'] = 'failed'
+        result['error'] = traceback.format_exc()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    result['timings'] = timer.timings
+    result['timings']['total'] = time.perf_counter() - tic
+    return result
+
+
+def output_names(geometries):
+    """
+    The names of the outputs of some geometry files, unique in a batch.
+
+    They mirror the paths of the files relative to their common directory:
+    `a/trumpet.txt` and `b/trumpet.txt` give `a/trumpet` and `b/trumpet`. A
+    file given several times gets the suffixes `-2`, `-3`...
+
+    Parameters
+    ----------
+    geometries : list of str
+        The files describing the main bores.
+
+    Returns
+    -------
+    list of str
+    """
+    paths = [os.path.splitext(os.path.abspath(geometry))[0]
+             for geometry in geometries]
+    if not paths:
+        return list()
+    root = os.path.commonpath([os.path.dirname(path) for path in paths])
+    names = list()
+    counts = collections.Counter()
+    for path in paths:
+        name = os.path.relpath(path, root)
+        counts[name] += 1
+        if counts[name] > 1:
+            name = '{}-{}'.format(name, counts[name])
+        names.append(name)
+    return names
+
+
+def _failed(geometry, error):
+    # the result of an instrument whose rendering did not return
+    return {'geometry': geometry, 'status': 'failed',
+            'timings': {'total': 0.}, 'outputs': list(), 'error': error}
+
+
+def run_batch(geometries, output_dir, jobs=None, progress=True, **kwargs):
+    """
+    Render many instruments with a process pool.
+
+    The outputs are named by :py:func:`output_names`. If a worker process
+    terminates abruptly (out of memory, crash of a library), the instruments
+    it was rendering, and those still waiting in the broken pool, are
+    reported as failed.
+
+    Parameters
+    ----------
+    geometries : list of str
+        The files describing the main bores.
+    output_dir : str
+        The directory in which the outputs are written. It is created if
+        needed.
+    jobs : int, optional
+        The number of worker processes. Default is None (the number of CPUs).
+        With `jobs=1` the instruments are rendered in the current process.
+    progress : bool, optional
+        Whether to print one line per instrument rendered. Default is True.
+    **kwargs : keyword arguments
+        The options of :py:func:`render_instrument`.
+
+    Returns
+    -------
+    list of dict
+        The results of :py:func:`render_instrument`, in the order of
+        `geometries`. They are also written in `output_dir/summary.json`.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    names = output_names(geometries)
+    results = dict()
+    tic = time.perf_counter()
+
+    def report(index, result):
+        results[index] = result
+        if progress:
+            print('[{}/{}] {} {} ({:.2f}s)'.format(len(results), len(geometries),
+                                                  result['status'],
+                                                  result['geometry'],
+                                                  result['timings']['total']),
+                  flush=True)
+
+    if jobs == 1:
+        for index, geometry in enumerate(geometries):
+            report(index, render_instrument(geometry, output_dir,
+                                            name=names[index], **kwargs))
+    else:
+        _headless()  # inherited by the workers
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(render_instrument, geometry, output_dir,
+                                       name=name, **kwargs): index
+                       for index, (geometry, name)
+                       in enumerate(zip(geometries, names))}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    result = _failed(geometries[index],
+                                     'The process pool was broken: a worker '
+                                     'process terminated abruptly.')
+                report(index, result)
+
+    results = [results[index] for index in range(len(geometries))]
+    summary = {'wall_time': time.perf_counter() - tic,
+               'options': {key: _describe(val) for key, val in kwargs.items()},
+               'stage_totals': {stage: sum(res['timings'].get(stage, 0)
+                                           for res in results)
+                                for stage in STAGES},
+               'results': results}
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as file:
+        json.dump(summary, file, indent=2)
+    return results
+
+
+def _describe(value):
+    # JSON description of an option, arrays being summarized by their bounds
+    # and the other objects by their repr
+    if isinstance(value, np.ndarray):
+        return {'min': float(value.min()), 'max': float(value.max()),
+                'size': int(value.size)}
+    try:
+        json.dumps(value)
+    except (TypeError, ValueError):
+        return repr(value)
+    return value
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m tapas',
+        description='Compute the input impedance and a simulated sound of '
+        'many instruments, without any plot.')
+    parser.add_argument('geometries', nargs='+',
+                        help='files describing the main bores (glob patterns '
+                        'are expanded)')
+    parser.add_argument('-o', '--output-dir', default='renders',
+                        help='directory of the outputs (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: number '
+                        'of CPUs)')
+    parser.add_argument('--holes', default=list(),
+                        help='file describing the holes and valves, shared '
+                        'by all the instruments')
+    parser.add_argument('--fingering-chart', default=list(),
+                        help='file of the fingering chart')
+    parser.add_argument('--note', default=None,
+                        help='fingering of the simulation and the impedance')
+    parser.add_argument('--player', default='TUTORIAL_REED',
+                        help='name of the player (default: %(default)s)')
+    parser.add_argument('--temperature', type=float, default=25,
+                        help='temperature in °C (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=1.0,
+                        help='simulated duration in s (default: %(default)s)')
+    parser.add_argument('--losses', default=False, const='diffrepr',
+                        action='store_const',
+                        help="use the 'diffrepr' losses in the simulation")
+    parser.add_argument('--fmin', type=float, default=50,
+                        help='lowest frequency of the impedance in Hz '
+                        '(default: %(default)s)')
+    parser.add_argument('--fmax', type=float, default=2000,
+                        help='highest frequency of the impedance in Hz '
+                        '(default: %(default)s)')
+    parser.add_argument('--fstep', type=float, default=1,
+                        help='frequency step of the impedance in Hz '
+                        '(default: %(default)s)')
+    parser.add_argument('--samplerate', type=int, default=44100,
+                        help='sample rate of the WAV files (default: '
+                        '%(default)s)')
+    parser.add_argument('--sample-format', default='int16',
+                        choices=['int16', 'int24', 'float32'],
+                        help='sample format of the WAV files (default: '
+                        '%(default)s)')
+    parser.add_argument('--no-impedance', dest='impedance',
+                        action='store_false', help='skip the impedance')
+    parser.add_argument('--no-audio', dest='audio', action='store_false',
+                        help='skip the simulation')
+    parser.add_argument('--cache-dir', default=None,
+                        help='directory of the instrument cache (default: no '
+                        'cache)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='print the messages of openwind')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Command line entry point, see `python -m tapas --help`.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        The arguments. Default is `sys.argv[1:]`.
+
+    Returns
+    -------
+    int
+        The exit status: 0 if all the instruments were rendered, 1 otherwise.
+    """
+    args = _parse_args(argv)
+    geometries = list()
+    for pattern in args.geometries:
+        geometries += sorted(glob.glob(pattern)) or [pattern]
+    results = run_batch(geometries, args.output_dir, jobs=args.jobs,
+                        holes_valves=args.holes,
+                        fingering_chart=args.fingering_chart, note=args.note,
+                        player=args.player, temperature=args.temperature,
+                        frequencies=np.arange(args.fmin, args.fmax, args.fstep),
+                        duration=args.duration, samplerate=args.samplerate,
+                        sample_format=args.sample_format, losses=args.losses,
+                        impedance=args.impedance, audio=args.audio,
+                        cache_dir=args.cache_dir, verbose=args.verbose)
+    failed = [res for res in results if res['status'] != 'ok']
+    for res in failed:
+        print('\n{} failed:\n{}'.format(res['geometry'], res['error']),
+              file=sys.stderr)
+    totals = {stage: sum(res['timings'].get(stage, 0) for res in results)
+              for stage in STAGES}
+    print('{} instruments rendered, {} failed. Time per stage: {}'
+          .format(len(results) - len(failed), len(failed),
+                  ', '.join('{} {:.2f}s'.format(stage, totals[stage])
+                            for stage in STAGES)))
+    return 1 if failed else 0
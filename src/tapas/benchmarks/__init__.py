@@ -0,0 +1,6 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Performance benchmarks of TaPAS, each runnable with
+`python -m tapas.benchmarks.<name>`.
+"""
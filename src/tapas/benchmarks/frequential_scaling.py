@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Strong scaling of the frequency-parallel solve.
+
+The impedance of an instrument is computed on a fine frequency axis with
+:py:class:`ParallelFrequentialSolver<tapas.parallel.ParallelFrequentialSolver>`
+for an increasing number of workers (powers of 2 up to `--max-jobs`), and
+compared bit by bit to the serial solve of openwind:
+
+.. code-block:: shell
+
+    python -m tapas.benchmarks.frequential_scaling Oboe_instrument.txt \\
+        --holes Oboe_holes.txt --fmin 20 --fmax 2000 --fstep 0.2 --max-jobs 32
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m tapas.benchmarks.frequential_scaling',
+        description=__doc__.split('\n\n')[0])
+    parser.add_argument('geometry', nargs='?', default='simplified-trumpet.csv',
+                        help='file describing the main bore (default: '
+                        '%(default)s)')
+    parser.add_argument('--holes', default=list(),
+                        help='file describing the holes or valves')
+    parser.add_argument('--fmin', type=float, default=20)
+    parser.add_argument('--fmax', type=float, default=2000)
+    parser.add_argument('--fstep', type=float, default=0.2)
+    parser.add_argument('--max-jobs', type=int, default=32,
+                        help='largest number of workers (default: '
+                        '%(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs per configuration, the best one '
+                        'is kept (default: %(default)s)')
+    parser.add_argument('--json', default=None,
+                        help='file in which the results are written')
+    args = parser.parse_args(argv)
+
+    from openwind import (InstrumentGeometry, InstrumentPhysics, Player,
+                          FrequentialSolver)
+    from tapas.parallel import ParallelFrequentialSolver, default_n_jobs
+
+    frequencies = np.arange(args.fmin, args.fmax, args.fstep)
+    instru_geom = InstrumentGeometry(args.geometry, args.holes)
+    instru_phy = InstrumentPhysics(instru_geom, 25, Player(), losses=True)
+
+    def best_time(f_solver):
+        durations = list()
+        for _ in range(args.repeat):
+            tic = time.perf_counter()
+            f_solver.solve()
+            durations.append(time.perf_counter() - tic)
+        return min(durations)
+
+    serial = FrequentialSolver(instru_phy, frequencies)
+    t_serial = best_time(serial)
+    print('{} frequencies, {} dof, {} CPUs available'.format(
+        len(frequencies), serial.n_tot, default_n_jobs()))
+    print('{:>8}{:>12}{:>10}{:>12}{:>12}'.format('jobs', 'time', 'speedup',
+                                                  'efficiency', 'identical'))
+    print('{:>8}{:>11.3f}s{:>10.2f}{:>12.2f}{:>12}'.format('serial', t_serial,
+                                                            1, 1, 'ref'))
+    results = dict(n_freq=len(frequencies), n_dof=int(serial.n_tot),
+                   serial=t_serial, parallel=dict())
+    n_jobs = 1
+    while n_jobs <= args.max_jobs:
+        f_solver = ParallelFrequentialSolver(instru_phy, frequencies,
+                                             n_jobs=n_jobs)
+        duration = best_time(f_solver)
+        identical = bool(np.array_equal(f_solver.impedance, serial.impedance))
+        speedup = t_serial / duration
+        results['parallel'][n_jobs] = dict(time=duration, speedup=speedup,
+                                           identical=identical)
+        print('{:>8}{:>11.3f}s{:>10.2f}{:>12.2f}{:>12}'.format(
+            n_jobs, duration, speedup, speedup / n_jobs, str(identical)))
+        n_jobs *= 2
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
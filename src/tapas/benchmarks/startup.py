@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cold start benchmark: time from the launch of a Python worker to its first
+audio sample.
+
+Each run spawns a fresh interpreter which imports openwind (either with a
+plain `import openwind` or through :py:func:`tapas.lazy.import_openwind`),
+builds the temporal solver of an instrument and computes the first block of a
+:py:class:`StreamingEngine<tapas.streaming.StreamingEngine>` resampled at
+44.1 kHz. The median of the durations of each stage is printed:
+
+.. code-block:: shell
+
+    python -m tapas.benchmarks.startup simplified-trumpet.csv --repeat 5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+
+MODES = {'eager': 'import openwind',
+         'lazy': 'from tapas.lazy import import_openwind\n'
+                 'openwind = import_openwind()'}
+"""dict: The import statements compared."""
+
+_WORKER = """
+import time
+tic = time.perf_counter()
+{import_statement}
+t_import = time.perf_counter()
+from tapas.streaming import StreamingEngine
+instru_geom = openwind.InstrumentGeometry({geometry!r})
+player = openwind.Player('TUTORIAL_REED')
+instru_phy = openwind.InstrumentPhysics(instru_geom, 25, player, losses=False)
+t_solver = openwind.TemporalSolver(instru_phy)
+t_build = time.perf_counter()
+engine = StreamingEngine(t_solver, block_size=64, output_rate=44100)
+while len(engine.buffer) == 0:
+    engine.process_block()
+t_sample = time.perf_counter()
+import json, sys
+print('#' + json.dumps(({{'import': t_import - tic, 'build': t_build - t_import,
+                   'first_block': t_sample - t_build}},
+                  sorted(name for name in sys.modules
+                         if name.split('.')[0] in ('matplotlib', 'plotly')
+                         and type(sys.modules[name]).__name__ == 'module'))))
+"""
+
+
+def run_worker(mode, geometry):
+    """
+    Measure the cold start of one worker process.
+
+    Parameters
+    ----------
+    mode : {'eager', 'lazy'}
+        The import path of openwind.
+    geometry : str
+        The file describing the main bore.
+
+    Returns
+    -------
+    timings : dict
+        The durations (in s) of the import of openwind ('import'), of the
+        construction of the solver ('build'), of the computation up to the
+        first audio sample ('first_block'), of the launch and exit of the
+        interpreter ('interpreter') and the total lifetime of the worker
+        ('total').
+    plotting_modules : list of str
+        The plotting modules actually imported by the worker.
+    """
+    code = _WORKER.format(import_statement=MODES[mode],
+                          geometry=os.path.abspath(geometry))
+    env = dict(os.environ, MPLBACKEND='Agg')
+    package_dir = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    env['PYTHONPATH'] = os.pathsep.join([package_dir,
+                                         env.get('PYTHONPATH', '')])
+    tic = time.perf_counter()
+    process = subprocess.run([sys.executable, '-c', code], env=env,
+                             capture_output=True, text=True, check=True)
+    total = time.perf_counter() - tic
+    line = [line for line in process.stdout.splitlines()
+            if line.startswith('#')][-1]
+    timings, plotting_modules = json.loads(line[1:])
+    timings['interpreter'] = total - sum(timings.values())
+    timings['total'] = total
+    return timings, plotting_modules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tapas.benchmarks.startup',
+                                     description=__doc__.split('\n\n')[0])
+    parser.add_argument('geometry', nargs='?', default='simplified-trumpet.csv',
+                        help='file describing the main bore (default: '
+                        '%(default)s)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of workers per mode (default: '
+                        '%(default)s)')
+    parser.add_argument('--json', default=None,
+                        help='file in which the results are written')
+    args = parser.parse_args(argv)
+
+    stages = ['import', 'build', 'first_block', 'interpreter', 'total']
+    results = dict()
+    print('{:<8}'.format('mode') + ''.join('{:>14}'.format(stage)
+                                           for stage in stages))
+    for mode in MODES:
+        runs = [run_worker(mode, args.geometry) for _ in range(args.repeat)]
+        median = {stage: float(np.median([timings[stage] for timings, _ in runs]))
+                  for stage in stages}
+        results[mode] = {'median': median, 'plotting_modules': runs[-1][1]}
+        print('{:<8}'.format(mode) + ''.join('{:>13.3f}s'.format(median[stage])
+                                             for stage in stages))
+    for mode in MODES:
+        print('{}: {} plotting modules imported'.format(
+            mode, len(results[mode]['plotting_modules'])))
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
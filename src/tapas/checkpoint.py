@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checkpoints of the state of a temporal simulation.
+
+A :py:class:`TemporalSolver<openwind.temporal.temporal_solver.TemporalSolver>`
+advances the variables of its components: the pressure and flow of the
+pipes, the auxiliary variables of the diffusive representation of the
+losses, the position of the reed or the jet, the variables of the junctions
+and radiations. :py:func:`get_state` gathers them (with the time and the time
+step) and :py:func:`set_state` puts them back, possibly in another solver
+built with the same options. :py:func:`save_state` and
+:py:func:`load_state` store them in a compressed `.npz` file:
+
+.. code-block:: python
+
+    t_solver.run_simulation(0.35)          # attack
+    save_state(t_solver, 'settled.npz')
+    ...
+    load_state(t_solver, 'settled.npz')    # same or new solver
+    resume_simulation(t_solver, 0.15, callback=rec.callback)
+
+The variables of each component are the attributes reinitialized by its
+`reset_variables()` method: they are found by running this method on a
+shadow copy of the component, so that any component of openwind is
+supported without a list to maintain.
+
+:py:func:`resume_simulation` keeps the time step of the state: the
+continued simulation does the same steps as an uninterrupted one. The state
+of the random generator of numpy (used by the noise of the flute jet) is
+saved too, so that the noise is continued as well.
+"""
+
+import json
+
+import numpy as np
+
+
+FORMAT_VERSION = 1
+"""int: The version of the layout of the state files."""
+
+
+def _attributes(obj):
+    """The attributes of an object, in its `__dict__` and in its slots."""
+    attributes = dict(getattr(obj, '__dict__', {}))
+    for cls in type(obj).__mro__:
+        slots = cls.__dict__.get('__slots__', ())
+        for name in [slots] if isinstance(slots, str) else slots:
+            if name not in ('__dict__', '__weakref__') and hasattr(obj, name):
+                attributes[name] = getattr(obj, name)
+    return attributes
+
+
+def _shadow(obj, names, prefix='', children=True):
+    """
+    A copy of `obj` recording the attributes set on it.
+
+    With `children`, the attributes which can be reset themselves (the pipe
+    ends) are shadowed too, with their name as prefix.
+    """
+    def record(self, name, value):
+        names.append(prefix + name)
+        object.__setattr__(self, name, value)
+
+    shadow_class = type('Shadow' + type(obj).__name__, (type(obj),),
+                        {'__setattr__': record})
+    shadow = object.__new__(shadow_class)
+    for name, value in _attributes(obj).items():
+        if (children and value is not obj and not isinstance(value, type)
+                and callable(getattr(value, 'reset_variables', None))):
+            value = _shadow(value, names, name + '.', children=False)
+        object.__setattr__(shadow, name, value)
+    return shadow
+
+
+def state_variables(t_component):
+    """
+    The names of the variables of a temporal component.
+
+    Parameters
+    ----------
+    t_component : :py:class:`TemporalComponent<openwind.temporal.tcomponent.TemporalComponent>`
+        The component.
+
+    Returns
+    -------
+    list of str
+        The attributes set by `reset_variables()`. The attributes of the
+        sub-objects (such as the ends of the pipes) are given by a dotted
+        path.
+    """
+    names = list()
+    try:
+        _shadow(t_component, names).reset_variables()
+    except NotImplementedError:
+        raise ValueError('The state of {} is not known (no reset_variables()).'
+                         .format(t_component))
+    return list(dict.fromkeys(names))
+
+
+def _get_path(obj, path):
+    for name in path.split('.'):
+        obj = getattr(obj, name)
+    return obj
+
+
+def _set_path(obj, path, value):
+    *parents, name = path.split('.')
+    for parent in parents:
+        obj = getattr(obj, parent)
+    setattr(obj, name, value)
+
+
+def _encode(key, value, arrays):
+    """Store `value` in `arrays` and return the description of its type."""
+    if isinstance(value, (tuple, list)):
+        for k, item in enumerate(value):
+            _encode('{}/{}'.format(key, k), item, arrays)
+        return [type(value).__name__, len(value),
+                [_kind(item) for item in value]]
+    arrays[key] = np.asarray(value)
+    return _kind(value)
+
+
+def _kind(value):
+    if isinstance(value, np.ndarray):
+        return 'array'
+    if isinstance(value, (tuple, list)):
+        return [type(value).__name__, len(value),
+                [_kind(item) for item in value]]
+    if isinstance(value, (bool, np.bool_)):
+        return 'bool'
+    if isinstance(value, (int, np.integer)):
+        return 'int'
+    return 'float' if np.isrealobj(value) else 'complex'
+
+
+def _shape(value):
+    # the lists (histories) may have any length
+    if isinstance(value, tuple):
+        return tuple(_shape(item) for item in value)
+    return 'list' if isinstance(value, list) else np.shape(value)
+
+
+def _decode(key, kind, arrays):
+    if isinstance(kind, list):
+        container, length, kinds = kind
+        items = [_decode('{}/{}'.format(key, k), kinds[k], arrays)
+                 for k in range(length)]
+        return tuple(items) if container == 'tuple' else items
+    value = arrays[key]
+    if kind == 'array':
+        return np.array(value)
+    return {'bool': bool, 'int': int, 'float': float,
+            'complex': complex}[kind](value)
+
+
+def get_state(t_solver):
+    """
+    The state of a temporal simulation.
+
+    Parameters
+    ----------
+    t_solver : :py:class:`TemporalSolver<openwind.temporal.temporal_solver.TemporalSolver>`
+        The solver.
+
+    Returns
+    -------
+    dict
+        The arrays of the variables ('arrays', keyed by
+        `<component>/<variable>`) and their description ('metadata': the
+        time, the time step, the types and shapes of the variables, the state
+        of the random generator).
+    """
+    arrays = dict()
+    kinds = dict()
+    for t_comp in t_solver.t_components:
+        for name in state_variables(t_comp):
+            key = '{}/{}'.format(t_comp.label, name)
+            kinds[key] = _encode(key, _get_path(t_comp, name), arrays)
+    metadata = {'version': FORMAT_VERSION,
+                'time': t_solver.get_current_time(),
+                'dt': t_solver.get_dt(),
+                'components': [t_comp.label for t_comp in t_solver.t_components],
+                'variables': kinds}
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    arrays['__random__/keys'] = keys
+    metadata['random'] = [name, int(pos), int(has_gauss), float(cached_gaussian)]
+    return {'arrays': arrays, 'metadata': metadata}
+
+
+def set_state(t_solver, state, restore_random=True):
+    """
+    Set the state of a temporal simulation.
+
+    The solver must have the same components and discretization as the one of
+    the state. Its time step is set to the one of the state.
+
+    Parameters
+    ----------
+    t_solver : :py:class:`TemporalSolver<openwind.temporal.temporal_solver.TemporalSolver>`
+        The solver.
+    state : dict
+        A state given by :py:func:`get_state`.
+    restore_random : bool, optional
+        Restore also the state of the random generator of numpy. Default is
+        True.
+    """
+    metadata = state['metadata']
+    arrays = state['arrays']
+    labels = [t_comp.label for t_comp in t_solver.t_components]
+    if labels != metadata['components']:
+        raise ValueError('The components of the solver {} differ from the ones '
+                         'of the state {}.'.format(labels,
+                                                   metadata['components']))
+    values = dict()
+    for t_comp in t_solver.t_components:
+        for name in state_variables(t_comp):
+            key = '{}/{}'.format(t_comp.label, name)
+            if key not in metadata['variables']:
+                raise ValueError("The variable '{}' is missing in the state."
+                                 .format(key))
+            value = _decode(key, metadata['variables'][key], arrays)
+            current = _get_path(t_comp, name)
+            if _shape(current) != _shape(value):
+                raise ValueError("The variable '{}' has the shape {} in the "
+                                 "state and {} in the solver: the "
+                                 "discretizations differ.".format(
+                                     key, _shape(value), _shape(current)))
+            values[(t_comp, name)] = value
+    if t_solver.get_dt() != metadata['dt']:
+        t_solver._set_dt(metadata['dt'])
+    for (t_comp, name), value in values.items():
+        _set_path(t_comp, name, value)
+    t_solver._current_time = metadata['time']
+    if restore_random:
+        name, pos, has_gauss, cached_gaussian = metadata['random']
+        np.random.set_state((name, arrays['__random__/keys'], pos, has_gauss,
+                             cached_gaussian))
+
+
+def save_state(t_solver, filename):
+    """
+    Save the state of a temporal simulation in a compressed `.npz` file.
+
+    Parameters
+    ----------
+    t_solver : :py:class:`TemporalSolver<openwind.temporal.temporal_solver.TemporalSolver>`
+        The solver.
+    filename : str
+        The file.
+    """
+    state = get_state(t_solver)
+    np.savez_compressed(filename, __metadata__=json.dumps(state['metadata']),
+                        **state['arrays'])
+
+
+def read_state(filename):
+    """
+    Read a state saved by :py:func:`save_state`.
+
+    Parameters
+    ----------
+    filename : str
+        The file.
+
+    Returns
+    -------
+    dict
+        The state, as given by :py:func:`get_state`.
+    """
+    with np.load(filename) as data:
+        metadata = json.loads(str(data['__metadata__']))
+        if metadata.get('version') != FORMAT_VERSION:
+            raise ValueError('{} is not a state file of version {}.'
+                             .format(filename, FORMAT_VERSION))
+        arrays = {key: data[key] for key in data.files
+                  if key != '__metadata__'}
+    return {'arrays': arrays, 'metadata': metadata}
+
+
+def load_state(t_solver, filename, restore_random=True):
+    """
+    Set the state of a temporal simulation from a file.
+
+    Parameters
+    ----------
+    t_solver : :py:class:`TemporalSolver<openwind.temporal.temporal_solver.TemporalSolver>`
+        The solver, with the same components and discretization as the one
+        saved.
+    filename : str
+        The file written by :py:func:`save_state`.
+    restore_random : bool, optional
+        Restore also the state of the random generator of numpy. Default is
+        True.
+    """
+    set_state(t_solver, read_state(filename), restore_random)
+
+
+def resume_simulation(t_solver, duration, callback=None,
+                      enable_tracker_display=False):
+    """
+    Continue a simulation for some duration, keeping its time step.
+
+    Unlike `TemporalSolver.run_simulation()`, which adapts the time step to
+    the duration, the steps are the ones an uninterrupted simulation would
+    have done.
+
+    Parameters
+    ----------
+    t_solver : :py:class:`TemporalSolver<openwind.temporal.temporal_solver.TemporalSolver>`
+        The solver, whose state has been set.
+    duration : float
+        The additional duration, in s (rounded to a number of steps).
+    callback : callable, optional
+        Called after each step with the solver.
+    enable_tracker_display : bool, optional
+        Display the progression. Default is False.
+
+    Returns
+    -------
+    int
+        The number of steps performed.
+    """
+    dt = t_solver.get_dt() * t_solver.scaling.get_time()
+    n_steps = int(round(duration / dt))
+    t_solver.run_simulation_steps(n_steps, callback=callback,
+                                  enable_tracker_display=enable_tracker_display)
+    return n_steps
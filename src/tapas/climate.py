@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sweeps of the air conditions (temperature, humidity, CO2 rate) on a fixed
+mesh.
+
+Changing the temperature or the humidity with openwind means building again
+the :py:class:`InstrumentPhysics<openwind.continuous.instrument_physics.InstrumentPhysics>`
+and the :py:class:`FrequentialSolver<openwind.frequential.frequential_solver.FrequentialSolver>`,
+mesh included, while only the coefficient fields (density, celerity,
+viscous and thermal coefficients) change. The :py:class:`ClimateSweep`
+discretizes the instrument once; for each condition it replaces the
+:py:class:`Physics<openwind.continuous.physics.Physics>` of the pipes and
+the scaling, and re-evaluates the coefficients on the kept mesh (its
+elementary matrices are reused):
+
+.. code-block:: python
+
+    sweep = ClimateSweep(frequencies, 'Oboe_instrument.txt', 'Oboe_holes.txt',
+                         'Oboe_fingering_chart.txt', losses=True)
+    Z = sweep.impedance(temperature=np.linspace(10, 35, 26), humidity=0.5)
+    Z.shape   # (26, n_freq)
+    Z_notes = sweep.impedance(temperature=[15, 25], notes=['C', 'D', 'E'])
+    Z_notes.shape   # (2, 3, n_freq)
+
+The conditions can be temperature gradients (callables), as in
+:py:class:`InstrumentPhysics<openwind.continuous.instrument_physics.InstrumentPhysics>`.
+"""
+
+import time
+
+import numpy as np
+
+from openwind import InstrumentGeometry, InstrumentPhysics, Player
+from openwind import FrequentialSolver
+
+from .multi_note import MultiNoteSolver
+
+
+class ClimateSweep:
+    """
+    Impedance of an instrument for several air conditions, on one mesh.
+
+    Parameters
+    ----------
+    frequencies : array of float
+        The frequencies.
+    main_bore, holes_valves, fingering_chart : str or list
+        The instrument description, see :py:class:`InstrumentGeometry\
+        <openwind.technical.instrument_geometry.InstrumentGeometry>`.
+    player : :py:class:`Player<openwind.technical.player.Player>`, optional
+        The player. Default is a unitary flow.
+    temperature : float, optional
+        The temperature of the reference condition, in °C, for which the
+        automatic mesh is built. The mesh is adapted to the shortest
+        wavelength: prefer the coldest temperature of the sweeps. Default is
+        20.
+    losses : bool or str, optional
+        The losses model. Default is True.
+    unit, diameter : optional
+        Geometry options.
+    compute_method, use_rad1dof, diffus_repr_var : optional
+        See :py:class:`FrequentialSolver<openwind.frequential.frequential_solver.FrequentialSolver>`.
+    **kwargs :
+        Other options of :py:class:`InstrumentPhysics\
+        <openwind.continuous.instrument_physics.InstrumentPhysics>` (except
+        the air composition) and of the mesh (`l_ele`, `order`).
+
+    Attributes
+    ----------
+    f_solver : :py:class:`FrequentialSolver<openwind.frequential.frequential_solver.FrequentialSolver>`
+        The solver of the reference condition, whose mesh is used.
+    timings : dict
+        The cumulated durations (in s) of the update of the physics
+        ('physics'), of the assembly ('assembly') and of the solves ('solve').
+    """
+
+    AIR_OPTIONS = ['temperature', 'humidity', 'carbon']
+    """list of str: The options which can be swept."""
+
+    def __init__(self, frequencies, main_bore, holes_valves=list(),
+                 fingering_chart=list(), player=None, temperature=20,
+                 losses=True, unit='m', diameter=False, compute_method='FEM',
+                 use_rad1dof=False, diffus_repr_var=False, **kwargs):
+        swept = [key for key in self.AIR_OPTIONS[1:] if key in kwargs]
+        if swept:
+            raise ValueError('{} are given by condition to impedance().'
+                             .format(swept))
+        if compute_method == 'modal':
+            raise ValueError("The 'modal' method is not supported.")
+        self.player = player if player is not None else Player()
+        self.losses = losses
+        self.instru_geom = InstrumentGeometry(main_bore, holes_valves,
+                                              fingering_chart, unit=unit,
+                                              diameter=diameter)
+        mesh_keys = ['l_ele', 'order', 'shortestLbd', 'nb_sub']
+        self._mesh_options = {key: kwargs.pop(key) for key in mesh_keys
+                              if key in kwargs}
+        self._phy_options = kwargs
+        instru_phy = self._physics(dict(temperature=temperature))
+        self.f_solver = FrequentialSolver(instru_phy, frequencies,
+                                          compute_method=compute_method,
+                                          use_rad1dof=use_rad1dof,
+                                          diffus_repr_var=diffus_repr_var,
+                                          **self._mesh_options)
+        self._pipes = {label: pipe for label, (pipe, _)
+                       in instru_phy.netlist.pipes.items()}
+        self._scaling = instru_phy.scaling
+        self.timings = dict(physics=0., assembly=0., solve=0.)
+
+    def __repr__(self):
+        return ("<tapas.climate.ClimateSweep({} frequencies, {} dof)>"
+                .format(len(self.f_solver.frequencies), self.f_solver.n_tot))
+
+    def _physics(self, condition):
+        return InstrumentPhysics(self.instru_geom, player=self.player,
+                                 losses=self.losses, **condition,
+                                 **self._phy_options)
+
+    def set_condition(self, temperature, humidity=0.5, carbon=4e-4):
+        """
+        Set the air condition of the solver, keeping its mesh.
+
+        Parameters
+        ----------
+        temperature : float or callable
+            The temperature in °C (possibly a function of the position).
+        humidity : float or callable, optional
+            The humidity rate (between 0 and 1). Default is 0.5.
+        carbon : float or callable, optional
+            The CO2 molar fraction. Default is 4e-4.
+        """
+        tic = time.perf_counter()
+        # the physics of the condition, built on the same netlist structure
+        instru_phy = self._physics(dict(temperature=temperature,
+                                        humidity=humidity, carbon=carbon))
+        for label, (pipe, _) in instru_phy.netlist.pipes.items():
+            self._pipes[label]._physics = pipe.get_physics()
+        # the scaling is shared by all the components: update it in place
+        self._scaling.__dict__.update(instru_phy.scaling.__dict__)
+        toc = time.perf_counter()
+        self.f_solver._construct_matrices_pipes()
+        self.f_solver._construct_matrices_connectors()
+        self.timings['physics'] += toc - tic
+        self.timings['assembly'] += time.perf_counter() - toc
+
+    def impedance(self, temperature=20, humidity=0.5, carbon=4e-4, notes=None):
+        """
+        Compute the impedance for several conditions.
+
+        The arguments are broadcast together: one of them can be a sequence
+        of conditions, the others being scalars (or sequences of the same
+        length).
+
+        Parameters
+        ----------
+        temperature : float or callable or sequence of them, optional
+            The temperatures in °C. Default is 20.
+        humidity : float or callable or sequence of them, optional
+            The humidity rates. Default is 0.5.
+        carbon : float or callable or sequence of them, optional
+            The CO2 molar fractions. Default is 4e-4.
+        notes : list of str, optional
+            The notes to compute for each condition (with
+            :py:class:`MultiNoteSolver<tapas.multi_note.MultiNoteSolver>`).
+            Default is None (the current fingering).
+
+        Returns
+        -------
+        array of complex
+            The impedances, of shape `(n_conditions, n_freq)`, or
+            `(n_conditions, n_notes, n_freq)` with notes.
+        """
+        conditions = _broadcast(temperature, humidity, carbon)
+        impedances = list()
+        for condition in conditions:
+            self.set_condition(*condition)
+            tic = time.perf_counter()
+            if notes is None:
+                self.f_solver.solve()
+                impedances.append(self.f_solver.impedance)
+            else:
+                impedances.append(MultiNoteSolver(self.f_solver, notes).solve())
+            self.timings['solve'] += time.perf_counter() - tic
+        return np.array(impedances)
+
+
+def _broadcast(*values):
+    """Broadcast scalars, callables and sequences to a list of tuples."""
+    def is_sequence(value):
+        return not callable(value) and np.ndim(value) > 0
+
+    lengths = {len(value) for value in values if is_sequence(value)}
+    if len(lengths) > 1:
+        raise ValueError('The swept conditions must have the same length, '
+                         'got {}.'.format(sorted(lengths)))
+    n = lengths.pop() if lengths else 1
+    columns = [list(value) if is_sequence(value) else [value]*n
+               for value in values]
+    return list(zip(*columns))
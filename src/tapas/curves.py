@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Control curves of the player sampled on the instants of a simulation.
+
+The curves of a :py:class:`Player<openwind.technical.player.Player>` (blowing
+pressure, jet velocity, reed opening...) are time functions, usually built
+from :py:mod:`temporal_curves<openwind.technical.temporal_curves>`: a
+`gate` is the sum of three fades, and the transitions of
+`add(gate(...), gate(...))` cost tens of numpy calls. The temporal solver
+evaluates them several times per step, on scalar instants.
+
+The instants at which a simulation evaluates the curves are known when it
+starts: :py:func:`sampled_curves` evaluates each curve once on all of them,
+on an array, and the simulation only looks the values up.
+
+.. code-block:: python
+
+    player.update_curve('jet_velocity', add(gate(...), gate(...)))
+    rec = RecordingDevice()
+    run_sampled_simulation(t_solver, 1.5, callback=rec.callback,
+                           live=['noise_level'])
+
+No interpolation is done: the values are the ones of the curves on the very
+instants of the simulation, breakpoints included, up to the rounding of the
+vectorized numpy functions (the fades evaluated on an array may differ from
+the scalar evaluation by 1e-16). The instants which are not sampled, and the
+curves given as `live` (with side effects or depending on the state of the
+simulation), are evaluated by the curve itself.
+"""
+
+import contextlib
+
+import numpy as np
+
+from openwind.continuous.excitator import Flute
+
+
+class SampledCurve:
+    """
+    A curve sampled on some instants.
+
+    Parameters
+    ----------
+    curve : callable
+        The time function.
+    times : array of float
+        The instants at which it is sampled.
+
+    Attributes
+    ----------
+    times : array of float
+        The sorted instants.
+    values : array
+        The values of the curve on these instants.
+    """
+
+    def __init__(self, curve, times):
+        self.curve = curve
+        self.times = np.unique(times)
+        self.values = _evaluate(curve, self.times)
+
+    def __repr__(self):
+        return '<tapas.curves.SampledCurve({}, {} instants)>'.format(
+            self.curve, len(self.times))
+
+    def __call__(self, t):
+        if np.ndim(t) == 0:
+            index = np.searchsorted(self.times, t)
+            if index < len(self.times) and self.times[index] == t:
+                return self.values[index]
+        return self.curve(t)
+
+
+def _evaluate(curve, times):
+    """The curve on an array of instants, pointwise if it can not be."""
+    try:
+        values = curve(times)
+    except (TypeError, ValueError):
+        # written for scalars only (`if t < ...`)
+        values = None
+    if np.shape(values) != np.shape(times):
+        values = np.array([curve(t) for t in times])
+    return np.asarray(values)
+
+
+def simulation_instants(t_solver, n_steps):
+    """
+    The instants at which the next steps of a simulation evaluate the curves.
+
+    They are the middles of the steps, accumulated as
+    `TemporalSolver.one_step()` does from the current time. The jet velocity
+    of a flute is also evaluated one step before and after.
+
+    Parameters
+    ----------
+    t_solver : :py:class:`TemporalSolver<openwind.temporal.temporal_solver.TemporalSolver>`
+        The solver, with the time step of the simulation.
+    n_steps : int
+        The number of steps.
+
+    Returns
+    -------
+    array of float
+    """
+    time_scale = t_solver.scaling.get_time()
+    half_steps = np.full(2*n_steps + 1, t_solver.get_dt()/2 * time_scale)
+    half_steps[0] = t_solver.get_current_time()
+    times = np.add.accumulate(half_steps)[1::2]
+    if isinstance(t_solver.instru_physics.excitator_model, Flute):
+        dt = t_solver.get_dt() * time_scale
+        times = np.concatenate([times - dt, times, times + dt])
+    return times
+
+
+@contextlib.contextmanager
+def sampled_curves(t_solver, n_steps, live=()):
+    """
+    Sample the curves of the player for the next steps of a simulation.
+
+    In the context, the time functions of the player are replaced by
+    :py:class:`SampledCurve`; they are restored at its exit.
+
+    Parameters
+    ----------
+    t_solver : :py:class:`TemporalSolver<openwind.temporal.temporal_solver.TemporalSolver>`
+        The solver, with the time step of the simulation.
+    n_steps : int
+        The number of steps of the simulation.
+    live : list of str, optional
+        The curves evaluated at each step instead. Default is none.
+    """
+    player = t_solver.instru_physics.player
+    original = dict(player.control_parameters)
+    unknown = set(live) - set(original)
+    if unknown:
+        raise ValueError('The player has no curves {}.'.format(sorted(unknown)))
+    times = simulation_instants(t_solver, n_steps)
+    try:
+        for label, curve in original.items():
+            if callable(curve) and label not in live:
+                player.control_parameters[label] = SampledCurve(curve, times)
+        t_solver.instru_physics._update_player()
+        yield
+    finally:
+        player.control_parameters.clear()
+        player.control_parameters.update(original)
+        t_solver.instru_physics._update_player()
+
+
+def run_sampled_simulation(t_solver, duration, callback=None,
+                           enable_tracker_display=True, n_steps=None,
+                           live=()):
+    """
+    Run a simulation with the curves of the player sampled beforehand.
+
+    As `TemporalSolver.run_simulation()`, the time step is adapted so that the
+    simulation lasts exactly `duration`.
+
+    Parameters
+    ----------
+    t_solver : :py:class:`TemporalSolver<openwind.temporal.temporal_solver.TemporalSolver>`
+        The solver.
+    duration : float
+        The duration of the simulation, in s.
+    callback : callable, optional
+        Called after each step with the solver.
+    enable_tracker_display : bool, optional
+        Display the progression. Default is True.
+    n_steps : int, optional
+        The number of steps. Default is None: the lowest respecting the CFL
+        condition.
+    live : list of str, optional
+        The curves evaluated at each step instead. Default is none.
+
+    Returns
+    -------
+    int
+        The number of steps performed.
+    """
+    time_scale = t_solver.scaling.get_time()
+    if n_steps is None:
+        n_steps = int(np.ceil(duration / t_solver.get_dt() / time_scale))
+    t_solver._set_dt(duration / n_steps / time_scale)
+    with sampled_curves(t_solver, n_steps, live):
+        t_solver.run_simulation_steps(n_steps, callback,
+                                      enable_tracker_display)
+    return n_steps
@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Generation of large datasets of instruments for the geometry→timbre models.
+
+A :py:class:`BoreFamily` describes a parametric family of instruments (conical
+or exponential segments and tone holes) and samples random geometries from
+it, as lists accepted by :py:class:`InstrumentGeometry\
+<openwind.technical.instrument_geometry.InstrumentGeometry>` whose sampled
+values are marked as design variables ('~'), so that the parameter vector of
+each instrument is given by its `optim_params`.
+
+:py:func:`generate_dataset` computes, for each sampled instrument, the input
+impedance, its resonance peaks and optionally a short simulated sound, and
+writes them in HDF5 shards described by a `manifest.json` file:
+
+.. code-block:: python
+
+    family = BoreFamily(length=(0.4, 0.8), n_segments=3, n_holes=2)
+    generate_dataset('saxo_dataset', family, n_samples=100000, shard_size=500,
+                     jobs=32, sound_duration=0.3)
+
+The work is distributed by shards over a process pool. A shard is written
+atomically and recorded in the manifest once complete, so that an interrupted
+generation restarts where it stopped (call again with the same arguments).
+Every sample is computed in isolation: a failing geometry is flagged in its
+shard with the error message. Each running shard has its own worker: when a
+worker crashes (segmentation fault, out of memory), only its shard is
+concerned. It is retried in a new worker, and flagged as failed after
+`max_retries` crashes (it is retried again at the next run).
+"""
+
+import collections
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+
+MANIFEST = 'manifest.json'
+"""str: The name of the manifest file of a dataset."""
+
+DATASET_VERSION = 1
+
+
+def _draw(rng, bounds):
+    low, high = bounds
+    return rng.uniform(low, high)
+
+
+class BoreFamily:
+    """
+    A parametric family of wind instruments.
+
+    The main bore is made of `n_segments` segments of random lengths, whose
+    radii follow a random flaring from `r_input` to `r_input*flare`. The tone
+    holes are placed randomly on the part of the bore given by
+    `hole_range`. All the ranges are `(low, high)` tuples of uniform
+    distributions, the lengths and radii are in meters.
+
+    Parameters
+    ----------
+    length : tuple of float, optional
+        The total length of the main bore. Default is (0.3, 1.0).
+    n_segments : int, optional
+        The number of segments of the main bore. Default is 3.
+    shapes : list of str, optional
+        The shapes among which the shape of each segment is drawn. Default is
+        ['linear'] (cones).
+    r_input : tuple of float, optional
+        The radius at the entrance. Default is (4e-3, 1e-2).
+    flare : tuple of float, optional
+        The ratio between the radii at the bell and at the entrance. Default
+        is (1, 8).
+    n_holes : int, optional
+        The number of tone holes. Default is 0.
+    hole_range : tuple of float, optional
+        The part of the bore on which the holes are placed, relatively to its
+        length. Default is (0.3, 0.9).
+    hole_radius : tuple of float, optional
+        The radius of the holes, relatively to the local radius of the bore.
+        Default is (0.3, 0.8).
+    chimney : tuple of float, optional
+        The height of the chimneys of the holes. Default is (2e-3, 8e-3).
+    """
+
+    def __init__(self, length=(0.3, 1.0), n_segments=3, shapes=['linear'],
+                 r_input=(4e-3, 1e-2), flare=(1, 8), n_holes=0,
+                 hole_range=(0.3, 0.9), hole_radius=(0.3, 0.8),
+                 chimney=(2e-3, 8e-3)):
+        if n_segments < 1:
+            raise ValueError('The main bore needs at least one segment.')
+        self.length = length
+        self.n_segments = n_segments
+        self.shapes = list(shapes)
+        self.r_input = r_input
+        self.flare = flare
+        self.n_holes = n_holes
+        self.hole_range = hole_range
+        self.hole_radius = hole_radius
+        self.chimney = chimney
+
+    def __repr__(self):
+        return ("<tapas.dataset.BoreFamily(n_segments={}, shapes={}, "
+                "n_holes={})>".format(self.n_segments, self.shapes,
+                                      self.n_holes))
+
+    def to_dict(self):
+        """
+        Returns
+        -------
+        dict
+            The description of the family, from which it can be rebuilt with
+            `BoreFamily(**family_dict)`.
+        """
+        return dict(length=list(self.length), n_segments=self.n_segments,
+                    shapes=self.shapes, r_input=list(self.r_input),
+                    flare=list(self.flare), n_holes=self.n_holes,
+                    hole_range=list(self.hole_range),
+                    hole_radius=list(self.hole_radius),
+                    chimney=list(self.chimney))
+
+    def sample(self, rng):
+        """
+        Draw a random instrument of the family.
+
+        Parameters
+        ----------
+        rng : :py:class:`numpy.random.Generator`
+            The random generator.
+
+        Returns
+        -------
+        main_bore : list
+            The main bore, each row being `[x_start, x_end, r_start, r_end,
+            shape]`.
+        holes : list
+            The holes, with the header `['label', 'position', 'radius',
+            'chimney']` (an empty list without holes).
+        """
+        length = _draw(rng, self.length)
+        cuts = np.sort(rng.uniform(0.05, 0.95, self.n_segments - 1))
+        x = length * np.concatenate(([0], cuts, [1]))
+        # random monotonous flaring, normalized to the drawn bell radius
+        steps = np.cumsum(np.concatenate(([0], rng.uniform(0, 1, self.n_segments))))
+        r_in = _draw(rng, self.r_input)
+        radii = r_in * _draw(rng, self.flare)**(steps / steps[-1])
+
+        main_bore = list()
+        for k in range(self.n_segments):
+            shape = self.shapes[rng.integers(len(self.shapes))]
+            x_start = 0 if k == 0 else x[k]
+            main_bore.append([x_start, _variable(x[k + 1]),
+                              _variable(radii[k]) if k == 0 else radii[k],
+                              _variable(radii[k + 1]), shape])
+        holes = list()
+        if self.n_holes > 0:
+            holes.append(['label', 'position', 'radius', 'chimney'])
+            positions = np.sort(rng.uniform(*self.hole_range, self.n_holes))
+            for k, pos in enumerate(positions):
+                bore_radius = np.interp(pos, x/length, radii)
+                holes.append(['hole{}'.format(k + 1),
+                              _variable(pos*length),
+                              _variable(_draw(rng, self.hole_radius)*bore_radius),
+                              _variable(_draw(rng, self.chimney))])
+        return main_bore, holes
+
+
+def _variable(value):
+    # mark a value as a design variable of InstrumentGeometry
+    return '~{!r}'.format(float(value))
+
+
+def _sample_rng(seed, index):
+    # independent stream per sample: the dataset does not depend on the order
+    # in which the shards are computed
+    return np.random.default_rng([seed, index])
+
+
+def compute_sample(main_bore, holes, openwind, frequencies, n_peaks=8,
+                   temperature=25, sound_duration=None, samplerate=44100,
+                   player='TUTORIAL_REED'):
+    """
+    Compute the acoustic features of one instrument.
+
+    Parameters
+    ----------
+    main_bore, holes : list
+        The geometry, see :py:meth:`BoreFamily.sample`.
+    openwind : module
+        The openwind package.
+    frequencies : array of float
+        The frequency axis of the impedance.
+    n_peaks : int, optional
+        The number of resonances kept. Default is 8.
+    temperature : float, optional
+        The temperature in °C. Default is 25.
+    sound_duration : float, optional
+        The duration of the simulated sound, in s. Default is None (no sound).
+    samplerate : int, optional
+        The sample rate of the sound. Default is 44100.
+    player : str, optional
+        The name of the player of the simulation. Default is 'TUTORIAL_REED'.
+
+    Returns
+    -------
+    dict
+        The parameter labels and values ('param_labels', 'params'), the
+        impedance normalized by the characteristic impedance ('impedance'),
+        the resonance frequencies, quality factors and normalized impedance
+        at the resonances ('resonance_frequencies', 'quality_factors',
+        'resonance_impedance', padded with NaN) and the 'sound' if requested.
+    """
+    result = openwind.ImpedanceComputation(frequencies, main_bore, holes,
+                                           temperature=temperature)
+    optim_params = result.get_instrument_geometry().optim_params
+    f_res, q_res, z_res = result.resonance_peaks(n_peaks, display_warning=False)
+    peaks = np.full((3, n_peaks), np.nan, dtype=complex)
+    n = min(n_peaks, len(f_res))
+    peaks[0, :n], peaks[1, :n] = f_res[:n], q_res[:n]
+    peaks[2, :n] = np.asarray(z_res[:n]) / result.Zc
+    sample = {'param_labels': list(optim_params.labels),
+              'params': np.array(optim_params.get_active_values()),
+              'impedance': result.impedance / result.Zc,
+              'resonance_frequencies': peaks[0].real,
+              'quality_factors': peaks[1].real,
+              'resonance_impedance': peaks[2]}
+    if sound_duration:
+        sample['sound'] = simulate_sound(main_bore, holes, openwind,
+                                         sound_duration, samplerate,
+                                         temperature, player)
+    return sample
+
+
+def simulate_sound(main_bore, holes, openwind, duration, samplerate=44100,
+                   temperature=25, player='TUTORIAL_REED'):
+    """
+    Simulate the radiated pressure of an instrument, at an audio rate.
+
+    Parameters
+    ----------
+    main_bore, holes : list
+        The geometry.
+    openwind : module
+        The openwind package.
+    duration : float
+        The duration of the sound, in s.
+    samplerate : int, optional
+        The sample rate. Default is 44100.
+    temperature : float, optional
+        The temperature in °C. Default is 25.
+    player : str, optional
+        The name of the player. Default is 'TUTORIAL_REED'.
+
+    Returns
+    -------
+    array of float32
+        The radiated pressure, with `round(duration*samplerate)` samples.
+    """
+    from .streaming import find_channel
+    from .resampling import resample
+
+    instru_geom = openwind.InstrumentGeometry(main_bore, holes)
+    instru_phy = openwind.InstrumentPhysics(instru_geom, temperature,
+                                            openwind.Player(player), False)
+    t_solver = openwind.TemporalSolver(instru_phy)
+    component, key = find_channel(t_solver, 'bell_radiation_pressure')
+    values = list()
+    t_solver.run_simulation(duration, enable_tracker_display=False,
+                            callback=lambda _: values.append(
+                                component.get_values_to_record()[key]))
+    dt = t_solver.get_dt() * t_solver.scaling.get_time()
+    sound = resample(np.array(values), 1/dt, samplerate)
+    n_samples = int(round(duration*samplerate))
+    return np.pad(sound, (0, max(0, n_samples - len(sound))))[:n_samples].astype(np.float32)
+
+
+def _compute_shard(path, indices, family_dict, seed, options):
+    """Compute and write one shard (executed in the worker processes)."""
+    import h5py
+    from .lazy import import_openwind
+
+    family = BoreFamily(**family_dict)
+    frequencies = np.asarray(options['frequencies'])
+    n_peaks = options['n_peaks']
+    tic = time.perf_counter()
+    samples, errors, geometries = list(), list(), list()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        openwind = import_openwind()
+        for index in indices:
+            main_bore, holes = family.sample(_sample_rng(seed, index))
+            geometries.append(json.dumps([main_bore, holes]))
+            try:
+                samples.append(compute_sample(main_bore, holes, openwind,
+                                              **options))
+                errors.append('')
+            except Exception:
+                samples.append(None)
+                errors.append(traceback.format_exc())
+
+    valid = [sample for sample in samples if sample is not None]
+    n = len(indices)
+    n_params = len(valid[0]['params']) if valid else 0
+    n_sound = len(valid[0]['sound']) if valid and 'sound' in valid[0] else 0
+
+    def column(key, shape, dtype):
+        data = np.full((n,) + shape, np.nan, dtype=dtype)
+        for k, sample in enumerate(samples):
+            if sample is not None:
+                data[k] = sample[key]
+        return data
+
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.h5.tmp')
+    os.close(fd)
+    try:
+        with h5py.File(tmp_path, 'w') as file:
+            file.attrs['version'] = DATASET_VERSION
+            file.attrs['param_labels'] = json.dumps(valid[0]['param_labels']
+                                                    if valid else [])
+            file['index'] = np.asarray(indices)
+            file['failed'] = np.array([bool(err) for err in errors])
+            file['error'] = np.array(errors, dtype=h5py.string_dtype())
+            file['geometry'] = np.array(geometries, dtype=h5py.string_dtype())
+            file['frequencies'] = frequencies
+            file['params'] = column('params', (n_params,), float)
+            file.create_dataset('impedance', compression='gzip',
+                                data=column('impedance', frequencies.shape,
+                                            complex))
+            for key in ['resonance_frequencies', 'quality_factors']:
+                file[key] = column(key, (n_peaks,), float)
+            file['resonance_impedance'] = column('resonance_impedance',
+                                                 (n_peaks,), complex)
+            if n_sound:
+                file.create_dataset('sound', compression='gzip',
+                                    data=column('sound', (n_sound,),
+                                                np.float32))
+                file['sound'].attrs['samplerate'] = options['samplerate']
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return {'n_samples': n, 'n_failed': sum(bool(err) for err in errors),
+            'duration': time.perf_counter() - tic}
+
+
+class DatasetManifest:
+    """
+    The description of a dataset and of the state of its shards.
+
+    It is stored in JSON in `<output_dir>/manifest.json` and rewritten
+    atomically after each shard.
+
+    Parameters
+    ----------
+    output_dir : str
+        The directory of the dataset.
+    config : dict
+        The generation parameters (family, seed, number of samples, shard
+        size and computation options).
+    """
+
+    def __init__(self, output_dir, config):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST)
+        self.config = config
+        self.shards = dict()
+        if os.path.isfile(self.path):
+            with open(self.path) as file:
+                stored = json.load(file)
+            changed = [key for key in set(config) | set(stored['config'])
+                       if config.get(key) != stored['config'].get(key)]
+            if changed:
+                raise ValueError("The dataset in '{}' was generated with other"
+                                 " values of {}, use another directory."
+                                 .format(output_dir, sorted(changed)))
+            self.shards = stored['shards']
+
+    def __repr__(self):
+        return ("<tapas.dataset.DatasetManifest('{}', {}/{} shards done)>"
+                .format(self.output_dir, len(self.done()), self.n_shards))
+
+    @property
+    def n_shards(self):
+        """int: The total number of shards of the dataset."""
+        return -(-self.config['n_samples'] // self.config['shard_size'])
+
+    @staticmethod
+    def shard_name(k):
+        """The file name of the shard `k`."""
+        return 'shard_{:05d}.h5'.format(k)
+
+    def shard_indices(self, k):
+        """The indices of the samples of the shard `k`."""
+        size = self.config['shard_size']
+        return list(range(k*size, min((k + 1)*size, self.config['n_samples'])))
+
+    def done(self):
+        """list of str: The shards complete."""
+        return [name for name, shard in self.shards.items()
+                if shard['status'] == 'done'
+                and os.path.isfile(os.path.join(self.output_dir, name))]
+
+    def pending(self):
+        """list of int: The shards to compute."""
+        done = set(self.done())
+        return [k for k in range(self.n_shards)
+                if self.shard_name(k) not in done]
+
+    def update(self, name, **state):
+        """Record the state of a shard and save the manifest."""
+        self.shards[name] = state
+        self.save()
+
+    def save(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.output_dir, suffix='.json.tmp')
+        with os.fdopen(fd, 'w') as file:
+            json.dump({'version': DATASET_VERSION, 'config': self.config,
+                       'shards': dict(sorted(self.shards.items()))},
+                      file, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def generate_dataset(output_dir, family, n_samples, shard_size=256, seed=0,
+                     frequencies=np.arange(50, 3000, 2.), n_peaks=8,
+                     temperature=25, sound_duration=None, samplerate=44100,
+                     player='TUTORIAL_REED', jobs=None, progress=True,
+                     max_retries=2):
+    """
+    Generate (or resume the generation of) a sharded dataset.
+
+    Parameters
+    ----------
+    output_dir : str
+        The directory of the dataset, created if needed.
+    family : :py:class:`BoreFamily`
+        The family of the instruments.
+    n_samples : int
+        The total number of instruments.
+    shard_size : int, optional
+        The number of instruments per shard (and per task of the pool).
+        Default is 256.
+    seed : int, optional
+        The seed of the random generator. The instrument `i` is drawn from
+        the seed `[seed, i]`. Default is 0.
+    frequencies : array of float, optional
+        The frequency axis of the impedances. Default is 50 to 3000 Hz by
+        2 Hz.
+    n_peaks : int, optional
+        The number of resonances kept. Default is 8.
+    temperature : float, optional
+        The temperature in °C. Default is 25.
+    sound_duration : float, optional
+        The duration of the simulated sound of each instrument, in s. Default
+        is None (no simulation).
+    samplerate : int, optional
+        The sample rate of the sounds. Default is 44100.
+    player : str, optional
+        The name of the player of the simulations. Default is 'TUTORIAL_REED'.
+    jobs : int, optional
+        The number of worker processes. Default is None (number of CPUs).
+    progress : bool, optional
+        Print the progression after each shard. Default is True.
+    max_retries : int, optional
+        The number of times a shard whose worker crashed is computed again
+        in a new worker before being flagged as failed. Default is 2.
+
+    Returns
+    -------
+    :py:class:`DatasetManifest`
+        The manifest of the dataset.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    options = dict(frequencies=np.asarray(frequencies, dtype=float).tolist(),
+                   n_peaks=n_peaks, temperature=temperature,
+                   sound_duration=sound_duration, samplerate=samplerate,
+                   player=player)
+    config = dict(family=family.to_dict(), n_samples=n_samples,
+                  shard_size=shard_size, seed=seed, options=options)
+    manifest = DatasetManifest(output_dir, config)
+    pending = manifest.pending()
+    n_total = len(pending)
+    tic = time.perf_counter()
+    n_done = 0
+
+    def report(name, state):
+        if progress:
+            elapsed = time.perf_counter() - tic
+            eta = elapsed / n_done * (n_total - n_done) if n_done else np.nan
+            print('[{}/{} shards] {} {}: {} samples, {} failed ({:.1f}s), '
+                  'ETA {:.0f}s'.format(n_done, n_total, name, state['status'],
+                                       state.get('n_samples', 0),
+                                       state.get('n_failed', 0),
+                                       state.get('duration', 0), eta),
+                  file=sys.stderr, flush=True)
+
+    # one single-worker pool per concurrent shard: a worker which dies only
+    # breaks the pool of its own shard
+    queue = collections.deque(pending)
+    n_slots = max(1, min(jobs or os.cpu_count() or 1, len(queue)))
+    executors = [ProcessPoolExecutor(max_workers=1) for _ in range(n_slots)]
+    free = list(range(n_slots))
+    running = dict()
+    crashes = dict()
+    try:
+        while queue or running:
+            while queue and free:
+                k = queue.popleft()
+                slot = free.pop()
+                future = executors[slot].submit(
+                    _compute_shard,
+                    os.path.join(output_dir, manifest.shard_name(k)),
+                    manifest.shard_indices(k), config['family'], seed, options)
+                running[future] = (k, slot)
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                k, slot = running.pop(future)
+                free.append(slot)
+                name = manifest.shard_name(k)
+                try:
+                    state = dict(status='done', **future.result())
+                except BrokenProcessPool:
+                    # its worker died (e.g. out of memory): new worker, retry
+                    executors[slot].shutdown(wait=False)
+                    executors[slot] = ProcessPoolExecutor(max_workers=1)
+                    crashes[k] = crashes.get(k, 0) + 1
+                    if crashes[k] <= max_retries:
+                        queue.append(k)
+                        continue
+                    state = dict(status='failed',
+                                 error='The worker process terminated abruptly '
+                                       '({} times).'.format(crashes[k]))
+                except Exception:
+                    state = dict(status='failed', error=traceback.format_exc())
+                n_done += 1
+                manifest.update(name, first_index=manifest.shard_indices(k)[0],
+                                **state)
+                report(name, state)
+    finally:
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+    return manifest
+
+
+def load_dataset(output_dir, keys=('params', 'impedance'), include_failed=False):
+    """
+    Load the complete shards of a dataset in memory.
+
+    Parameters
+    ----------
+    output_dir : str
+        The directory of the dataset.
+    keys : list of str, optional
+        The datasets read in each shard. Default is ('params', 'impedance').
+    include_failed : bool, optional
+        Keep the instruments whose computation failed (filled with NaN).
+        Default is False.
+
+    Returns
+    -------
+    data : dict
+        The concatenated arrays, with also the 'index' of the samples.
+    attrs : dict
+        The 'frequencies' and the 'param_labels'.
+    """
+    import h5py
+
+    with open(os.path.join(output_dir, MANIFEST)) as file:
+        shards = json.load(file)['shards']
+    names = sorted(name for name, shard in shards.items()
+                   if shard['status'] == 'done')
+    data = {key: list() for key in ('index',) + tuple(keys)}
+    attrs = dict()
+    for name in names:
+        with h5py.File(os.path.join(output_dir, name), 'r') as file:
+            keep = slice(None) if include_failed else ~file['failed'][:]
+            for key in data:
+                data[key].append(file[key][:][keep])
+            attrs['frequencies'] = file['frequencies'][:]
+            labels = json.loads(file.attrs['param_labels'])
+            if labels:
+                attrs['param_labels'] = labels
+    data = {key: np.concatenate(val) if val else np.zeros(0)
+            for key, val in data.items()}
+    return data, attrs
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ensemble time integration: several variants of a player in one simulation.
+
+Convergence or parameter studies run the same temporal scheme many times, on
+the same mesh and with the same time step, only the control parameters of the
+:py:class:`Player<openwind.technical.player.Player>` changing. Each step of
+the scheme is a short sequence of small sparse products and scalar updates,
+dominated by the Python overhead. :py:class:`EnsembleTemporalSolver`
+advances `N` variants together: the state of each component has a last axis
+of length `N` (the pipes store `(n_dof, N)` arrays), the sparse
+matrix-vector products become sparse times dense-block products and the
+parameters of the excitator become vectors.
+
+.. code-block:: python
+
+    variants = curve_grid(gamma=[0.35, 0.4, 0.45], zeta=[0.3, 0.4])
+    t_solver = EnsembleTemporalSolver(instru_physics, variants, l_ele=0.1,
+                                      order=4)
+    rec = RecordingDevice()
+    t_solver.run_simulation(0.5, callback=rec.callback)
+    rec.stop_recording()
+    rec.values['bell_radiation_pressure'][:, k]   # variant k
+
+Each variant follows exactly the computation of its own
+:py:class:`TemporalSolver<openwind.temporal.temporal_solver.TemporalSolver>`.
+The supported components are the lossless and 'diffrepr' pipes, the
+junctions, the radiations, the reeds and the flow or pressure conditions; the
+flute (delay line and noise) and the tonehole components are not. The
+energies of the pipes are not computed per variant (no `energy_check`, no
+`record_energy`).
+"""
+
+import contextlib
+
+import numpy as np
+
+try:
+    # the in-place kernel of scipy's CSR products: `matrix @ X` allocates and
+    # checks its operands, which costs more than the product on small pipes
+    from scipy.sparse._sparsetools import csr_matvecs
+except ImportError:  # private to scipy, it may move
+    csr_matvecs = None
+
+from openwind.continuous import (EndPos, ThermoviscousDiffusiveRepresentation,
+                                 ThermoviscousLossless)
+from openwind.temporal import TemporalSolver
+from openwind.temporal.tflow_condition import TemporalFlowCondition
+from openwind.temporal.tjunction import (TemporalJunction,
+                                         TemporalJunctionDiscontinuity,
+                                         TemporalJunctionSwitch)
+from openwind.temporal.tpipe import TemporalPipe, TemporalPipeEnd
+from openwind.temporal.tpipe_lossy import TemporalLossyPipe
+from openwind.temporal.tpressure_condition import TemporalPressureCondition
+from openwind.temporal.tradiation import TemporalRadiation
+from openwind.temporal.treed1dof_scaled import TemporalReed1dofScaled
+from openwind.temporal.tsimplejunction import TemporalSimpleJunction
+
+
+class StackedCurve:
+    """
+    The curves of the variants of a control parameter, as one curve.
+
+    Each distinct curve is evaluated once per call, whatever the number of
+    variants sharing it.
+
+    Parameters
+    ----------
+    curves : list of (float or callable)
+        The value or time function of each variant.
+    """
+
+    def __init__(self, curves):
+        self.curves = list(curves)
+        unique = dict()
+        self._index = np.array([unique.setdefault(id(curve), len(unique))
+                                for curve in self.curves])
+        self._unique = list({id(curve): curve
+                             for curve in self.curves}.values())
+
+    def __repr__(self):
+        return '<tapas.ensemble.StackedCurve({})>'.format(self.curves)
+
+    def __call__(self, t):
+        values = np.array([curve(t) if callable(curve) else curve
+                           for curve in self._unique], dtype=float)
+        return values[self._index]
+
+
+def stack_curves(control_parameters, variants):
+    """
+    Stack the curves of the variants of a player.
+
+    Parameters
+    ----------
+    control_parameters : dict
+        The curves of the player, used when a variant does not override them.
+    variants : list of dict
+        For each variant, the curves to override, as `{label: curve}`.
+
+    Returns
+    -------
+    dict
+        For each label overridden by at least one variant, the array of the
+        values (constant curves) or a :py:class:`StackedCurve`. The labels on
+        which all the variants agree keep their value.
+    """
+    labels = list(dict.fromkeys(label for variant in variants
+                                for label in variant))
+    stacked = dict()
+    for label in labels:
+        values = [variant.get(label, control_parameters.get(label))
+                  for variant in variants]
+        if any(value is None for value in values):
+            raise ValueError("The curve '{}' is not given to all the variants."
+                             .format(label))
+        if all(value is values[0] for value in values):
+            stacked[label] = values[0]
+        elif any(callable(value) for value in values):
+            stacked[label] = StackedCurve(values)
+        elif all(isinstance(value, str) for value in values):
+            if len(set(values)) > 1:
+                raise ValueError("The curve '{}' can not differ between the "
+                                 "variants: {}".format(label, values))
+            stacked[label] = values[0]
+        else:
+            stacked[label] = np.array(values, dtype=float)
+    return stacked
+
+
+class EnsemblePipeEnd(TemporalPipeEnd):
+    """A :py:class:`TemporalPipeEnd` whose flow is a vector of variants."""
+
+    __slots__ = ()
+
+    def update_flow(self, flow):
+        self._assert_updated(False)
+        self._updated = True
+        self._w_nph = flow
+
+
+def _set_ensemble_ends(t_pipe):
+    t_pipe.end_minus = EnsemblePipeEnd(t_pipe, EndPos.MINUS)
+    t_pipe.end_plus = EnsemblePipeEnd(t_pipe, EndPos.PLUS)
+
+
+def _matvecs(matrix, X, Y):
+    """Y += matrix @ X, for the C-ordered blocks X and Y (as `csr_matvec`)."""
+    if csr_matvecs is None:
+        Y += matrix @ X
+        return
+    csr_matvecs(matrix.shape[0], matrix.shape[1], X.shape[1], matrix.indptr,
+                matrix.indices, matrix.data, X, Y)
+
+
+class EnsemblePipe(TemporalPipe):
+    """A lossless :py:class:`TemporalPipe` advancing `(n_dof, N)` states."""
+
+    def __init__(self, pipe, t_solver, **params):
+        super().__init__(pipe, t_solver, **params)
+        _set_ensemble_ends(self)
+
+    def reset_variables(self):
+        n_variants = self._t_solver.n_variants
+        self.PV = (np.zeros((self.nH1, n_variants)),
+                   np.zeros((self.nL2, n_variants)))
+        self._V_prev = np.zeros((self.nL2, n_variants))
+        self.dtinvMBtV = np.zeros((self.nH1, n_variants))
+        self.end_minus.reset_variables()
+        self.end_plus.reset_variables()
+
+    def one_step(self, check_scheme=False):
+        # as TemporalPipe.one_step(), on the blocks of variants
+        P_old, V_old = self.PV
+        P = P_old - self.dtinvMBtV
+        P[0] += self.end_minus.accept_contribution()
+        P[-1] += self.end_plus.accept_contribution()
+        V = V_old.copy()
+        _matvecs(self.dtinvML2B, P, V)
+        self.dtinvMBtV[:] = 0
+        _matvecs(self.dtinvMBt, V, self.dtinvMBtV)
+        self.PV = P, V
+        self._V_prev = V_old
+
+
+class EnsembleLossyPipe(TemporalLossyPipe):
+    """
+    A :py:class:`TemporalLossyPipe` ('diffrepr' losses) advancing
+    `(n_dof, N)` states.
+
+    The auxiliary variables `Pi` and `Vi` are of shape `(n_loss, n_dof, N)`.
+    """
+
+    def __init__(self, pipe, t_solver, **params):
+        super().__init__(pipe, t_solver, **params)
+        _set_ensemble_ends(self)
+
+    def _precompute_matrices(self):
+        super()._precompute_matrices()
+        # the coefficients broadcast on the variants
+        self._coefs = {name: getattr(self, name)[..., np.newaxis]
+                       for name in ['p_to_p_noflow', 'p0_to_p_noflow',
+                                    'pi_to_p_noflow', 'p_to_p0', 'p0_to_p0',
+                                    'pi_to_p0', 'p_to_pi', 'pi_to_pi',
+                                    'v_to_v', 'vi_to_v', 'v_to_vi',
+                                    'vi_to_vi']}
+
+    def reset_variables(self):
+        n_variants = self._t_solver.n_variants
+        self.PV = (np.zeros((self.nH1, n_variants)),
+                   np.zeros((self.nL2, n_variants)))
+        self.dtinvMBtV = np.zeros((self.nH1, n_variants))
+        self.end_minus.reset_variables()
+        self.end_plus.reset_variables()
+        self._P0 = np.zeros((self.nH1, n_variants))
+        self._Pi = np.zeros((self._loss_N, self.nH1, n_variants))
+        self._Vi = np.zeros((self._loss_N, self.nL2, n_variants))
+        self._V_prev = np.zeros((self.nL2, n_variants))
+        self._Vi_prev = np.zeros_like(self._Vi)
+        self._next_p_no_flow = np.zeros((self.nH1, n_variants))
+
+    def one_step(self, check_scheme=False):
+        # as TemporalLossyPipe.one_step(), on the blocks of variants
+        coefs = self._coefs
+        P, V = self.PV
+        P0 = self._P0
+        Pi = self._Pi
+        Vi = self._Vi
+
+        P_nph = self.get_p_no_flow().copy()
+        P_nph[0] = self.end_minus.accept_q_nph()
+        P_nph[-1] = self.end_plus.accept_q_nph()
+
+        P_next = 2*P_nph
+        P_next -= P
+
+        P0_next = P+P_next
+        P0_next *= coefs['p_to_p0']
+        P0_next += coefs['p0_to_p0'] * P0
+        P0_next += np.add.reduce(coefs['pi_to_p0'] * Pi, axis=0)
+
+        Pi_next = coefs['p_to_pi'] * (P + P_next - P0 - P0_next)
+        Pi_next += coefs['pi_to_pi'] * Pi
+
+        V_next = np.add.reduce(coefs['vi_to_v'] * Vi, axis=0)
+        _matvecs(self.p_to_v, P_next, V_next)
+        V_next += coefs['v_to_v'] * V
+
+        Vi_next = coefs['v_to_vi'] * (V + V_next)
+        Vi_next += coefs['vi_to_vi'] * Vi
+
+        self.PV = (P_next, V_next)
+        self._V_prevprev, self._Vi_prevprev = self._V_prev, self._Vi_prev
+        self._P_prev, self._P0_prev, self._Pi_prev = P, P0, Pi
+        self._V_prev, self._Vi_prev = V, Vi
+        self._P0, self._Pi, self._Vi = P0_next, Pi_next, Vi_next
+
+        self._compute_next_p_no_flow()
+
+    def _compute_next_p_no_flow(self):
+        coefs = self._coefs
+        P, V = self.PV
+        self._next_p_no_flow = (coefs['p_to_p_noflow'] * P
+                                + coefs['p0_to_p_noflow'] * self._P0
+                                + np.add.reduce(coefs['pi_to_p_noflow']
+                                                * self._Pi, axis=0))
+        _matvecs(self.v_to_p_noflow, V, self._next_p_no_flow)
+
+
+class EnsembleJunction(TemporalJunction):
+    """A :py:class:`TemporalJunction` with `(2, N)` internal variables."""
+
+    def reset_variables(self):
+        n_variants = self._t_solver.n_variants
+        self._gamma = np.zeros((2, n_variants))
+        self._P_corr = np.zeros((3, n_variants))
+
+
+class EnsembleJunctionDiscontinuity(TemporalJunctionDiscontinuity):
+    """A :py:class:`TemporalJunctionDiscontinuity` with `(1, N)` internal
+    variables."""
+
+    def reset_variables(self):
+        n_variants = self._t_solver.n_variants
+        self._gamma = np.zeros((1, n_variants))
+        self._P_corr = np.zeros((2, n_variants))
+
+
+class EnsembleJunctionSwitch(TemporalJunctionSwitch):
+    """A :py:class:`TemporalJunctionSwitch` with `(1, N)` internal
+    variables."""
+
+    def reset_variables(self):
+        n_variants = self._t_solver.n_variants
+        self._gamma = np.zeros((1, n_variants))
+        self._P_corr = np.zeros((3, n_variants))
+
+    def _update_flows(self, gamma_b):
+        u = -self.T_J[0][:, np.newaxis]*gamma_b[0]  # flow convention
+        self._end1.update_flow(u[0])
+        self._end2.update_flow(u[1])
+        self._end3.update_flow(u[2])
+
+
+class EnsembleRadiation(TemporalRadiation):
+    """A :py:class:`TemporalRadiation` with one internal variable per
+    variant."""
+
+    def reset_variables(self):
+        self._zeta = np.zeros(self._t_solver.n_variants)
+
+
+class EnsembleReed1dofScaled(TemporalReed1dofScaled):
+    """
+    A :py:class:`TemporalReed1dofScaled` whose position is a vector of
+    variants.
+
+    Its scheme is written with element-wise operations: the parameters of the
+    reed can be vectors.
+    """
+
+    def reset_variables(self):
+        super().reset_variables()
+        n_variants = self._t_solver.n_variants
+        self.y = np.ones(n_variants)
+        self._last_last_y = self.y
+        self._last_y = self.y
+        self._this_y = self.y
+        self._prev_z = np.zeros(n_variants)
+        self._next_z = np.zeros(n_variants)
+
+    def get_maximal_dt(self):
+        return np.min(super().get_maximal_dt())
+
+
+ENSEMBLE_CONNECTORS = {
+    TemporalJunction: EnsembleJunction,
+    TemporalJunctionDiscontinuity: EnsembleJunctionDiscontinuity,
+    TemporalJunctionSwitch: EnsembleJunctionSwitch,
+    TemporalRadiation: EnsembleRadiation,
+    TemporalReed1dofScaled: EnsembleReed1dofScaled,
+    # already written with element-wise operations
+    TemporalSimpleJunction: TemporalSimpleJunction,
+    TemporalPressureCondition: TemporalPressureCondition,
+    TemporalFlowCondition: TemporalFlowCondition,
+}
+"""dict: The class used by the ensemble for each temporal connector."""
+
+
+class EnsembleTemporalSolver(TemporalSolver):
+    """
+    A temporal solver advancing several variants of the player together.
+
+    The variants share the instrument, the mesh and the time step; they
+    differ by some curves of the player. The recorded values (see
+    :py:class:`RecordingDevice\
+    <openwind.temporal.recording_device.RecordingDevice>`) are vectors: with
+    `RecordingDevice`, `rec.values[key]` is of shape `(n_steps, N)`.
+
+    Parameters
+    ----------
+    instru_physics : :py:class:`InstrumentPhysics<openwind.continuous.instrument_physics.InstrumentPhysics>`
+        The instrument, with its player.
+    variants : list of dict
+        For each variant, the curves of the player to override, as
+        `{label: curve}` (see `Player.update_curve()` and
+        :py:func:`curve_grid<tapas.sweep.curve_grid>`).
+    **kwargs : keyword arguments
+        Options of :py:class:`TemporalSolver\
+        <openwind.temporal.temporal_solver.TemporalSolver>` (`cfl_alpha`,
+        `theta_scheme_parameter`, discretization...). The time step respects
+        the CFL condition of all the variants.
+
+    Attributes
+    ----------
+    variants : list of dict
+        The variants.
+    n_variants : int
+        Their number.
+    curves : dict
+        The curves of the player set during the simulations, with a vector of
+        values or a :py:class:`StackedCurve` for each varying curve.
+    """
+
+    def __init__(self, instru_physics, variants, **kwargs):
+        self.variants = [dict(variant) for variant in variants]
+        self.n_variants = len(self.variants)
+        if self.n_variants == 0:
+            raise ValueError('At least one variant is needed.')
+        player = instru_physics.player
+        self.curves = stack_curves(player.control_parameters, self.variants)
+        self.instru_physics = instru_physics
+        with self._stacked_player():
+            super().__init__(instru_physics, **kwargs)
+
+    def __repr__(self):
+        return ("<tapas.ensemble.EnsembleTemporalSolver({} variants, dt={}, "
+                "{} pipes)>".format(self.n_variants, self.get_dt(),
+                                    len(self.t_pipes)))
+
+    @contextlib.contextmanager
+    def _stacked_player(self):
+        """Set the stacked curves to the player, and restore its curves."""
+        player = self.instru_physics.player
+        original = dict(player.control_parameters)
+        try:
+            for label, curve in self.curves.items():
+                player.update_curve(label, curve)
+            self.instru_physics._update_player()
+            yield
+        finally:
+            player.control_parameters.clear()
+            player.control_parameters.update(original)
+            self.instru_physics._update_player()
+
+    def _convert_pipe(self, pipe):
+        losses = pipe.get_losses()
+        if isinstance(losses, ThermoviscousDiffusiveRepresentation):
+            return EnsembleLossyPipe(pipe, t_solver=self, **self.discr_params)
+        if isinstance(losses, ThermoviscousLossless):
+            return EnsemblePipe(pipe, t_solver=self, **self.discr_params)
+        raise ValueError("The ensemble only supports losses = {False, "
+                         "'diffrepr'}.")
+
+    def _convert_connector(self, connector, ends):
+        t_connector = super()._convert_connector(connector, ends)
+        if type(t_connector) not in ENSEMBLE_CONNECTORS:
+            raise ValueError('The ensemble does not support the component {}.'
+                             .format(type(t_connector).__name__))
+        # the ensemble classes only override methods: the component built by
+        # openwind is kept, with its variables of the ensemble
+        t_connector.__class__ = ENSEMBLE_CONNECTORS[type(t_connector)]
+        t_connector.reset_variables()
+        return t_connector
+
+    def run_simulation_steps(self, n_steps, callback=None,
+                             enable_tracker_display=True, energy_check=False):
+        if energy_check:
+            raise ValueError('The energy check is not available for an '
+                             'ensemble.')
+        with self._stacked_player():
+            super().run_simulation_steps(n_steps, callback,
+                                         enable_tracker_display)
+
+    def variant_values(self, values, index):
+        """
+        The recorded values of one variant.
+
+        Parameters
+        ----------
+        values : dict
+            The recorded values (`RecordingDevice.values`), of shape
+            `(n_steps, N)`; the values of shape `(n_steps,)`, common to all
+            the variants, are kept.
+        index : int
+            The index of the variant.
+
+        Returns
+        -------
+        dict
+            The values of the variant, of shape `(n_steps,)`.
+        """
+        values = {key: np.asarray(value) for key, value in values.items()}
+        return {key: value[:, index] if value.ndim > 1 else value
+                for key, value in values.items()}
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Timings of the sparse factorizations of the frequential computations.
+
+The matrix of a :py:class:`FrequentialSolver\
+<openwind.frequential.frequential_solver.FrequentialSolver>` is factorized
+by SuperLU for every frequency: with `spsolve` in the solver, with `splu`
+(and several solves with the factors) in :py:class:`InverseFrequentialResponse\
+<openwind.inversion.inverse_frequential_response.InverseFrequentialResponse>`.
+The :py:class:`FactorizationTimer` counts these calls and their durations,
+so that the share of the factorizations in a solve or in a step of an
+inversion is known:
+
+.. code-block:: python
+
+    f_solver = TimedFrequentialSolver(instru_phy, frequencies)
+    f_solver.solve()
+    f_solver.timer.timings
+    # {'analysis': 0.0, 'factorization': 0.21, 'solve': 0.0}
+
+    inverse = TimedInverseFrequentialResponse(instru_phy, frequencies,
+                                              Z_target, notes=notes)
+    inverse.optimize_freq_model()
+    inverse.timings
+    # {'update': 1.3, 'evaluation': 28.4, 'analysis': 0.0,
+    #  'factorization': 0.9, 'solve': 0.3}
+
+The calls of openwind are wrapped only during the public methods of these
+classes (`solve()`, `modify_parts()`, `get_cost_grad_hessian()`,
+`residuals_jacobian()`), and only for the thread calling them: the
+computations are the ones of openwind.
+
+SuperLU, the default backend, analyses the sparsity pattern again for every
+frequency, and scipy does not expose the reuse of this analysis (its
+`SamePattern` mode). With `backend='pardiso'` (it needs the optional package
+`pypardiso`), the factorizations are done by the
+:py:class:`PardisoFactorization`, which keeps the symbolic analysis while the
+sparsity pattern does not change (for all the frequencies, and for all the
+steps of an inversion which do not change the mesh), and the timings are
+split between 'analysis', 'factorization' and 'solve':
+
+.. code-block:: python
+
+    inverse = TimedInverseFrequentialResponse(instru_phy, frequencies,
+                                              Z_target, notes=notes,
+                                              backend='pardiso')
+
+On the meshes of openwind (a few hundred to a few thousand degrees of
+freedom), the analysis is 1 to 2% of the time of the factorizations, and the
+numerical factorizations of PARDISO alone are as long as the whole ones of
+SuperLU, whose order of the degrees of freedom ('NATURAL') is already
+fill-minimal: SuperLU stays the default, the counters show the share of the
+analysis on other meshes.
+"""
+
+import contextlib
+import importlib
+import threading
+import time
+import warnings
+
+import numpy as np
+from scipy.sparse import issparse
+
+from openwind import FrequentialSolver
+from openwind.inversion import InverseFrequentialResponse
+
+
+FACTORIZATION_CALLS = [('openwind.frequential.frequential_solver', 'spsolve'),
+                       ('openwind.inversion.inverse_frequential_response',
+                        'splu')]
+"""list of tuple: The modules of openwind and the functions they factorize
+with."""
+
+BACKENDS = ['superlu', 'pardiso']
+"""list: The sparse solvers of the factorizations."""
+
+_lock = threading.RLock()
+
+
+class _TimedLU:
+    """A `SuperLU` object whose solves are timed."""
+
+    def __init__(self, lu, timer):
+        self._lu = lu
+        self._timer = timer
+
+    def __getattr__(self, name):
+        return getattr(self._lu, name)
+
+    def solve(self, *args, **kwargs):
+        tic = time.perf_counter()
+        solution = self._lu.solve(*args, **kwargs)
+        self._timer._add('solve', time.perf_counter() - tic)
+        return solution
+
+
+class _PardisoLU:
+    """The factors of a matrix by :py:class:`PardisoFactorization`."""
+
+    def __init__(self, factorization, matrix):
+        self._factorization = factorization
+        self._matrix = matrix
+        self._number = factorization.n_factorizations
+        self.shape = matrix.shape
+
+    def solve(self, rhs, trans='N'):
+        """
+        Solve the system, as `SuperLU.solve()`.
+
+        Parameters
+        ----------
+        rhs : array
+            The right-hand side(s).
+        trans : {'N', 'T', 'H'}, optional
+            Solve with the matrix, its transpose or its conjugate transpose.
+            Default is 'N'.
+        """
+        if self._number != self._factorization.n_factorizations:
+            raise RuntimeError('The factors were replaced by the ones of '
+                               'another matrix.')
+        return self._factorization._solve(self._matrix, rhs, trans)
+
+
+class PardisoFactorization:
+    """
+    Sparse LU factorizations by PARDISO, keeping the symbolic analysis.
+
+    The analysis (fill-reducing order, matching and elimination tree) is done
+    for the first matrix of a sparsity pattern, and kept for the next
+    matrices with the same pattern, which are only factorized numerically.
+    :py:meth:`spsolve` and :py:meth:`splu` are used as the functions of
+    scipy: the factors of only one matrix are kept, the ones given by
+    :py:meth:`splu` can not be used after the next factorization.
+
+    It needs the optional package `pypardiso` (and MKL).
+
+    Parameters
+    ----------
+    timer : :py:class:`FactorizationTimer`, optional
+        The counters of the analyses, factorizations and solves.
+
+    Attributes
+    ----------
+    n_analyses : int
+        The number of symbolic analyses.
+    n_factorizations : int
+        The number of numerical factorizations.
+    """
+
+    TRANS = dict(N=0, T=2, H=1)
+    """dict: The values of `iparm(12)` of PARDISO for the solves."""
+
+    def __init__(self, timer=None):
+        try:
+            from pypardiso import PyPardisoSolver
+        except ImportError as err:
+            msg = "the backend 'pardiso' requires pypardiso."
+            raise ImportError(msg) from err
+        # complex and nonsymmetric matrices
+        self._solver = PyPardisoSolver(mtype=13)
+        self._timer = timer
+        self._pattern = None
+        self.n_analyses = 0
+        self.n_factorizations = 0
+
+    def __repr__(self):
+        return ("<tapas.factorization.PardisoFactorization({} analyses, {} "
+                "factorizations)>".format(self.n_analyses,
+                                          self.n_factorizations))
+
+    def _call(self, stage, phase, matrix, rhs):
+        self._solver.set_phase(phase)
+        tic = time.perf_counter()
+        solution = self._solver._call_pardiso(matrix, rhs)
+        if self._timer is not None:
+            self._timer._add(stage, time.perf_counter() - tic)
+        return solution
+
+    def splu(self, A, **kwargs):
+        """
+        Factorize the matrix, as :py:func:`scipy.sparse.linalg.splu`.
+
+        The options of scipy (`permc_spec`...) are ignored.
+
+        Parameters
+        ----------
+        A : sparse matrix
+            The square matrix.
+
+        Returns
+        -------
+        :py:class:`_PardisoLU`
+            The factors, with a method `solve()`.
+        """
+        matrix = A.tocsr().astype(np.complex128, copy=False)
+        if not matrix.has_sorted_indices:
+            matrix = matrix.sorted_indices()
+        no_rhs = np.zeros((matrix.shape[0], 1), dtype=np.complex128,
+                          order='F')
+        if (self._pattern is None
+                or not np.array_equal(self._pattern[0], matrix.indptr)
+                or not np.array_equal(self._pattern[1], matrix.indices)):
+            if self._pattern is not None:
+                self.free_memory()
+            # the matching and the scaling depend on the values of the matrix
+            self._call('analysis', 11, matrix, no_rhs)
+            self._pattern = (matrix.indptr.copy(), matrix.indices.copy())
+            self.n_analyses += 1
+        self._call('factorization', 22, matrix, no_rhs)
+        self.n_factorizations += 1
+        return _PardisoLU(self, matrix)
+
+    def spsolve(self, A, b, **kwargs):
+        """
+        Solve the system, as :py:func:`scipy.sparse.linalg.spsolve`.
+
+        Parameters
+        ----------
+        A : sparse matrix
+            The square matrix.
+        b : array or sparse matrix
+            The right-hand side(s).
+
+        Returns
+        -------
+        array
+            The solution, of shape (n,) if `b` is a vector.
+        """
+        b = b.toarray() if issparse(b) else np.asarray(b)
+        solution = self.splu(A).solve(b)
+        return solution.ravel() if b.ndim == 1 or b.shape[1] == 1 else solution
+
+    def _solve(self, matrix, rhs, trans):
+        if trans not in self.TRANS:
+            raise ValueError("Unknown trans '{}', chose between {}"
+                             .format(trans, list(self.TRANS)))
+        rhs = np.asarray(rhs)
+        columns = np.asfortranarray(rhs.reshape(matrix.shape[0], -1),
+                                    dtype=np.complex128)
+        self._solver.set_iparm(12, self.TRANS[trans])
+        try:
+            solution = self._call('solve', 33, matrix, columns)
+        finally:
+            self._solver.set_iparm(12, 0)
+        return solution.reshape(rhs.shape)
+
+    def free_memory(self):
+        """Release the analysis and the factors kept by PARDISO."""
+        self._solver.free_memory(everything=True)
+        self._pattern = None
+
+
+class FactorizationTimer:
+    """
+    Counters of the sparse factorizations and solves done by openwind.
+
+    Parameters
+    ----------
+    backend : {'superlu', 'pardiso'}, optional
+        The sparse solver: the one of openwind (SuperLU), or a
+        :py:class:`PardisoFactorization` keeping the symbolic analysis.
+        Default is 'superlu'.
+
+    Attributes
+    ----------
+    timings : dict
+        The cumulated durations (in s) of the symbolic analyses ('analysis',
+        only done apart by PARDISO: SuperLU does it in each factorization),
+        of the factorizations ('factorization', including the solve of
+        `spsolve` with SuperLU) and of the solves with the factors ('solve').
+    counts : dict
+        The number of analyses, factorizations and solves.
+    backend : :py:class:`PardisoFactorization` or None
+        The factorizations by PARDISO, None with SuperLU.
+    """
+
+    def __init__(self, backend='superlu'):
+        if backend not in BACKENDS:
+            raise ValueError("Unknown backend '{}', chose between {}"
+                             .format(backend, BACKENDS))
+        self.timings = dict(analysis=0., factorization=0., solve=0.)
+        self.counts = dict(analysis=0, factorization=0, solve=0)
+        self.backend = None
+        if backend == 'pardiso':
+            self.backend = PardisoFactorization(self)
+        self._depth = 0
+
+    def __repr__(self):
+        return ("<tapas.factorization.FactorizationTimer({} factorizations, "
+                "{:.3f}s)>".format(self.counts['factorization'],
+                                   self.timings['factorization']))
+
+    def reset_timings(self):
+        """Set the timings and the counts to zero."""
+        self.timings = dict.fromkeys(self.timings, 0.)
+        self.counts = dict.fromkeys(self.counts, 0)
+
+    def _add(self, stage, duration):
+        self.timings[stage] += duration
+        self.counts[stage] += 1
+
+    def _timed(self, function):
+        def timed(*args, **kwargs):
+            tic = time.perf_counter()
+            result = function(*args, **kwargs)
+            self._add('factorization', time.perf_counter() - tic)
+            return _TimedLU(result, self) if hasattr(result, 'solve') else result
+        return timed
+
+    def _replacement(self, name, original):
+        if self.backend is None:
+            function = self._timed(original)
+        else:
+            function = getattr(self.backend, name)
+        thread = threading.get_ident()
+
+        def replacement(*args, **kwargs):
+            if threading.get_ident() != thread:
+                return original(*args, **kwargs)
+            return function(*args, **kwargs)
+        return replacement
+
+    @contextlib.contextmanager
+    def recording(self):
+        """
+        Count the factorizations of openwind in this context.
+
+        The functions of openwind are replaced in their modules, for the whole
+        process: the other threads still call the original ones, but they wait
+        for the end of the context to record their own factorizations (the
+        timed solves of several threads are not concurrent). The contexts can
+        be nested. If openwind does not call a function of
+        :py:data:`FACTORIZATION_CALLS` any more, it is not counted (with a
+        warning).
+        """
+        with _lock:
+            self._depth += 1
+            patched = list()
+            try:
+                if self._depth == 1:
+                    for module_name, name in FACTORIZATION_CALLS:
+                        module = importlib.import_module(module_name)
+                        original = getattr(module, name, None)
+                        if original is None:
+                            warnings.warn('{}.{} is not found: its '
+                                          'factorizations are not counted.'
+                                          .format(module_name, name))
+                            continue
+                        setattr(module, name,
+                                self._replacement(name, original))
+                        patched.append((module, name, original))
+                yield self
+            finally:
+                for module, name, original in patched:
+                    setattr(module, name, original)
+                self._depth -= 1
+
+
+class TimedFrequentialSolver(FrequentialSolver):
+    """
+    A :py:class:`FrequentialSolver<openwind.frequential.frequential_solver.FrequentialSolver>`
+    counting the factorizations of its solves.
+
+    Parameters
+    ----------
+    instru_physics, frequencies, **kwargs :
+        See :py:class:`FrequentialSolver\
+        <openwind.frequential.frequential_solver.FrequentialSolver>`.
+    backend : {'superlu', 'pardiso'}, optional
+        The sparse solver, see :py:class:`FactorizationTimer`. Default is
+        'superlu'.
+
+    Attributes
+    ----------
+    timer : :py:class:`FactorizationTimer`
+        The counters, kept between the solves.
+    """
+
+    def __init__(self, instru_physics, frequencies, backend='superlu',
+                 **kwargs):
+        self.timer = FactorizationTimer(backend)
+        super().__init__(instru_physics, frequencies, **kwargs)
+
+    def solve(self, *args, **kwargs):
+        with self.timer.recording():
+            return super().solve(*args, **kwargs)
+
+
+class TimedInverseFrequentialResponse(InverseFrequentialResponse):
+    """
+    An :py:class:`InverseFrequentialResponse<openwind.inversion.inverse_frequential_response.InverseFrequentialResponse>`
+    timing the stages of the inversion.
+
+    Parameters
+    ----------
+    instru_physics, frequencies, target_impedances, **kwargs :
+        See :py:class:`InverseFrequentialResponse\
+        <openwind.inversion.inverse_frequential_response.InverseFrequentialResponse>`.
+    backend : {'superlu', 'pardiso'}, optional
+        The sparse solver, see :py:class:`FactorizationTimer`: with 'pardiso',
+        the symbolic analysis is kept between the steps of the inversion.
+        Default is 'superlu'.
+
+    Attributes
+    ----------
+    timer : :py:class:`FactorizationTimer`
+        The counters of the factorizations, shared by all the steps of the
+        inversion.
+    """
+
+    def __init__(self, instru_physics, frequencies, target_impedances,
+                 backend='superlu', **kwargs):
+        self.timer = FactorizationTimer(backend)
+        self._durations = dict(update=0., evaluation=0.)
+        super().__init__(instru_physics, frequencies, target_impedances,
+                         **kwargs)
+
+    @property
+    def timings(self):
+        """
+        dict: The cumulated durations (in s) of the updates of the instrument
+        and of its matrices ('update'), of the evaluations of the cost, the
+        residuals and their derivatives ('evaluation', including the updates
+        and the factorizations) and of the stages of :py:attr:`timer`.
+        """
+        return dict(self._durations, **self.timer.timings)
+
+    def reset_timings(self):
+        """Set the timings and the counts to zero."""
+        self._durations = dict.fromkeys(self._durations, 0.)
+        self.timer.reset_timings()
+
+    @contextlib.contextmanager
+    def _timing(self, stage):
+        tic = time.perf_counter()
+        try:
+            with self.timer.recording():
+                yield
+        finally:
+            self._durations[stage] += time.perf_counter() - tic
+
+    def modify_parts(self, new_optim_values):
+        with self._timing('update'):
+            super().modify_parts(new_optim_values)
+
+    def residuals_jacobian(self, *args, **kwargs):
+        with self._timing('evaluation'):
+            return super().residuals_jacobian(*args, **kwargs)
+
+    def get_cost_grad_hessian(self, *args, **kwargs):
+        with self._timing('evaluation'):
+            return super().get_cost_grad_hessian(*args, **kwargs)
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Acoustic fields interpolated on demand.
+
+`FrequentialSolver.solve(interp=True)` interpolates the pressure and the flow
+on the whole grid for every frequency, and keeps the dense
+`(n_freq, n_points)` arrays: with a fine grid and many frequencies, it is
+gigabytes. :py:class:`LazyFields` keeps only the degrees of freedom used by
+the interpolation (optionally in a memory-mapped file), and evaluates the
+fields on the requested frequencies and points when they are accessed:
+
+.. code-block:: python
+
+    fields = LazyFields(freq_model, interp_grid=0.001)
+    fields.solve()
+    fields.pressure.shape                 # (n_freq, n_points), nothing built
+    p_500 = fields.pressure.at_frequency(500)   # one frequency only
+    p_slice = fields.flow[100:200, ::10]
+    fields.plot_at_freq(1500, var='flow')
+
+The values are the ones of `solve(interp=True)`, the interpolation matrices
+being the ones of :py:class:`FrequentialInterpolation\
+<openwind.frequential.frequential_interpolation.FrequentialInterpolation>`.
+"""
+
+import numpy as np
+from scipy.sparse.linalg import spsolve
+
+from openwind.frequential.frequential_interpolation import \
+    FrequentialInterpolation
+
+
+class LazyField:
+    """
+    One acoustic field, interpolated when it is indexed.
+
+    It behaves as a read-only array of shape `(n_freq, n_points)`: indexing
+    it (`field[k]`, `field[k, i:j]`, `field[:, ::10]`) only reads the states
+    of the selected frequencies and only interpolates on the selected points.
+
+    Parameters
+    ----------
+    fields : :py:class:`LazyFields`
+        The solved states.
+    interp_mat : sparse matrix
+        The interpolation matrix, on the kept degrees of freedom.
+    variable : {'H1', 'L2', 'gradH1'}
+        The interpolated variable of the finite elements.
+    scale : float
+        The scaling of the field.
+    name : str
+        The name of the field.
+    """
+
+    def __init__(self, fields, interp_mat, variable, scale, name):
+        self.fields = fields
+        self.interp_mat = interp_mat.tocsr()
+        self.variable = variable
+        self.scale = scale
+        self.name = name
+
+    def __repr__(self):
+        return "<tapas.fields.LazyField('{}', shape={})>".format(self.name,
+                                                                 self.shape)
+
+    @property
+    def shape(self):
+        """tuple of int: The shape `(n_freq, n_points)`."""
+        return (len(self.fields.frequencies), self.interp_mat.shape[0])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        freq_key, x_key = key if isinstance(key, tuple) else (key, slice(None))
+        states = self.fields.states[freq_key]
+        x_index = np.arange(self.shape[1])[x_key]
+        interp_mat = self.interp_mat[np.atleast_1d(x_index)]
+        values = (interp_mat @ np.atleast_2d(states).T).T * self.scale
+        if np.ndim(states) == 1:
+            values = values[0]
+        if np.ndim(x_index) == 0:
+            values = values[..., 0]
+        return values
+
+    def __array__(self, dtype=None):
+        values = self[:, :]
+        return values if dtype is None else values.astype(dtype)
+
+    def at_frequency(self, freq):
+        """
+        The field at one frequency.
+
+        As `FrequentialSolver.plot_pressure_at_freq()`, it is the first
+        computed frequency higher or equal to `freq`.
+
+        Parameters
+        ----------
+        freq : float
+            The frequency.
+
+        Returns
+        -------
+        array of complex
+            The field on the interpolation points.
+        """
+        return self[self.fields.frequency_index(freq)]
+
+
+class LazyFields:
+    """
+    The acoustic fields of a frequential solver, interpolated on demand.
+
+    Parameters
+    ----------
+    f_solver : :py:class:`FrequentialSolver<openwind.frequential.frequential_solver.FrequentialSolver>`
+        The solver (with a direct method: 'FEM', 'TMM' or 'hybrid').
+    pipes_label : str or list of str, optional
+        The pipes on which the fields are interpolated. Default is
+        'main_bore'.
+    interp_grid : {float, array of float, 'original', 'radiation'}, optional
+        The interpolation points, as in `FrequentialSolver.solve()`. Default
+        is 'original'.
+    cache_path : str, optional
+        A '.npy' file in which the states are stored (memory-mapped). Default
+        is None: they are kept in memory.
+
+    Attributes
+    ----------
+    x_interp : array of float
+        The interpolation points.
+    dofs : array of int
+        The degrees of freedom kept for each frequency.
+    states : array of complex
+        The values of these degrees of freedom, of shape `(n_freq, n_dofs)`.
+    impedance : array of complex
+        The impedance, as `FrequentialSolver.impedance`.
+    pressure, flow : :py:class:`LazyField`
+        The fields.
+    dpressure : :py:class:`LazyField`
+        The gradient of the pressure (None with the 'VH1' convention).
+    """
+
+    def __init__(self, f_solver, pipes_label='main_bore',
+                 interp_grid='original', cache_path=None):
+        self.f_solver = f_solver
+        self.pipes_label = pipes_label
+        self.cache_path = cache_path
+        interpolation = FrequentialInterpolation(f_solver, pipes_label,
+                                                 interp_grid)
+        self.x_interp = interpolation.x_interp
+        matrices = _interp_matrices(interpolation)
+        used = sum(abs(mat) for mat in matrices.values()).getnnz(axis=0) > 0
+        self.dofs = np.nonzero(used)[0]
+        self._matrices = {name: mat[:, self.dofs]
+                          for name, mat in matrices.items()}
+        self.states = None
+        self.impedance = None
+        self.pressure = self.flow = self.dpressure = None
+
+    def __repr__(self):
+        return ("<tapas.fields.LazyFields({} frequencies, {} points, {} dofs)>"
+                .format(len(self.frequencies), len(self.x_interp),
+                        len(self.dofs)))
+
+    @property
+    def frequencies(self):
+        """array of float: The frequencies."""
+        return self.f_solver.frequencies
+
+    def frequency_index(self, freq):
+        """
+        The index of the first frequency higher or equal to `freq`.
+
+        Parameters
+        ----------
+        freq : float
+
+        Returns
+        -------
+        int
+        """
+        index = np.searchsorted(self.frequencies, freq)
+        if index == len(self.frequencies):
+            raise ValueError('The frequency {} is higher than the computed '
+                             'ones.'.format(freq))
+        return int(index)
+
+    def _allocate(self):
+        shape = (len(self.frequencies), len(self.dofs))
+        if self.cache_path is None:
+            return np.empty(shape, dtype=np.complex128)
+        return np.lib.format.open_memmap(self.cache_path, mode='w+',
+                                         dtype=np.complex128, shape=shape)
+
+    def solve(self):
+        """
+        Solve the frequencies and keep the degrees of freedom of the fields.
+
+        The impedance is also set to the solver.
+        """
+        f_solver = self.f_solver
+        ind_source = f_solver.source_ref.get_source_index()
+        entrance_H1 = np.empty(f_solver.frequencies.shape, dtype=np.complex128)
+        self.states = self._allocate()
+        Ah, ind_diag = f_solver._initialize_Ah_diag()
+        for cpt in range(len(f_solver.frequencies)):
+            # identical to FrequentialSolver.solve_with_method_direct()
+            Ah.data[ind_diag] = f_solver.Ah_diags[:, cpt]
+            Uh = spsolve(Ah, f_solver.Lh, permc_spec='NATURAL')
+            entrance_H1[cpt] = Uh[ind_source]
+            self.states[cpt] = Uh[self.dofs]
+        if isinstance(self.states, np.memmap):
+            self.states.flush()
+
+        scaling = f_solver.scaling
+        convention = f_solver.source_ref.get_convention()
+        if convention == 'PH1' and not f_solver.source_ref.is_flute_like():
+            self.impedance = scaling.get_impedance() * entrance_H1
+        else:
+            self.impedance = scaling.get_impedance() / entrance_H1
+        f_solver.impedance = self.impedance
+        self._set_fields(convention)
+
+    def _set_fields(self, convention):
+        scaling = self.f_solver.scaling
+        p_scale = scaling.get_scaling_pressure()
+        u_scale = scaling.get_scaling_flow()
+        if convention == 'PH1':
+            self.pressure = self._lazy_field('H1', p_scale, 'pressure')
+            self.flow = self._lazy_field('L2', u_scale, 'flow')
+            self.dpressure = self._lazy_field('gradH1', p_scale, 'dpressure')
+        else:
+            self.pressure = self._lazy_field('L2', p_scale, 'pressure')
+            self.flow = self._lazy_field('H1', u_scale, 'flow')
+            self.dpressure = None
+
+    def _lazy_field(self, variable, scale, name, matrices=None):
+        matrices = self._matrices if matrices is None else matrices
+        return LazyField(self, matrices[variable], variable, scale, name)
+
+    @classmethod
+    def load(cls, f_solver, cache_path, pipes_label='main_bore',
+             interp_grid='original'):
+        """
+        The fields stored by a previous :py:meth:`solve` in `cache_path`.
+
+        The solver and the interpolation options must be the ones of that
+        solve; the states are memory-mapped read-only and the impedance is not
+        available.
+
+        Returns
+        -------
+        :py:class:`LazyFields`
+        """
+        fields = cls(f_solver, pipes_label, interp_grid, cache_path)
+        fields.states = np.load(cache_path, mmap_mode='r')
+        expected = (len(fields.frequencies), len(fields.dofs))
+        if fields.states.shape != expected:
+            raise ValueError('The file {} has {} states, {} are expected.'
+                             .format(cache_path, fields.states.shape,
+                                     expected))
+        fields._set_fields(f_solver.source_ref.get_convention())
+        return fields
+
+    def _field(self, var):
+        field = getattr(self, var, None) if var in ('pressure', 'flow',
+                                                    'dpressure') else None
+        if field is None:
+            if self.states is None:
+                raise ValueError('The fields are not computed: call solve().')
+            raise ValueError("possible values are 'pressure' or 'flow', not "
+                             "'{}'".format(var))
+        return field
+
+    def evaluate(self, var, frequencies=None, x=None):
+        """
+        A field on some frequencies and positions.
+
+        Parameters
+        ----------
+        var : {'pressure', 'flow', 'dpressure'}
+            The field.
+        frequencies : array of float, optional
+            The frequencies (the first computed frequencies higher or equal).
+            Default is all of them.
+        x : array of float, optional
+            The positions, on the interpolated pipes. Default is
+            :py:attr:`x_interp`.
+
+        Returns
+        -------
+        array of complex
+            The field, of shape `(n_freq, n_x)`.
+        """
+        field = self._field(var)
+        if frequencies is None:
+            freq_key = slice(None)
+        else:
+            freq_key = [self.frequency_index(f) for f in np.atleast_1d(frequencies)]
+        if x is None:
+            return field[freq_key, :]
+        interpolation = FrequentialInterpolation(self.f_solver,
+                                                 self.pipes_label, np.array(x))
+        local = self._lazy_field(field.variable, field.scale, var,
+                                 _interp_matrices(interpolation, self.dofs))
+        return local[freq_key, :]
+
+    def plot_at_freq(self, freq, var='pressure', **kwargs):
+        """
+        Plot the real part of a field at one frequency.
+
+        As `FrequentialSolver.plot_pressure_at_freq()`, only this frequency is
+        interpolated.
+
+        Parameters
+        ----------
+        freq : float
+            The frequency (the first computed frequency higher or equal).
+        var : {'pressure', 'flow'}, optional
+            The field. Default is 'pressure'.
+        **kwargs :
+            Passed to `plt.plot()`.
+        """
+        import matplotlib.pyplot as plt
+        values = self._field(var).at_frequency(freq)
+        plt.plot(self.x_interp, np.real(values), **kwargs)
+        plt.xlabel('Position (m)')
+        plt.ylabel({'pressure': 'Pressure (Pa)',
+                    'flow': 'Flow (m/s)'}.get(var, var))
+        plt.legend()
+
+
+def _interp_matrices(interpolation, dofs=slice(None)):
+    """The interpolation matrices, on some degrees of freedom."""
+    matrices = dict(H1=interpolation.interp_mat_H1,
+                    L2=interpolation.interp_mat_L2,
+                    gradH1=interpolation.diff_interp_mat_H1)
+    return {name: mat.tocsc()[:, dofs] for name, mat in matrices.items()}
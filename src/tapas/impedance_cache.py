@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of computed impedances.
+
+The :py:class:`ImpedanceCache` computes impedances as
+:py:class:`ImpedanceComputation<openwind.impedance_computation.ImpedanceComputation>`
+and keeps them in memory and on disk. An entry is identified by the hash of
+everything the impedance depends on except the frequencies:
+
+- the content of the main bore, holes/valves and fingering chart files (or
+  lists) and the note;
+- the physical options (temperature, losses, radiation, humidity, ...);
+- the discretization options. With an automatic mesh, it depends on the
+  highest frequency (see `FrequentialSolver.FMIN_disc`): this frequency is
+  part of the key, so that every value of an entry is computed on the same
+  mesh.
+
+Each entry accumulates the frequencies computed so far. A request whose
+frequencies are all known is a hit, a request covering them partially only
+solves the missing frequencies (partial hit). The values are exactly the ones
+of a direct computation, the frequencies being solved independently. With an
+automatic mesh, requests share an entry only if they have the same highest
+frequency, or if both are below `FMIN_disc`.
+
+The options given as functions (temperature gradient, player curves) are
+part of the key by their content (see :py:class:`InstrumentCache\
+<tapas.instrument_cache.InstrumentCache>`); when it can not be read, the
+impedance is computed without cache.
+
+.. code-block:: python
+
+    cache = ImpedanceCache(max_memory=2**28, max_disk=2**32)
+    result = cache.impedance(np.arange(20, 2000), 'Geom_trumpet.txt',
+                             temperature=20, losses=True)
+    result.impedance, result.Zc
+    cache.stats()
+
+The entries are evicted in least recently used order once the memory or disk
+bounds are reached. The disk entries are `.zimp` files of
+:py:mod:`tapas.impedance_store`.
+"""
+
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from openwind import InstrumentGeometry, InstrumentPhysics, Player
+from openwind import FrequentialSolver
+
+from .impedance_store import (EXTENSION, read_impedance_binary,
+                              write_impedance_binary)
+from .instrument_cache import (InstrumentCache, UnhashableOption,
+                               default_cache_dir, split_options)
+
+
+class CachedImpedance:
+    """
+    An impedance returned by :py:class:`ImpedanceCache`.
+
+    Attributes
+    ----------
+    frequencies : array of float
+        The frequencies, in the order of the request.
+    impedance : array of complex
+        The impedance at these frequencies.
+    Zc : float
+        The characteristic impedance at the entrance.
+    key : str
+        The key of the cache entry (None if the options can not be hashed).
+    n_computed : int
+        The number of frequencies solved for this request.
+    """
+
+    def __init__(self, frequencies, impedance, Zc, key, n_computed):
+        self.frequencies = frequencies
+        self.impedance = impedance
+        self.Zc = Zc
+        self.key = key
+        self.n_computed = n_computed
+
+    def __repr__(self):
+        return ("<tapas.impedance_cache.CachedImpedance({} frequencies, {} "
+                "computed)>".format(len(self.frequencies), self.n_computed))
+
+
+class ImpedanceCache:
+    """
+    Memory and disk cache of impedances, with least recently used eviction.
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        The directory of the disk entries. Default is the subdirectory
+        'impedances' of :py:func:`default_cache_dir\
+        <tapas.instrument_cache.default_cache_dir>`. With False, the disk is
+        not used.
+    max_memory : int, optional
+        The maximal size in bytes of the entries kept in memory. Default is
+        128 MiB.
+    max_disk : int, optional
+        The maximal size in bytes of the disk entries. Default is 1 GiB.
+    verbose : bool, optional
+        Print the hits and misses. Default is False.
+
+    Attributes
+    ----------
+    hits, partial_hits, misses : int
+        The number of requests entirely served by the cache, partially
+        served, and entirely computed.
+    reused, computed : int
+        The number of frequencies read from the cache and solved.
+    evictions : int
+        The number of entries removed from the memory or the disk.
+    """
+
+    def __init__(self, cache_dir=None, max_memory=2**27, max_disk=2**30,
+                 verbose=False):
+        if cache_dir is None:
+            cache_dir = os.path.join(default_cache_dir(), 'impedances')
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.verbose = verbose
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self.hits = self.partial_hits = self.misses = 0
+        self.reused = self.computed = self.evictions = 0
+
+    def __repr__(self):
+        return ("<tapas.ImpedanceCache('{}', {} entries in memory, hits={}, "
+                "partial_hits={}, misses={})>".format(
+                    self.cache_dir, len(self._memory), self.hits,
+                    self.partial_hits, self.misses))
+
+    def stats(self):
+        """
+        The statistics of the cache.
+
+        With an automatic mesh (no `l_ele`), the highest frequency is part of
+        the key: partial hits only happen when the highest requested frequency
+        is below `FrequentialSolver.FMIN_disc` or equal to the one of a cached
+        entry. Otherwise a request with another highest frequency is a miss.
+
+        Returns
+        -------
+        dict
+            The numbers of 'hits', 'partial_hits', 'misses' (requests) and of
+            'reused' and 'computed' frequencies, the 'evictions', the
+            'hit_rate' and 'reuse_rate', and the size of the entries
+            ('memory_entries', 'memory_bytes', 'disk_bytes').
+        """
+        requests = self.hits + self.partial_hits + self.misses
+        frequencies = self.reused + self.computed
+        return dict(hits=self.hits, partial_hits=self.partial_hits,
+                    misses=self.misses, reused=self.reused,
+                    computed=self.computed, evictions=self.evictions,
+                    hit_rate=self.hits / requests if requests else np.nan,
+                    reuse_rate=self.reused / frequencies if frequencies else np.nan,
+                    memory_entries=len(self._memory),
+                    memory_bytes=self._memory_size,
+                    disk_bytes=self._disk_size())
+
+    def _log(self, msg):
+        if self.verbose:
+            print(msg)
+
+    # ----------------------------------------------------------------- storage
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + EXTENSION)
+
+    @staticmethod
+    def _nbytes(entry):
+        return entry[0].nbytes + entry[1].nbytes
+
+    def _get(self, key):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        if self.cache_dir and os.path.isfile(self._path(key)):
+            try:
+                freqs, imped, meta = read_impedance_binary(self._path(key),
+                                                           mmap_mode=None)
+            except (ValueError, OSError):
+                os.remove(self._path(key))
+                return None
+            os.utime(self._path(key))  # recently used
+            entry = (freqs, imped, meta['Zc'])
+            self._remember(key, entry)
+            return entry
+        return None
+
+    def _remember(self, key, entry):
+        if key in self._memory:
+            self._memory_size -= self._nbytes(self._memory.pop(key))
+        self._memory[key] = entry
+        self._memory_size += self._nbytes(entry)
+        while self._memory_size > self.max_memory and len(self._memory) > 1:
+            _, old = self._memory.popitem(last=False)
+            self._memory_size -= self._nbytes(old)
+            self.evictions += 1
+
+    def _put(self, key, entry, description):
+        self._remember(key, entry)
+        if self.cache_dir:
+            freqs, imped, Zc = entry
+            write_impedance_binary(self._path(key), freqs, imped,
+                                   temperature=description.get('temperature'),
+                                   Zc=Zc, description=description)
+            self._evict_disk()
+
+    def _disk_entries(self):
+        if not self.cache_dir:
+            return list()
+        paths = [os.path.join(self.cache_dir, name)
+                 for name in os.listdir(self.cache_dir)
+                 if name.endswith(EXTENSION)]
+        return sorted(((os.stat(path).st_mtime, os.path.getsize(path), path)
+                       for path in paths))
+
+    def _disk_size(self):
+        return sum(size for _, size, _ in self._disk_entries())
+
+    def _evict_disk(self):
+        entries = self._disk_entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries[:-1]:
+            if total <= self.max_disk:
+                break
+            os.remove(path)
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all the entries, in memory and on disk."""
+        self._memory.clear()
+        self._memory_size = 0
+        for _, _, path in self._disk_entries():
+            os.remove(path)
+
+    # ------------------------------------------------------------- computation
+    def impedance(self, frequencies, main_bore, holes_valves=list(),
+                  fingering_chart=list(), note=None, player=None,
+                  temperature=25, losses=True, unit='m', diameter=False,
+                  radiation_category='unflanged', nondim=True,
+                  spherical_waves=False, discontinuity_mass=True,
+                  matching_volume=False, compute_method='FEM',
+                  use_rad1dof=False, diffus_repr_var=False, **kwargs):
+        """
+        Get the impedance of an instrument, computing only what is missing.
+
+        The options and their defaults are the ones of
+        :py:class:`ImpedanceComputation<openwind.impedance_computation.ImpedanceComputation>`.
+
+        Parameters
+        ----------
+        frequencies : array of float
+            The frequencies.
+        main_bore, holes_valves, fingering_chart : str or list
+            The instrument description.
+        note : str, optional
+            The fingering. Default is None.
+        player : :py:class:`Player<openwind.technical.player.Player>`, optional
+            The player. Default is a unitary flow.
+        temperature : float, optional
+            The temperature in °C. Default is 25.
+        losses : bool or str, optional
+            The losses model. Default is True.
+        **kwargs :
+            The other options of the physics and of the mesh (`l_ele`,
+            `order`, `humidity`, ...).
+
+        Returns
+        -------
+        :py:class:`CachedImpedance`
+        """
+        if player is None:
+            player = Player()
+        frequencies = np.asarray(frequencies, dtype=float)
+        phy_options, mesh_options = split_options(dict(
+            radiation_category=radiation_category, nondim=nondim,
+            spherical_waves=spherical_waves,
+            discontinuity_mass=discontinuity_mass,
+            matching_volume=matching_volume, **kwargs))
+        geom_options = dict(unit=unit, diameter=diameter)
+        solver_options = dict(compute_method=compute_method, note=note,
+                              use_rad1dof=use_rad1dof,
+                              diffus_repr_var=diffus_repr_var, **mesh_options)
+        # the automatic mesh is adapted to the highest frequency
+        mesh_fmax = None
+        if 'l_ele' not in mesh_options and 'shortestLbd' not in mesh_options:
+            mesh_fmax = float(max(np.max(frequencies), FrequentialSolver.FMIN_disc))
+        description = dict(temperature=temperature, losses=losses, note=note,
+                           mesh_fmax=mesh_fmax, **phy_options)
+        try:
+            key = InstrumentCache.make_key(
+                'impedance', main_bore, holes_valves, fingering_chart,
+                geom_options, dict(temperature=temperature, losses=losses,
+                                   **phy_options),
+                solver_options, extra={'mesh_fmax': mesh_fmax,
+                                       'player': player.control_parameters})
+        except UnhashableOption:
+            self.misses += 1
+            self._log('Impedance not cacheable: computed.')
+            missing = np.unique(frequencies)
+            self.computed += len(missing)
+            entry = self._solve(missing, mesh_fmax, main_bore, holes_valves,
+                                fingering_chart, geom_options, temperature,
+                                player, losses, phy_options, solver_options)
+            index = np.searchsorted(entry[0], frequencies)
+            return CachedImpedance(frequencies, entry[1][index], entry[2],
+                                   None, len(missing))
+
+        entry = self._get(key)
+        if entry is not None:
+            known = np.isin(frequencies, entry[0])
+        else:
+            known = np.zeros(frequencies.shape, dtype=bool)
+        missing = np.unique(frequencies[~known])
+        if len(missing) == 0:
+            self.hits += 1
+            self._log('Impedance cache hit.')
+        elif np.any(known):
+            self.partial_hits += 1
+            self._log('Impedance cache partial hit: {} frequencies to compute.'
+                      .format(len(missing)))
+        else:
+            self.misses += 1
+            self._log('Impedance cache miss.')
+        self.reused += int(np.count_nonzero(known))
+        self.computed += len(missing)
+
+        if len(missing):
+            new = self._solve(missing, mesh_fmax, main_bore, holes_valves,
+                              fingering_chart, geom_options, temperature,
+                              player, losses, phy_options, solver_options)
+            if entry is not None:
+                freqs = np.concatenate([entry[0], new[0]])
+                order = np.argsort(freqs)
+                entry = (freqs[order],
+                         np.concatenate([entry[1], new[1]])[order], entry[2])
+            else:
+                entry = new
+            self._put(key, entry, _describe(description))
+
+        index = np.searchsorted(entry[0], frequencies)
+        return CachedImpedance(frequencies, entry[1][index], entry[2], key,
+                               len(missing))
+
+
+    @staticmethod
+    def _solve(frequencies, mesh_fmax, main_bore, holes_valves,
+               fingering_chart, geom_options, temperature, player, losses,
+               phy_options, solver_options):
+        """Compute the impedance on the sorted `frequencies` (a new entry)."""
+        instru_geom = InstrumentGeometry(main_bore, holes_valves,
+                                         fingering_chart, **geom_options)
+        instru_phy = InstrumentPhysics(instru_geom, temperature, player,
+                                       losses, **phy_options)
+        mesh_freqs = (frequencies if mesh_fmax is None
+                      else [frequencies[0], mesh_fmax])
+        f_solver = FrequentialSolver(instru_phy, mesh_freqs, **solver_options)
+        if mesh_fmax is not None:
+            # the mesh is adapted to mesh_fmax, solve the requested ones
+            f_solver.frequencies = frequencies
+            f_solver._construct_matrices_pipes()
+            f_solver._construct_matrices_connectors()
+        f_solver.solve()
+        return (frequencies, f_solver.impedance, float(f_solver.get_ZC_adim()))
+
+
+def _describe(description):
+    # a JSON-compatible summary of the options, stored with the entries
+    return json.loads(json.dumps(description, default=repr))
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Binary, memory-mappable storage of impedances.
+
+The text files of :py:func:`openwind.impedance_tools.write_impedance` are
+parsed line by line, which dominates small scripts and becomes slow for large
+frequency grids. The binary format used here stores the columns directly:
+
+====================  ========================================================
+magic                 8 bytes, `b'TAPASZ'` and the format version (uint16)
+header size           uint32, size in bytes of the JSON metadata
+number of frequencies uint64
+metadata              JSON (UTF-8), padded with spaces to a multiple of 16
+frequencies           float64 column, in Hz
+impedance             complex128 column
+====================  ========================================================
+
+The metadata hold at least the temperature (°C, or None if unknown), whether
+the impedance is normalized by the characteristic impedance, and the hash of
+the geometry it comes from (see
+:py:func:`hash_geometry_input<tapas.instrument_cache.hash_geometry_input>`).
+The columns are aligned, so they can be memory-mapped: reading a file costs
+the same whatever its size.
+
+.. code-block:: python
+
+    write_impedance_binary('trumpet.zimp', result.frequencies, result.impedance,
+                           temperature=25)
+    freqs, imped, meta = read_impedance_binary('trumpet.zimp')
+"""
+
+import glob
+import json
+import os
+import struct
+
+import numpy as np
+
+
+MAGIC = b'TAPASZ'
+FORMAT_VERSION = 1
+EXTENSION = '.zimp'
+"""str: The extension of the binary impedance files."""
+
+_PREFIX = struct.Struct('<6sHIQ')  # magic, version, header size, n_freq
+_ALIGN = 16
+
+
+def _header(metadata, n_freq):
+    text = json.dumps(metadata, sort_keys=True).encode('utf-8')
+    padding = -(_PREFIX.size + len(text)) % _ALIGN
+    text += b' ' * padding
+    return _PREFIX.pack(MAGIC, FORMAT_VERSION, len(text), n_freq) + text
+
+
+def _read_header(file, filename):
+    prefix = file.read(_PREFIX.size)
+    if len(prefix) < _PREFIX.size:
+        raise ValueError("'{}' is not a binary impedance file.".format(filename))
+    magic, version, header_size, n_freq = _PREFIX.unpack(prefix)
+    if magic != MAGIC:
+        raise ValueError("'{}' is not a binary impedance file.".format(filename))
+    if version > FORMAT_VERSION:
+        raise ValueError("'{}' has the format version {}, this version of "
+                         "tapas reads up to {}.".format(filename, version,
+                                                        FORMAT_VERSION))
+    metadata = json.loads(file.read(header_size).decode('utf-8'))
+    return metadata, n_freq, _PREFIX.size + header_size
+
+
+def write_impedance_binary(filename, frequencies, impedance, temperature=None,
+                           normalized=False, geometry_hash=None, **metadata):
+    """
+    Write an impedance in a binary file.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the file (the extension '.zimp' is advised).
+    frequencies : array of float
+        The frequencies in Hz.
+    impedance : array of complex
+        The impedance at each frequency.
+    temperature : float, optional
+        The temperature in °C. Default is None (unknown).
+    normalized : bool, optional
+        Whether the impedance is normalized by the characteristic impedance
+        at the entrance. Default is False.
+    geometry_hash : str, optional
+        The hash of the geometry, see :py:func:`hash_geometry_input\
+        <tapas.instrument_cache.hash_geometry_input>`. Default is None.
+    **metadata : keyword arguments
+        Other metadata, which must be serializable in JSON.
+    """
+    frequencies = np.asarray(frequencies, dtype='<f8')
+    impedance = np.asarray(impedance, dtype='<c16')
+    if frequencies.shape != impedance.shape or frequencies.ndim != 1:
+        raise ValueError('The frequencies and the impedance must be 1D arrays '
+                         'of the same length.')
+    metadata = dict(metadata, temperature=temperature, normalized=normalized,
+                    geometry_hash=geometry_hash)
+    with open(filename, 'wb') as file:
+        file.write(_header(metadata, len(frequencies)))
+        file.write(frequencies.tobytes())
+        file.write(impedance.tobytes())
+
+
+def read_impedance_binary(filename, mmap_mode='r'):
+    """
+    Read a binary impedance file.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the file.
+    mmap_mode : {'r', 'r+', 'c', None}, optional
+        The mode of :py:class:`numpy.memmap`. With None the columns are read
+        in memory. Default is 'r' (read-only memory map).
+
+    Returns
+    -------
+    frequencies : array of float
+        The frequencies in Hz.
+    impedance : array of complex
+        The impedance at each frequency.
+    metadata : dict
+        The metadata of the file.
+    """
+    with open(filename, 'rb') as file:
+        metadata, n_freq, offset = _read_header(file, filename)
+        if mmap_mode is None:
+            frequencies = np.fromfile(file, dtype='<f8', count=n_freq)
+            impedance = np.fromfile(file, dtype='<c16', count=n_freq)
+            return frequencies, impedance, metadata
+    if n_freq == 0:
+        return np.zeros(0), np.zeros(0, dtype=complex), metadata
+    frequencies = np.memmap(filename, dtype='<f8', mode=mmap_mode,
+                            offset=offset, shape=(n_freq,))
+    impedance = np.memmap(filename, dtype='<c16', mode=mmap_mode,
+                          offset=offset + 8*n_freq, shape=(n_freq,))
+    return frequencies, impedance, metadata
+
+
+def read_metadata(filename):
+    """
+    Read only the metadata of a binary impedance file.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the file.
+
+    Returns
+    -------
+    dict
+    """
+    with open(filename, 'rb') as file:
+        metadata, n_freq, _ = _read_header(file, filename)
+    return dict(metadata, n_frequencies=n_freq)
+
+
+def read_impedance_text(filename):
+    """
+    Read a text impedance file, as :py:func:`openwind.impedance_tools.read_impedance`.
+
+    The file has three whitespace-separated columns (frequency, real part and
+    imaginary part of the impedance), the lines beginning with '#' are
+    comments and the frequencies with a NaN impedance are excluded. It is
+    parsed in one call to :py:func:`numpy.loadtxt`.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the file.
+
+    Returns
+    -------
+    frequencies : array of float
+    impedance : array of complex
+    """
+    data = np.loadtxt(filename, comments='#', usecols=(0, 1, 2), ndmin=2)
+    impedance = data[:, 1] + 1j*data[:, 2]
+    valid = ~np.isnan(impedance)
+    return data[valid, 0], impedance[valid]
+
+
+def text_to_binary(text_file, binary_file=None, temperature=None,
+                   normalized=False, geometry_hash=None, **metadata):
+    """
+    Convert a text impedance file into a binary one.
+
+    Parameters
+    ----------
+    text_file : str
+        The text file, with the format of
+        :py:func:`openwind.impedance_tools.write_impedance`.
+    binary_file : str, optional
+        The binary file. Default is the text file with the extension '.zimp'.
+    temperature, normalized, geometry_hash, **metadata : optional
+        The metadata, see :py:func:`write_impedance_binary`. The name of the
+        text file is stored as 'source'.
+
+    Returns
+    -------
+    str
+        The name of the binary file.
+    """
+    if binary_file is None:
+        binary_file = os.path.splitext(text_file)[0] + EXTENSION
+    frequencies, impedance = read_impedance_text(text_file)
+    metadata.setdefault('source', os.path.basename(text_file))
+    write_impedance_binary(binary_file, frequencies, impedance, temperature,
+                           normalized, geometry_hash, **metadata)
+    return binary_file
+
+
+def binary_to_text(binary_file, text_file=None, column_sep=' '):
+    """
+    Convert a binary impedance file into a text one.
+
+    The text file has the format of
+    :py:func:`openwind.impedance_tools.write_impedance`, with all the digits
+    of the values so that the conversion is lossless. The metadata are
+    written as comments in its first lines.
+
+    Parameters
+    ----------
+    binary_file : str
+        The binary file.
+    text_file : str, optional
+        The text file. Default is the binary file with the extension '.txt'.
+    column_sep : str, optional
+        The column separator. Default is ' '.
+
+    Returns
+    -------
+    str
+        The name of the text file.
+    """
+    if text_file is None:
+        text_file = os.path.splitext(binary_file)[0] + '.txt'
+    frequencies, impedance, metadata = read_impedance_binary(binary_file)
+    data = np.column_stack((frequencies, impedance.real, impedance.imag))
+    header = '\n'.join('{}: {}'.format(key, json.dumps(val))
+                       for key, val in sorted(metadata.items()))
+    np.savetxt(text_file, data, fmt='%.16e', delimiter=column_sep, header=header)
+    return text_file
+
+
+def save_solver_impedance(filename, solver, normalize=False, geometry=None,
+                          **metadata):
+    """
+    Write the impedance computed by openwind in a binary file.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the file.
+    solver : :py:class:`FrequentialSolver<openwind.frequential.frequential_solver.FrequentialSolver>` or :py:class:`ImpedanceComputation<openwind.impedance_computation.ImpedanceComputation>`
+        The solved frequential model.
+    normalize : bool, optional
+        Normalize the impedance by the characteristic impedance at the
+        entrance. Default is False.
+    geometry : str or list, optional
+        The main bore (or any geometry input) used, to store its hash.
+    **metadata : keyword arguments
+        Other metadata. The temperature is read from the solver if not given.
+    """
+    impedance = solver.impedance
+    if normalize:
+        if hasattr(solver, 'get_ZC_adim'):
+            impedance = impedance / solver.get_ZC_adim()
+        else:
+            impedance = impedance / solver.Zc
+    instru_physics = getattr(solver, 'instru_physics', None)
+    if 'temperature' not in metadata and instru_physics is not None:
+        if not callable(instru_physics.temperature):
+            metadata['temperature'] = instru_physics.temperature
+    if geometry is not None:
+        from .instrument_cache import hash_geometry_input
+        metadata['geometry_hash'] = hash_geometry_input(geometry)
+    write_impedance_binary(filename, solver.frequencies, impedance,
+                           normalized=normalize, **metadata)
+
+
+class ImpedanceCampaign:
+    """
+    The impedances of a set of files, loaded in one call.
+
+    Parameters
+    ----------
+    names : list of str
+        The names of the impedances (the file names without extension).
+    frequencies : list of array of float
+        The frequency axis of each impedance.
+    impedances : list of array of complex
+        The impedances.
+    metadata : list of dict
+        The metadata of each file.
+
+    Attributes
+    ----------
+    common_frequencies : array of float or None
+        The frequency axis shared by all the impedances, if any.
+    """
+
+    def __init__(self, names, frequencies, impedances, metadata):
+        self.names = list(names)
+        self.frequencies = list(frequencies)
+        self.impedances = list(impedances)
+        self.metadata = list(metadata)
+        self.common_frequencies = None
+        if self.frequencies and all(np.array_equal(freq, self.frequencies[0])
+                                    for freq in self.frequencies[1:]):
+            self.common_frequencies = np.asarray(self.frequencies[0])
+
+    def __repr__(self):
+        return ("<tapas.impedance_store.ImpedanceCampaign({} impedances, "
+                "common frequencies: {})>".format(len(self),
+                                                  self.common_frequencies is not None))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, name):
+        k = self.names.index(name)
+        return self.frequencies[k], self.impedances[k], self.metadata[k]
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def as_array(self):
+        """
+        Stack the impedances in one array.
+
+        Returns
+        -------
+        array of complex, shape (n_files, n_frequencies)
+
+        Raises
+        ------
+        ValueError
+            If the impedances do not share the same frequency axis.
+        """
+        if self.common_frequencies is None:
+            raise ValueError('The impedances of the campaign do not share the '
+                             'same frequency axis.')
+        return np.stack(self.impedances)
+
+
+def _expand(paths):
+    if isinstance(paths, str):
+        paths = [paths]
+    files = list()
+    for path in paths:
+        if os.path.isdir(path):
+            # the binary version of a text file replaces it, the text files
+            # not converted yet are kept
+            by_stem = {os.path.splitext(name)[0]: name
+                       for name in glob.glob(os.path.join(path, '*.txt'))}
+            by_stem.update({os.path.splitext(name)[0]: name for name
+                            in glob.glob(os.path.join(path, '*' + EXTENSION))})
+            files += sorted(by_stem.values())
+        else:
+            files += sorted(glob.glob(path)) or [path]
+    return files
+
+
+def read_campaign(paths, convert=False, mmap_mode='r', **metadata):
+    """
+    Read all the impedances of a measurement campaign.
+
+    Binary files are memory-mapped, text files are parsed (and converted to
+    binary files next to them if `convert` is True, so that the next read is
+    immediate).
+
+    Parameters
+    ----------
+    paths : str or list of str
+        Files, glob patterns or directories. For a directory, its binary files
+        are read, and its '.txt' files which have no binary version.
+    convert : bool, optional
+        Write the binary version of the text files read. Default is False.
+    mmap_mode : {'r', 'r+', 'c', None}, optional
+        See :py:func:`read_impedance_binary`. Default is 'r'.
+    **metadata : keyword arguments
+        The metadata of the text files (e.g. `temperature=20`).
+
+    Returns
+    -------
+    :py:class:`ImpedanceCampaign`
+    """
+    names, all_freqs, all_imped, all_meta = list(), list(), list(), list()
+    for filename in _expand(paths):
+        with open(filename, 'rb') as file:
+            is_binary = file.read(len(MAGIC)) == MAGIC
+        if is_binary:
+            freqs, imped, meta = read_impedance_binary(filename, mmap_mode)
+        elif convert:
+            binary_file = text_to_binary(filename, **metadata)
+            freqs, imped, meta = read_impedance_binary(binary_file, mmap_mode)
+        else:
+            freqs, imped = read_impedance_text(filename)
+            meta = dict(metadata, source=os.path.basename(filename))
+        names.append(os.path.splitext(os.path.basename(filename))[0])
+        all_freqs.append(freqs)
+        all_imped.append(imped)
+        all_meta.append(meta)
+    return ImpedanceCampaign(names, all_freqs, all_imped, all_meta)
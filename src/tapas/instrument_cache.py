@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of discretized instruments.
+
+Building :py:class:`InstrumentGeometry<openwind.technical.instrument_geometry.InstrumentGeometry>`,
+:py:class:`InstrumentPhysics<openwind.continuous.instrument_physics.InstrumentPhysics>`
+and the solvers (mesh, mass matrices, `Bh`, radiation and losses coefficients)
+is paid again at every run. The :py:class:`InstrumentCache` stores the
+assembled solvers on disk, keyed by the content of the geometry files and the
+physical and discretization options, so that a warm start skips the assembly.
+"""
+
+import functools
+import hashlib
+import inspect
+import io
+import json
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+import openwind
+from openwind import InstrumentGeometry, InstrumentPhysics, Player
+from openwind import TemporalSolver, FrequentialSolver
+from openwind.continuous import Physics
+from openwind.continuous.excitator import VariableExcitatorParameter
+from openwind.discretization import Mesh
+
+
+CACHE_FORMAT_VERSION = 1
+"""int: Incremented when the content of the cached files changes."""
+
+
+def default_cache_dir():
+    """
+    The directory used when no directory is given to :py:class:`InstrumentCache`.
+
+    It is the value of the environment variable `TAPAS_CACHE_DIR` if it is
+    set, and `~/.cache/tapas` otherwise.
+
+    Returns
+    -------
+    str
+    """
+    return os.environ.get('TAPAS_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'tapas'))
+
+
+def hash_geometry_input(data):
+    """
+    Hash a geometry, holes/valves or fingering chart input.
+
+    Files are hashed by content (not by name or date), lists by value.
+
+    Parameters
+    ----------
+    data : str or list
+        A filename or a list as accepted by :py:class:`InstrumentGeometry\
+        <openwind.technical.instrument_geometry.InstrumentGeometry>`.
+
+    Returns
+    -------
+    str
+        The hexadecimal SHA-256 digest.
+    """
+    hasher = hashlib.sha256()
+    if isinstance(data, (str, os.PathLike)):
+        with open(data, 'rb') as file:
+            hasher.update(file.read())
+    else:
+        hasher.update(json.dumps(data, default=repr).encode())
+    return hasher.hexdigest()
+
+
+class UnhashableOption(ValueError):
+    """An option whose content can not be part of a key."""
+
+
+def _canonical(value, _seen=None):
+    """Convert an option value in a JSON-compatible value for the keys."""
+    if isinstance(value, np.ndarray):
+        return hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()
+    if isinstance(value, dict):
+        return {str(k): _canonical(v, _seen) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v, _seen) for v in value]
+    if isinstance(value, (np.floating, np.integer)):
+        return value.item()
+    if callable(value):
+        return _callable_content(value, set() if _seen is None else _seen)
+    return value
+
+
+def _code_content(code):
+    consts = [_code_content(c) if inspect.iscode(c) else repr(c)
+              for c in code.co_consts]
+    return [code.co_code.hex(), consts, list(code.co_names)]
+
+
+def _global_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _global_names(const)
+    return names
+
+
+def _callable_content(func, seen):
+    """
+    The content of a callable option: two lambdas or closures are equal only
+    if their code, defaults, closure values and used globals are equal.
+
+    Raises
+    ------
+    UnhashableOption
+        If the content can not be read (callable objects with a state which
+        is not made of options, bound methods...).
+    """
+    if id(func) in seen:
+        # recursive function
+        return {'recursion': getattr(func, '__qualname__', '')}
+    seen = seen | {id(func)}
+    if inspect.isclass(func) or inspect.isbuiltin(func) or isinstance(func, np.ufunc):
+        return {'builtin': '{}.{}'.format(getattr(func, '__module__', None),
+                                          getattr(func, '__qualname__',
+                                                  func.__name__))}
+    if isinstance(func, functools.partial):
+        return {'partial': [_callable_content(func.func, seen),
+                            _canonical(list(func.args), seen),
+                            _canonical(func.keywords, seen)]}
+    if inspect.isfunction(func):
+        code = func.__code__
+        cells = [cell.cell_contents for cell in func.__closure__ or ()]
+        used_globals = {name: func.__globals__[name]
+                        for name in sorted(_global_names(code))
+                        if name in func.__globals__}
+        return {'function': [_code_content(code),
+                             _canonical(list(func.__defaults__ or ()), seen),
+                             _canonical(func.__kwdefaults__ or {}, seen),
+                             [_content(cell, seen) for cell in cells],
+                             {name: _content(value, seen)
+                              for name, value in used_globals.items()}]}
+    raise UnhashableOption('The content of {!r} can not be hashed.'.format(func))
+
+
+def _content(value, seen):
+    # the values used by a function: modules by name, data by value
+    if inspect.ismodule(value):
+        return {'module': value.__name__}
+    if value is None or isinstance(value, (bool, int, float, complex, str,
+                                           bytes, np.ndarray, np.generic,
+                                           list, tuple, dict)) or callable(value):
+        return _canonical(value, seen)
+    raise UnhashableOption('The value {!r} used by a callable option can not '
+                           'be hashed.'.format(value))
+
+
+def _get_keys(my_class):
+    return [s.name for s in inspect.signature(my_class).parameters.values()
+            if s.kind is not s.VAR_KEYWORD]
+
+
+def split_options(kwargs):
+    """
+    Distribute keywords arguments between the physics and the mesh options.
+
+    Parameters
+    ----------
+    kwargs : dict
+        Options of :py:class:`InstrumentPhysics<openwind.continuous.instrument_physics.InstrumentPhysics>`,
+        :py:class:`Physics<openwind.continuous.physics.Physics>` or
+        :py:class:`Mesh<openwind.discretization.mesh.Mesh>`.
+
+    Raises
+    ------
+    TypeError
+        If one of the keyword does not correspond to any option.
+
+    Returns
+    -------
+    phy_options, mesh_options : dict
+    """
+    keys_phy = _get_keys(InstrumentPhysics) + _get_keys(Physics)
+    keys_mesh = _get_keys(Mesh)[1:] + ['nb_sub', 'reff_tmm_losses']
+    unknown = [key for key in kwargs if key not in keys_phy + keys_mesh]
+    if unknown:
+        raise TypeError('Unexpected keyword argument: {}'.format(unknown))
+    phy_options = {key: val for key, val in kwargs.items() if key in keys_phy}
+    mesh_options = {key: val for key, val in kwargs.items() if key in keys_mesh}
+    return phy_options, mesh_options
+
+
+class _SolverPickler(pickle.Pickler):
+    """Pickle a solver without the parts which depend on the caller.
+
+    The player (which may contain closures), the air properties (which
+    contain lambdas) and the options given as functions are not stored, they
+    are given back at loading.
+    """
+
+    def __init__(self, file, player, options):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._player = player
+        self._options = {id(value): name for name, value in options.items()
+                         if callable(value)}
+
+    def persistent_id(self, obj):
+        if obj is self._player:
+            return 'player'
+        if id(obj) in self._options:
+            return 'option:' + self._options[id(obj)]
+        if isinstance(obj, Physics):
+            return 'physics'
+        if isinstance(obj, VariableExcitatorParameter):
+            return 'curve'
+        return None
+
+
+class _SolverUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, player, physics_args, options):
+        super().__init__(file)
+        self._player = player
+        self._physics_args = physics_args
+        self._options = options
+        self._physics = None
+
+    def persistent_load(self, pid):
+        if pid == 'player':
+            return self._player
+        if pid == 'physics':
+            if self._physics is None:
+                temperature, physics_opt = self._physics_args
+                self._physics = Physics(temperature, **physics_opt)
+            return self._physics
+        if pid == 'curve':
+            return None  # rebuilt from the player after loading
+        if pid.startswith('option:'):
+            # a function of the same content as the stored one
+            return self._options[pid[len('option:'):]]
+        raise pickle.UnpicklingError('Unknown persistent id {}'.format(pid))
+
+
+def _player_time_step(t_solver, cfl_alpha):
+    """
+    The time step of a new solver of the instrument, with its current player.
+
+    The CFL conditions of the pipes, which do not depend on the player (and
+    cost an eigenvalue computation), are the ones stored by the solver; the
+    ones of the connectors are evaluated again.
+    """
+    pipes = {t_pipe.label for t_pipe in t_solver.t_pipes}
+    cfl = [(label, dt) for label, dt in t_solver.cfl_of_components
+           if label in pipes]
+    cfl += [(t_connector.label, t_connector.get_maximal_dt())
+            for t_connector in t_solver.t_connectors]
+    t_solver.cfl_of_components = sorted(cfl, key=lambda x: x[1])
+    return cfl_alpha * t_solver.cfl_of_components[0][1]
+
+
+class InstrumentCache:
+    """
+    Cache of assembled temporal and frequential solvers.
+
+    The key of a cached solver combines:
+
+    - the content hash of the main bore, holes/valves and fingering chart \
+    files (or lists);
+    - the physical options (temperature, losses, radiation category, \
+    nondimensionalization, humidity, etc.);
+    - the discretization options (`l_ele`, `order`, `cfl_alpha`, ...);
+    - for frequential solvers, the frequency axis and the player controls;
+    - the version of openwind.
+
+    The player is not part of the cached data for temporal solvers: the
+    player given at loading is attached to the solver and the excitator is
+    updated from its curves, so the same cached instrument can be played
+    with different controls.
+
+    .. code-block:: python
+
+        cache = InstrumentCache()
+        t_solver = cache.temporal_solver('simplified-trumpet.csv', player=player,
+                                         temperature=25, losses='diffrepr')
+
+    The options given as functions (temperature gradient, humidity, player
+    curves) are part of the key by their content: their code, defaults,
+    closure values and the globals they use. Two lambdas written alike but
+    closing over different values have different keys.
+
+    .. warning::
+        Callables whose content can not be read (callable objects, bound
+        methods, functions using other objects) are not hashed: such
+        instruments are assembled without cache.
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        The directory of the cached files. Default is given by
+        :py:func:`default_cache_dir`.
+    verbose : bool, optional
+        Print the cache hits and misses. Default is False.
+
+    Attributes
+    ----------
+    hits, misses : int
+        The number of solvers loaded from the cache and assembled.
+    """
+
+    def __init__(self, cache_dir=None, verbose=False):
+        self.cache_dir = cache_dir if cache_dir else default_cache_dir()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.verbose = verbose
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return ("<tapas.InstrumentCache('{}', hits={}, misses={})>"
+                .format(self.cache_dir, self.hits, self.misses))
+
+    @staticmethod
+    def make_key(kind, main_bore, holes_valves, fingering_chart, geom_options,
+                 phy_options, solver_options, extra=None):
+        """
+        Compute the key of a solver.
+
+        Parameters
+        ----------
+        kind : {'temporal', 'frequential'}
+            The type of solver.
+        main_bore, holes_valves, fingering_chart : str or list
+            The instrument description.
+        geom_options, phy_options, solver_options : dict
+            The options of the geometry, the physics and the solver (including
+            the mesh).
+        extra : dict, optional
+            Any other data the solver depends on.
+
+        Returns
+        -------
+        str
+
+        Raises
+        ------
+        UnhashableOption
+            If an option is a callable whose content can not be read.
+        """
+        description = {'format': CACHE_FORMAT_VERSION,
+                       'openwind': openwind.__version__,
+                       'kind': kind,
+                       'geometry': [hash_geometry_input(main_bore),
+                                    hash_geometry_input(holes_valves),
+                                    hash_geometry_input(fingering_chart)],
+                       'geom_options': _canonical(geom_options),
+                       'phy_options': _canonical(phy_options),
+                       'solver_options': _canonical(solver_options),
+                       'extra': _canonical(extra)}
+        text = json.dumps(description, sort_keys=True, default=repr)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.pkl')
+
+    def _load(self, key, player, physics_args, options):
+        path = self._path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, 'rb') as file:
+                return _SolverUnpickler(file, player, physics_args,
+                                        options).load()
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError,
+                KeyError):
+            # corrupted or outdated file: rebuild it
+            os.remove(path)
+            return None
+
+    def _store(self, key, solver, player, options):
+        buffer = io.BytesIO()
+        _SolverPickler(buffer, player, options).dump(solver)
+        # write in a temporary file first to never expose a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            file.write(buffer.getbuffer())
+        os.replace(tmp_path, self._path(key))
+
+    def _log(self, msg):
+        if self.verbose:
+            print(msg)
+
+    @staticmethod
+    def _physics_args(temperature, phy_options):
+        physics_keys = _get_keys(Physics)[1:]
+        physics_opt = {key: val for key, val in phy_options.items()
+                       if key in physics_keys}
+        return temperature, physics_opt
+
+    def temporal_solver(self, main_bore, holes_valves=list(), fingering_chart=list(),
+                        player=None, temperature=25, losses=False,
+                        unit='m', diameter=False, cfl_alpha=0.9,
+                        theta_scheme_parameter=0.25,
+                        contact_quadratization_cst=1, **kwargs):
+        """
+        Get the temporal solver of an instrument, from the cache if possible.
+
+        Parameters
+        ----------
+        main_bore, holes_valves, fingering_chart : str or list
+            The instrument description, see :py:class:`InstrumentGeometry\
+            <openwind.technical.instrument_geometry.InstrumentGeometry>`.
+        player : :py:class:`Player<openwind.technical.player.Player>`, optional
+            The player. Default is a 'TUTORIAL_REED' player.
+        temperature : float, optional
+            The temperature in °C. Default is 25.
+        losses : {False, 'diffrepr'}, optional
+            The losses model. Default is False.
+        unit, diameter : optional
+            Geometry options.
+        cfl_alpha, theta_scheme_parameter, contact_quadratization_cst : optional
+            See :py:class:`TemporalSolver<openwind.temporal.temporal_solver.TemporalSolver>`.
+        **kwargs : keyword arguments
+            Other options of :py:class:`InstrumentPhysics\
+            <openwind.continuous.instrument_physics.InstrumentPhysics>` and of
+            :py:class:`Mesh<openwind.discretization.mesh.Mesh>` (`l_ele`, `order`).
+
+        Returns
+        -------
+        :py:class:`TemporalSolver<openwind.temporal.temporal_solver.TemporalSolver>`
+        """
+        if player is None:
+            player = Player('TUTORIAL_REED')
+        phy_options, mesh_options = split_options(kwargs)
+        geom_options = dict(unit=unit, diameter=diameter)
+        solver_options = dict(cfl_alpha=cfl_alpha,
+                              theta_scheme_parameter=theta_scheme_parameter,
+                              contact_quadratization_cst=contact_quadratization_cst,
+                              **mesh_options)
+
+        def build():
+            instru_geom = InstrumentGeometry(main_bore, holes_valves,
+                                             fingering_chart, **geom_options)
+            instru_phy = InstrumentPhysics(instru_geom, temperature, player,
+                                           losses, **phy_options)
+            return TemporalSolver(instru_phy, **solver_options)
+
+        try:
+            key = self.make_key('temporal', main_bore, holes_valves,
+                                fingering_chart, geom_options,
+                                dict(temperature=temperature, losses=losses,
+                                     **phy_options),
+                                solver_options,
+                                extra={'excitator_type': player.excitator_type})
+        except UnhashableOption:
+            return build()
+        options = dict(temperature=temperature, **phy_options)
+        t_solver = self._load(key, player,
+                              self._physics_args(temperature, phy_options),
+                              options)
+        if t_solver is None:
+            self.misses += 1
+            self._log('Instrument cache miss: assembling the temporal solver.')
+            t_solver = build()
+            self._store(key, t_solver, player, options)
+        else:
+            self.hits += 1
+            self._log('Instrument cache hit: temporal solver loaded.')
+            # the excitator must follow the controls of the given player, and
+            # the time step its CFL condition (reed with theta < 0.25)
+            t_solver.instru_physics._update_player()
+            dt = _player_time_step(t_solver, cfl_alpha)
+            if dt != t_solver.get_dt():
+                t_solver._set_dt(dt)
+            else:
+                for t_connector in t_solver.t_connectors:
+                    t_connector.set_dt(dt)
+        return t_solver
+
+    def frequential_solver(self, frequencies, main_bore, holes_valves=list(),
+                           fingering_chart=list(), player=None, temperature=25,
+                           losses=True, unit='m', diameter=False,
+                           compute_method='FEM', note=None, use_rad1dof=False,
+                           diffus_repr_var=False, **kwargs):
+        """
+        Get the frequential solver of an instrument, from the cache if possible.
+
+        The returned solver is assembled but not solved: call
+        :py:meth:`FrequentialSolver.solve()\
+        <openwind.frequential.frequential_solver.FrequentialSolver.solve>`.
+
+        Parameters
+        ----------
+        frequencies : array of float
+            The frequency axis.
+        main_bore, holes_valves, fingering_chart : str or list
+            The instrument description, see :py:class:`InstrumentGeometry\
+            <openwind.technical.instrument_geometry.InstrumentGeometry>`.
+        player : :py:class:`Player<openwind.technical.player.Player>`, optional
+            The player. Default is a unitary flow.
+        temperature : float, optional
+            The temperature in °C. Default is 25.
+        losses : bool or str, optional
+            The losses model. Default is True.
+        unit, diameter : optional
+            Geometry options.
+        compute_method, note, use_rad1dof, diffus_repr_var : optional
+            See :py:class:`FrequentialSolver<openwind.frequential.frequential_solver.FrequentialSolver>`.
+        **kwargs : keyword arguments
+            Other options of :py:class:`InstrumentPhysics\
+            <openwind.continuous.instrument_physics.InstrumentPhysics>` and of
+            :py:class:`Mesh<openwind.discretization.mesh.Mesh>` (`l_ele`, `order`).
+
+        Returns
+        -------
+        :py:class:`FrequentialSolver<openwind.frequential.frequential_solver.FrequentialSolver>`
+        """
+        if player is None:
+            player = Player()
+        frequencies = np.asarray(frequencies, dtype=float)
+        phy_options, mesh_options = split_options(kwargs)
+        geom_options = dict(unit=unit, diameter=diameter)
+        solver_options = dict(compute_method=compute_method, note=note,
+                              use_rad1dof=use_rad1dof,
+                              diffus_repr_var=diffus_repr_var, **mesh_options)
+
+        def build():
+            instru_geom = InstrumentGeometry(main_bore, holes_valves,
+                                             fingering_chart, **geom_options)
+            instru_phy = InstrumentPhysics(instru_geom, temperature, player,
+                                           losses, **phy_options)
+            return FrequentialSolver(instru_phy, frequencies, **solver_options)
+
+        # the source coefficients (flute-like instruments) depend on the player
+        try:
+            key = self.make_key('frequential', main_bore, holes_valves,
+                                fingering_chart, geom_options,
+                                dict(temperature=temperature, losses=losses,
+                                     **phy_options),
+                                solver_options,
+                                extra={'frequencies': frequencies,
+                                       'player': player.control_parameters})
+        except UnhashableOption:
+            return build()
+        options = dict(temperature=temperature, **phy_options)
+        f_solver = self._load(key, player,
+                              self._physics_args(temperature, phy_options),
+                              options)
+        if f_solver is None:
+            self.misses += 1
+            self._log('Instrument cache miss: assembling the frequential solver.')
+            f_solver = build()
+            self._store(key, f_solver, player, options)
+        else:
+            self.hits += 1
+            self._log('Instrument cache hit: frequential solver loaded.')
+            f_solver.source_ref.source._update_fields(player.control_parameters)
+        return f_solver
+
+    def clear(self):
+        """Remove all the cached solvers."""
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.pkl'):
+                os.remove(os.path.join(self.cache_dir, name))
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lightweight import path of openwind for synthesis-only workloads.
+
+Importing :py:mod:`openwind` loads matplotlib (every module imports
+`matplotlib.pyplot` for its plotting methods), scipy's signal, interpolation
+and optimization toolboxes and the impedance tools, which makes most of the
+time to first sample of a worker process that only simulates. After
+:py:func:`enable_lazy_imports`, these modules are replaced by
+:py:class:`LazyModule` placeholders which import the actual module on the
+first attribute access:
+
+.. code-block:: python
+
+    from tapas.lazy import import_openwind
+    openwind = import_openwind()  # instead of `import openwind`
+
+Nothing changes for the code using the modules, plotting still works: it
+only pays the import when it first needs it.
+"""
+
+import importlib
+import importlib.machinery
+import importlib.util
+import sys
+import threading
+import types
+
+
+LAZY_MODULES = {'matplotlib': [],
+                'matplotlib.pyplot': [],
+                'mpl_toolkits.axes_grid1': ['make_axes_locatable'],
+                'scipy.signal': ['butter', 'lfilter', 'sosfilt', 'sosfilt_zi'],
+                'scipy.interpolate': [],
+                'scipy.optimize': ['least_squares', 'minimize'],
+                'openwind.impedance_tools': ['read_impedance'],
+                'openwind.simu_anim': [],
+                'openwind.inversion': []}
+"""
+dict: The modules imported lazily by default, with the functions which can be
+imported from them (`from module import function`) without loading them.
+"""
+
+_lock = threading.RLock()
+
+
+class _DeferredFunction:
+    """Function of a lazy module, which loads the module when called."""
+
+    def __init__(self, lazy_module, name):
+        self._lazy_module = lazy_module
+        self.__name__ = name
+
+    def __call__(self, *args, **kwargs):
+        return getattr(self._lazy_module._load(), self.__name__)(*args, **kwargs)
+
+    def __repr__(self):
+        return "<deferred function {}.{}>".format(self._lazy_module.__name__,
+                                                  self.__name__)
+
+
+class LazyModule(types.ModuleType):
+    """
+    Placeholder of a module which is imported on the first attribute access.
+
+    Contrary to :py:class:`importlib.util.LazyLoader`, the placeholder can go
+    through `import` statements (which read `__spec__`) without triggering the
+    import. Once loaded, every attribute access is forwarded to the module.
+
+    Parameters
+    ----------
+    spec : :py:class:`importlib.machinery.ModuleSpec`
+        The specification of the module.
+    deferred : list of str, optional
+        The functions which can be imported from the module (`from module
+        import function`) before it is loaded.
+    """
+
+    def __init__(self, spec, deferred=()):
+        super().__init__(spec.name)
+        self.__dict__.update(_deferred=set(deferred), _module=None,
+                             __spec__=spec, __loader__=spec.loader,
+                             __package__=spec.parent)
+        if spec.submodule_search_locations is not None:
+            # read by the import statements, it must not trigger the import
+            self.__dict__['__path__'] = list(spec.submodule_search_locations)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return "<tapas.lazy.LazyModule('{}', {})>".format(self.__name__, state)
+
+    def _load(self):
+        """Import the actual module, if not done yet, and return it."""
+        with _lock:
+            if self._module is None:
+                name = self.__name__
+                if sys.modules.get(name) is self:
+                    del sys.modules[name]
+                try:
+                    module = importlib.import_module(name)
+                except BaseException:
+                    sys.modules.setdefault(name, self)
+                    raise
+                self.__dict__['_module'] = module
+                _link_to_parent(name, module)
+                # the submodules registered on the placeholder
+                for attr, value in self.__dict__.items():
+                    if isinstance(value, LazyModule) and attr not in vars(module):
+                        setattr(module, attr, value)
+            return self._module
+
+    def __getattr__(self, name):
+        # only called for the attributes missing from the placeholder
+        if self._module is None:
+            if name in self._deferred:
+                return _DeferredFunction(self, name)
+            if name == '__path__':
+                raise AttributeError(name)  # not a package
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        if self._module is not None:
+            setattr(self._module, name, value)
+        else:
+            super().__setattr__(name, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def _link_to_parent(name, module):
+    parent, _, child = name.rpartition('.')
+    if parent and parent in sys.modules:
+        parent_module = sys.modules[parent]
+        if not isinstance(parent_module, LazyModule):
+            setattr(parent_module, child, module)
+        else:
+            parent_module.__dict__[child] = module
+
+
+def _find_spec(name):
+    # find the spec of a module without importing its parent packages
+    parent, _, _ = name.rpartition('.')
+    if not parent:
+        return importlib.util.find_spec(name)
+    if parent in sys.modules:
+        parent_spec = sys.modules[parent].__spec__
+    else:
+        parent_spec = _find_spec(parent)
+    if parent_spec is None or parent_spec.submodule_search_locations is None:
+        return None
+    return importlib.machinery.PathFinder.find_spec(
+        name, parent_spec.submodule_search_locations)
+
+
+def lazy_import(name, deferred=()):
+    """
+    Register a lazy placeholder of a module, if it is not imported yet.
+
+    Parameters
+    ----------
+    name : str
+        The full name of the module.
+    deferred : list of str, optional
+        The functions which can be imported from the module before it is
+        loaded, see :py:class:`LazyModule`.
+
+    Returns
+    -------
+    module
+        The placeholder, or the module itself if it was already imported or
+        can not be imported lazily (namespace package, built-in module). None
+        if the module is not installed.
+    """
+    with _lock:
+        if name in sys.modules:
+            return sys.modules[name]
+        spec = _find_spec(name)
+        if spec is None:
+            return None
+        if spec.origin is None or not hasattr(spec.loader, 'exec_module'):
+            return importlib.import_module(name)
+        module = LazyModule(spec, deferred)
+        sys.modules[name] = module
+        _link_to_parent(name, module)
+        return module
+
+
+def enable_lazy_imports(modules=None):
+    """
+    Make heavy modules load on first use.
+
+    It must be called before the modules are imported (typically at the very
+    beginning of a worker), the modules already imported are left untouched.
+
+    Parameters
+    ----------
+    modules : dict or list of str, optional
+        The modules to import lazily, with the functions which can be
+        imported from them before they are loaded. Default is
+        :py:data:`LAZY_MODULES`.
+
+    Returns
+    -------
+    list of str
+        The modules actually made lazy.
+    """
+    if modules is None:
+        modules = LAZY_MODULES
+    if not isinstance(modules, dict):
+        modules = {name: [] for name in modules}
+    lazy = list()
+    for name, deferred in modules.items():
+        if isinstance(lazy_import(name, deferred), LazyModule):
+            lazy.append(name)
+    return lazy
+
+
+def is_loaded(name):
+    """
+    Parameters
+    ----------
+    name : str
+        The full name of a module.
+
+    Returns
+    -------
+    bool
+        True if the module has actually been imported (not only a
+        placeholder).
+    """
+    module = sys.modules.get(name)
+    if isinstance(module, LazyModule):
+        return module._module is not None
+    return module is not None
+
+
+def import_openwind(modules=None):
+    """
+    Import openwind with :py:func:`enable_lazy_imports`.
+
+    Parameters
+    ----------
+    modules : dict or list of str, optional
+        The modules to import lazily. Default is :py:data:`LAZY_MODULES`.
+
+    Returns
+    -------
+    module
+        The :py:mod:`openwind` package.
+    """
+    enable_lazy_imports(modules)
+    openwind = importlib.import_module('openwind')
+    # the placeholders registered before their parent package was imported
+    for name, module in list(sys.modules.items()):
+        if isinstance(module, LazyModule) and name.startswith('openwind.'):
+            _link_to_parent(name, module)
+    return openwind
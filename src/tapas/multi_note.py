@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Impedance of all the notes of a fingering chart in one solve.
+
+:py:meth:`FrequentialSolver.set_note\
+<openwind.frequential.frequential_solver.FrequentialSolver.set_note>`
+followed by :py:meth:`solve()\
+<openwind.frequential.frequential_solver.FrequentialSolver.solve>` factorizes
+the whole finite element system again for each note, while a fingering only
+changes the opening factor of the holes: the matrices of two notes differ on
+the few degrees of freedom of the hole radiations.
+
+The :py:class:`MultiNoteSolver` factorizes, at each frequency, the matrix of a
+reference fingering only, and deduces the solution of each note from it with
+the Woodbury identity. With `A` the reference matrix and `D` the (small)
+difference restricted to the set `S` of the degrees of freedom changed by the
+fingerings:
+
+.. math::
+    (A + U D U^T)^{-1} L = y - Z (I + D Z_S)^{-1} D y_S
+
+with `y = A^{-1} L` and `Z = A^{-1} U`, `U` selecting the columns of `S`. Each
+note then costs a dense solve of size `|S|` per frequency.
+
+.. code-block:: python
+
+    f_solver = FrequentialSolver(instru_phy, frequencies)
+    multi = MultiNoteSolver(f_solver, notes)
+    impedances = multi.solve()   # (n_notes, n_freq)
+"""
+
+import time
+import warnings
+
+import numpy as np
+from scipy.sparse import SparseEfficiencyWarning
+from scipy.sparse.linalg import splu
+
+
+class MultiNoteSolver:
+    """
+    Solve the frequential problem of several fingerings at once.
+
+    Only the direct methods of
+    :py:class:`FrequentialSolver<openwind.frequential.frequential_solver.FrequentialSolver>`
+    ('FEM', 'TMM' and 'hybrid') are supported; the 'modal' method has its own
+    treatment of the fingerings.
+
+    Parameters
+    ----------
+    f_solver : :py:class:`FrequentialSolver<openwind.frequential.frequential_solver.FrequentialSolver>`
+        The solver of the instrument. Its note is restored after the
+        assembly of the notes.
+    notes : list of str, optional
+        The notes of the fingering chart to compute. Default is None (all the
+        notes of the chart).
+    reference : str, optional
+        The note whose matrix is factorized. Default is None (the first
+        note).
+
+    Attributes
+    ----------
+    notes : list of str
+        The notes computed.
+    updated_dofs : array of int
+        The degrees of freedom on which the notes differ (`S`).
+    impedances : array of complex
+        The impedances of the notes, of shape `(n_notes, n_freq)`, once
+        :py:meth:`solve` is called.
+    timings : dict
+        The durations (in s) of the assembly of the notes ('assembly'), of
+        the factorizations ('factorization') and of the updates ('update').
+    """
+
+    def __init__(self, f_solver, notes=None, reference=None):
+        if f_solver.compute_method == 'modal':
+            raise ValueError("The 'modal' method is not supported, use "
+                             "FrequentialSolver.impedance_several_notes().")
+        if notes is None:
+            notes = f_solver.netlist.get_fingering_chart().all_notes()
+        if len(notes) == 0:
+            raise ValueError('At least one note is needed.')
+        self.f_solver = f_solver
+        self.notes = list(notes)
+        self.reference = reference if reference is not None else self.notes[0]
+        self.timings = dict(assembly=0., factorization=0., update=0.)
+        self._assemble()
+
+    def __repr__(self):
+        return ("<tapas.multi_note.MultiNoteSolver({} notes, reference='{}', "
+                "{} updated dofs)>".format(len(self.notes), self.reference,
+                                           len(self.updated_dofs)))
+
+    def _assemble(self):
+        """Assemble the matrices of each note and extract their differences."""
+        tic = time.perf_counter()
+        f_solver = self.f_solver
+        # the state of the solver, restored after the assembly
+        initial_note = f_solver.note
+        initial_matrices = (f_solver.Ah_nodiag, f_solver.Ah_diags, f_solver.Lh)
+        initial_openings = [(f_comp, f_comp._opening_factor)
+                            for f_comp in f_solver.f_connectors
+                            if hasattr(f_comp, '_opening_factor')]
+
+        def matrices(note):
+            f_solver.set_note(note)
+            return (f_solver.Ah_nodiag.tocsr(), np.array(f_solver.Ah_diags),
+                    f_solver.Lh.toarray()[:, 0])
+
+        ref_nodiag, ref_diags, self._Lh = matrices(self.reference)
+        self._ref_nodiag, self._ref_diags = ref_nodiag, ref_diags
+        deltas = list()
+        updated = set()
+        for note in self.notes:
+            nodiag, diags, Lh = matrices(note)
+            if not np.array_equal(Lh, self._Lh):
+                raise ValueError("The source term of the note '{}' differs "
+                                 "from the one of '{}'."
+                                 .format(note, self.reference))
+            delta_nodiag = (nodiag - ref_nodiag).tocoo()
+            delta_nodiag.eliminate_zeros()
+            delta_diags = diags - ref_diags
+            rows_diag = np.nonzero(np.any(delta_diags != 0, axis=1))[0]
+            updated.update(delta_nodiag.row, delta_nodiag.col, rows_diag)
+            deltas.append((delta_nodiag, delta_diags))
+        self.updated_dofs = np.array(sorted(updated), dtype=int)
+
+        # the differences restricted to S x S, for each note and frequency
+        n_S = len(self.updated_dofs)
+        position = {dof: k for k, dof in enumerate(self.updated_dofs)}
+        self._D = np.zeros((len(self.notes), len(f_solver.frequencies), n_S, n_S),
+                           dtype=complex)
+        # the diagonal of the nodiag matrices is carried by the diags arrays
+        for k, (delta_nodiag, delta_diags) in enumerate(deltas):
+            for i, j, value in zip(delta_nodiag.row, delta_nodiag.col,
+                                   delta_nodiag.data):
+                if i != j:
+                    self._D[k, :, position[i], position[j]] += value
+            for dof in self.updated_dofs:
+                p = position[dof]
+                self._D[k, :, p, p] = delta_diags[dof, :]
+
+        f_solver.note = initial_note
+        f_solver.Ah_nodiag, f_solver.Ah_diags, f_solver.Lh = initial_matrices
+        for f_comp, opening_factor in initial_openings:
+            f_comp._opening_factor = opening_factor
+        self.timings['assembly'] = time.perf_counter() - tic
+
+    def _reference_matrix(self):
+        if not all(np.isfinite(self._ref_nodiag.data)):
+            raise ValueError('The matrix Ah contains non-finite value(s) '
+                             '(inf or NaN).')
+        Ah = self._ref_nodiag.tocsc()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', SparseEfficiencyWarning)
+            Ah.setdiag(np.nan)
+        ind_diag = np.where(np.isnan(Ah.data))[0]
+        return Ah, ind_diag
+
+    def solve(self):
+        """
+        Compute the impedance of all the notes.
+
+        Returns
+        -------
+        impedances : array of complex
+            The impedances, of shape `(n_notes, n_freq)`, in the order of
+            :py:attr:`notes`.
+        """
+        f_solver = self.f_solver
+        ind_source = f_solver.source_ref.get_source_index()
+        S = self.updated_dofs
+        n_S = len(S)
+        rhs = np.zeros((f_solver.n_tot, n_S + 1), dtype=complex)
+        rhs[:, 0] = self._Lh
+        rhs[S, 1 + np.arange(n_S)] = 1
+        identity = np.eye(n_S)
+        entrance = np.empty((len(self.notes), len(f_solver.frequencies)),
+                            dtype=complex)
+
+        Ah, ind_diag = self._reference_matrix()
+        t_factor = t_update = 0.
+        for cpt in range(len(f_solver.frequencies)):
+            tic = time.perf_counter()
+            Ah.data[ind_diag] = self._ref_diags[:, cpt]
+            solution = splu(Ah, permc_spec='NATURAL').solve(rhs)
+            y, Z = solution[:, 0], solution[:, 1:]
+            toc = time.perf_counter()
+            t_factor += toc - tic
+            # Woodbury update of each note, only at the entrance
+            D = self._D[:, cpt]
+            DZ = D @ Z[S]
+            Dy = D @ y[S]
+            correction = np.linalg.solve(identity + DZ, Dy[..., np.newaxis])[..., 0]
+            entrance[:, cpt] = y[ind_source] - correction @ Z[ind_source]
+            t_update += time.perf_counter() - toc
+        self.timings['factorization'] = t_factor
+        self.timings['update'] = t_update
+        self.impedances = self._rescale(entrance)
+        return self.impedances
+
+    def _rescale(self, entrance):
+        """Convert the entrance unknown into impedance, as FrequentialSolver."""
+        f_solver = self.f_solver
+        convention = f_solver.source_ref.get_convention()
+        Zscale = f_solver.scaling.get_impedance()
+        if convention == 'PH1' and not f_solver.source_ref.is_flute_like():
+            return Zscale * entrance
+        return Zscale / entrance
+
+    def impedance_of(self, note):
+        """
+        The impedance of one note, once :py:meth:`solve` is called.
+
+        Parameters
+        ----------
+        note : str
+            The note name.
+
+        Returns
+        -------
+        array of complex
+        """
+        return self.impedances[self.notes.index(note)]
+
+
+def impedance_several_notes(f_solver, notes=None):
+    """
+    Compute the impedance of several notes with one factorization per
+    frequency.
+
+    It is equivalent to :py:meth:`FrequentialSolver.impedance_several_notes\
+    <openwind.frequential.frequential_solver.FrequentialSolver.impedance_several_notes>`
+    but much cheaper for long fingering charts, see :py:class:`MultiNoteSolver`.
+
+    Parameters
+    ----------
+    f_solver : :py:class:`FrequentialSolver<openwind.frequential.frequential_solver.FrequentialSolver>`
+        The solver of the instrument.
+    notes : list of str, optional
+        The note names. Default is None (all the notes of the chart).
+
+    Returns
+    -------
+    impedances : list of array
+        The impedance of each note.
+    """
+    return list(MultiNoteSolver(f_solver, notes).solve())
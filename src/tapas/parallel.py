@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parallel computations over a pool of processes.
+
+The frequencies of a
+:py:class:`FrequentialSolver<openwind.frequential.frequential_solver.FrequentialSolver>`
+are independent sparse solves which openwind performs serially. The
+:py:class:`ParallelFrequentialSolver` splits the frequency axis in chunks
+solved by worker processes. The assembled matrices are shared with the
+workers by `fork` (copy-on-write, nothing is pickled); with the other start
+methods they are sent once to each worker. Each frequency goes through the
+same operations as in the serial loop of openwind, so that the impedance is
+bitwise identical.
+
+.. code-block:: python
+
+    f_solver = ParallelFrequentialSolver(instru_phy, frequencies, n_jobs=16)
+    f_solver.solve()
+    f_solver.impedance
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.sparse.linalg import spsolve
+
+from openwind import FrequentialSolver
+
+
+_WORKER_STATE = dict()
+"""dict: The matrices of the problem, in the worker processes."""
+
+
+def _init_worker(state):
+    _WORKER_STATE.clear()
+    _WORKER_STATE.update(state)
+
+
+def _solve_chunk(start, stop):
+    """Solve the frequencies `start` to `stop` (in a worker process)."""
+    Ah = _WORKER_STATE['Ah']
+    ind_diag = _WORKER_STATE['ind_diag']
+    Ah_diags = _WORKER_STATE['Ah_diags']
+    Lh = _WORKER_STATE['Lh']
+    ind_source = _WORKER_STATE['ind_source']
+    entrance_H1 = np.empty(stop - start, dtype=np.complex128)
+    for k, cpt in enumerate(range(start, stop)):
+        # identical to FrequentialSolver.solve_with_method_direct()
+        Ah.data[ind_diag] = Ah_diags[:, cpt]
+        Uh = spsolve(Ah, Lh, permc_spec='NATURAL')
+        entrance_H1[k] = Uh[ind_source]
+    return start, entrance_H1
+
+
+def default_n_jobs():
+    """
+    The number of CPUs usable by the current process.
+
+    Returns
+    -------
+    int
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class ParallelFrequentialSolver(FrequentialSolver):
+    """
+    A :py:class:`FrequentialSolver<openwind.frequential.frequential_solver.FrequentialSolver>`
+    which solves the frequencies in parallel.
+
+    The parallel path is used by :py:meth:`solve` for the direct methods
+    ('FEM', 'TMM', 'hybrid') without interpolation of the fields; the other
+    cases fall back to the serial solve of openwind.
+
+    Parameters
+    ----------
+    instru_physics : :py:class:`InstrumentPhysics<openwind.continuous.instrument_physics.InstrumentPhysics>`
+        The instrument.
+    frequencies : array of float
+        The frequencies.
+    n_jobs : int, optional
+        The number of worker processes. Default is None (the number of
+        available CPUs). With 1, the serial solve is used.
+    chunk_size : int, optional
+        The number of frequencies per task. Default is None (4 tasks per
+        worker, to balance the load).
+    mp_context : str, optional
+        The start method of the workers ('fork', 'forkserver' or 'spawn').
+        Default is 'fork' when available.
+    **kwargs :
+        The other options of :py:class:`FrequentialSolver\
+        <openwind.frequential.frequential_solver.FrequentialSolver>`.
+    """
+
+    def __init__(self, instru_physics, frequencies, n_jobs=None, chunk_size=None,
+                 mp_context=None, **kwargs):
+        self.n_jobs = n_jobs if n_jobs is not None else default_n_jobs()
+        self.chunk_size = chunk_size
+        if mp_context is None:
+            methods = multiprocessing.get_all_start_methods()
+            mp_context = 'fork' if 'fork' in methods else methods[0]
+        self.mp_context = mp_context
+        super().__init__(instru_physics, frequencies, **kwargs)
+
+    def _chunks(self):
+        n_freq = len(self.frequencies)
+        chunk_size = self.chunk_size or max(1, -(-n_freq // (4*self.n_jobs)))
+        return [(start, min(start + chunk_size, n_freq))
+                for start in range(0, n_freq, chunk_size)]
+
+    def solve_with_method_direct(self, interp=False, interp_grad=False,
+                                 enable_tracker_display=False, **kwargs):
+        if interp or interp_grad or self.n_jobs <= 1:
+            return super().solve_with_method_direct(
+                interp=interp, interp_grad=interp_grad,
+                enable_tracker_display=enable_tracker_display, **kwargs)
+        Ah, ind_diag = self._initialize_Ah_diag()
+        state = dict(Ah=Ah, ind_diag=ind_diag, Ah_diags=self.Ah_diags,
+                     Lh=self.Lh, ind_source=self.source_ref.get_source_index())
+        entrance_H1 = np.empty(self.frequencies.shape, dtype=np.complex128)
+        chunks = self._chunks()
+        with ProcessPoolExecutor(max_workers=min(self.n_jobs, len(chunks)),
+                                 mp_context=multiprocessing.get_context(self.mp_context),
+                                 initializer=_init_worker,
+                                 initargs=(state,)) as executor:
+            futures = [executor.submit(_solve_chunk, start, stop)
+                       for start, stop in chunks]
+            for future in futures:
+                start, values = future.result()
+                entrance_H1[start:start + len(values)] = values
+
+        # rescale data, as FrequentialSolver
+        convention = self.source_ref.get_convention()
+        if convention == 'PH1' and not self.source_ref.is_flute_like():
+            self.impedance = self.scaling.get_impedance() * entrance_H1
+        else:
+            self.impedance = self.scaling.get_impedance() / entrance_H1
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rational (pole-residue) models of impedances.
+
+Any computed or measured impedance (FEM, TMM, or a file read with
+:py:func:`read_impedance_text<tapas.impedance_store.read_impedance_text>`)
+is approximated by
+
+.. math::
+    Z(\\omega) \\approx d + \\sum_k \\frac{r_k}{j\\omega - p_k}
+
+with poles `p_k` in the left half-plane, coming in complex conjugate pairs
+with their residues, so that the model is real and stable. The poles are
+located with the AAA algorithm [Nakatsukasa2018]_ applied to the impedance
+and its conjugate symmetric; the residues are then fitted by linear least
+squares, after the removal of the spurious poles (Froissart doublets) and
+the reflection of the unstable ones. The poles are paired with their
+conjugates up to the accuracy of AAA; the ones without a partner (near-real
+poles along the branch cut of the losses) are folded into the upper
+half-plane.
+
+A :py:class:`RationalImpedance` is evaluated at any frequency, vectorized
+by blocks, without solving again; it is saved in JSON; its pairs of poles
+form a bank of damped modes, exported as parameters or as second order IIR
+sections:
+
+.. code-block:: python
+
+    model = fit_impedance(result.frequencies, result.impedance, tol=1e-6)
+    model(np.linspace(20, 2000, 10**6))
+    model.save('trumpet_rational.json')
+    sos = model.to_sos(44100)
+
+.. [Nakatsukasa2018] Y. Nakatsukasa, O. Sète and L. N. Trefethen, "The AAA
+   algorithm for rational approximation", SIAM J. Sci. Comput., 40(3),
+   A1494-A1522, 2018.
+"""
+
+import json
+import warnings
+
+import numpy as np
+from scipy.linalg import eig, lstsq
+
+
+def aaa(z, f, tol=1e-9, max_order=100):
+    """
+    The AAA rational approximation, in barycentric form.
+
+    Parameters
+    ----------
+    z : array of complex
+        The sample points.
+    f : array of complex
+        The values at the sample points.
+    tol : float, optional
+        The relative tolerance on the maximal error at the sample points.
+        Default is 1e-9.
+    max_order : int, optional
+        The maximal number of support points. Default is 100.
+
+    Returns
+    -------
+    support : array of complex
+        The support points.
+    values : array of complex
+        The values at the support points.
+    weights : array of complex
+        The barycentric weights.
+    """
+    z = np.asarray(z, dtype=complex)
+    f = np.asarray(f, dtype=complex)
+    remaining = np.ones(len(z), dtype=bool)
+    approx = np.full(len(f), np.mean(f))
+    support, values = list(), list()
+    cauchy = np.empty((len(z), 0), dtype=complex)
+    threshold = tol * np.max(np.abs(f))
+    for _ in range(min(max_order, len(z) - 1)):
+        index = np.argmax(np.abs(f - approx) * remaining)
+        support.append(z[index])
+        values.append(f[index])
+        remaining[index] = False
+        with np.errstate(divide='ignore', invalid='ignore'):
+            column = 1 / (z - z[index])
+        cauchy = np.column_stack([cauchy, column])
+        loewner = f[remaining, np.newaxis]*cauchy[remaining] - cauchy[remaining]*np.array(values)
+        _, _, vh = np.linalg.svd(loewner, full_matrices=False)
+        weights = vh[-1].conj()
+        approx = f.copy()
+        approx[remaining] = ((cauchy[remaining] @ (weights*np.array(values)))
+                             / (cauchy[remaining] @ weights))
+        if np.max(np.abs(f - approx)) <= threshold:
+            break
+    return np.array(support), np.array(values), weights
+
+
+def aaa_poles(support, weights):
+    """
+    The poles of a barycentric rational function.
+
+    Parameters
+    ----------
+    support : array of complex
+        The support points.
+    weights : array of complex
+        The barycentric weights.
+
+    Returns
+    -------
+    array of complex
+    """
+    m = len(support)
+    E = np.zeros((m + 1, m + 1), dtype=complex)
+    E[0, 1:] = weights
+    E[1:, 0] = 1
+    E[1:, 1:] = np.diag(support)
+    B = np.eye(m + 1, dtype=complex)
+    B[0, 0] = 0
+    eigenvalues = eig(E, B, right=False)
+    return eigenvalues[np.isfinite(eigenvalues)]
+
+
+class RationalImpedance:
+    """
+    An impedance in pole-residue form.
+
+    Parameters
+    ----------
+    poles : array of complex
+        The poles with a non-negative imaginary part, in rad/s. The poles
+        with a positive imaginary part stand for the conjugate pairs.
+    residues : array of complex
+        The residues of these poles (real for the real poles).
+    constant : float
+        The constant term `d`.
+
+    Attributes
+    ----------
+    fit_error : float
+        The maximal relative error on the fitted data.
+    """
+
+    def __init__(self, poles, residues, constant=0., fit_error=np.nan):
+        self.poles = np.asarray(poles, dtype=complex)
+        self.residues = np.asarray(residues, dtype=complex)
+        self.constant = float(np.real(constant))
+        self.fit_error = fit_error
+
+    def __repr__(self):
+        return ("<tapas.rational.RationalImpedance({} modes, fit error "
+                "{:.1e})>".format(len(self.poles), self.fit_error))
+
+    @property
+    def order(self):
+        """int: The number of poles, counting both poles of each pair."""
+        return int(np.sum(np.where(self.poles.imag > 0, 2, 1)))
+
+    def __call__(self, frequencies, block_size=65536):
+        """
+        Evaluate the impedance.
+
+        Parameters
+        ----------
+        frequencies : array of float
+            The frequencies in Hz (any shape).
+        block_size : int, optional
+            The number of frequencies evaluated at once. Default is 65536.
+
+        Returns
+        -------
+        array of complex
+        """
+        frequencies = np.asarray(frequencies, dtype=float)
+        flat = frequencies.ravel()
+        impedance = np.empty(flat.shape, dtype=complex)
+        # each pair is summed as one second order fraction:
+        # (2Re(r) s - 2Re(r p*)) / (s**2 - 2Re(p) s + |p|**2)
+        pairs = self.poles.imag > 0
+        poles, residues = self.poles[pairs], self.residues[pairs]
+        num_1, num_0 = 2*residues.real, -2*(residues*poles.conj()).real
+        den_1, den_0 = -2*poles.real, np.abs(poles)**2
+        real_poles, real_residues = self.poles[~pairs].real, self.residues[~pairs].real
+        for start in range(0, len(flat), block_size):
+            omega = 2*np.pi*flat[start:start + block_size, np.newaxis]
+            terms = ((num_0 + 1j*omega*num_1)
+                     / (den_0 - omega**2 + 1j*omega*den_1)).sum(axis=1)
+            if len(real_poles):
+                terms += (real_residues / (1j*omega - real_poles)).sum(axis=1)
+            impedance[start:start + block_size] = self.constant + terms
+        return impedance.reshape(frequencies.shape)
+
+    # -------------------------------------------------------------- modal bank
+    def modal_bank(self):
+        """
+        The damped modes of the impedance.
+
+        Each pair of poles `p = -alpha + j omega` gives a mode whose impulse
+        response is `2 Re(r exp(p t))`, i.e. `2|r| exp(-alpha t) cos(omega t
+        + arg(r))`. The real poles are non-oscillating modes (frequency 0).
+
+        Returns
+        -------
+        dict
+            The 'frequencies' (Hz), 'decay_rates' (1/s), 'amplitudes' (`|r|`,
+            doubled for the pairs) and 'phases' (rad) of the modes, sorted by
+            frequency, and the 'constant' term.
+        """
+        order = np.argsort(self.poles.imag)
+        poles, residues = self.poles[order], self.residues[order]
+        doubled = np.where(poles.imag > 0, 2, 1)
+        return dict(frequencies=poles.imag / (2*np.pi),
+                    decay_rates=-poles.real,
+                    amplitudes=doubled*np.abs(residues),
+                    phases=np.angle(residues),
+                    constant=self.constant)
+
+    def impulse_response(self, samplerate, duration):
+        """
+        The impulse response of the modes (without the constant term).
+
+        Parameters
+        ----------
+        samplerate : float
+            The sample rate in Hz.
+        duration : float
+            The duration in s.
+
+        Returns
+        -------
+        array of float
+        """
+        t = np.arange(int(round(duration*samplerate))) / samplerate
+        response = np.zeros(len(t))
+        for pole, residue in zip(self.poles, self.residues):
+            mode = residue * np.exp(pole*t)
+            response += 2*mode.real if pole.imag > 0 else mode.real
+        return response
+
+    def to_sos(self, samplerate):
+        """
+        The modes as parallel second order IIR sections (impulse invariance).
+
+        The sum of the outputs of the sections, fed with the same input,
+        approximates the convolution with :py:meth:`impulse_response` (the
+        constant term is a direct path, not included).
+
+        Parameters
+        ----------
+        samplerate : float
+            The sample rate in Hz.
+
+        Returns
+        -------
+        array of float
+            The sections, of shape `(n_modes, 6)`, each row being `[b0, b1,
+            b2, 1, a1, a2]` as in :py:func:`scipy.signal.sosfilt` (which
+            cascades the sections: filter each row separately and sum).
+        """
+        T = 1 / samplerate
+        sos = np.zeros((len(self.poles), 6))
+        for k, (pole, residue) in enumerate(zip(self.poles, self.residues)):
+            a = np.exp(pole*T)
+            if pole.imag > 0:
+                sos[k] = [2*T*residue.real, -2*T*(residue*a.conj()).real, 0,
+                          1, -2*a.real, abs(a)**2]
+            else:
+                sos[k] = [T*residue.real, 0, 0, 1, -a.real, 0]
+        return sos
+
+    # ---------------------------------------------------------- serialization
+    def to_dict(self):
+        """
+        Returns
+        -------
+        dict
+            A JSON-serializable description, see :py:meth:`from_dict`.
+        """
+        return dict(poles=[[p.real, p.imag] for p in self.poles],
+                    residues=[[r.real, r.imag] for r in self.residues],
+                    constant=self.constant, fit_error=float(self.fit_error))
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuild a model from :py:meth:`to_dict`.
+
+        Parameters
+        ----------
+        data : dict
+
+        Returns
+        -------
+        :py:class:`RationalImpedance`
+        """
+        poles = [complex(*p) for p in data['poles']]
+        residues = [complex(*r) for r in data['residues']]
+        return cls(poles, residues, data['constant'],
+                   data.get('fit_error', np.nan))
+
+    def save(self, filename):
+        """
+        Save the model in JSON.
+
+        Parameters
+        ----------
+        filename : str
+        """
+        with open(filename, 'w') as file:
+            json.dump(self.to_dict(), file, indent=1)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load a model saved with :py:meth:`save`.
+
+        Parameters
+        ----------
+        filename : str
+
+        Returns
+        -------
+        :py:class:`RationalImpedance`
+        """
+        with open(filename) as file:
+            return cls.from_dict(json.load(file))
+
+
+def _pair_poles(poles, pair_tol=1e-6):
+    """
+    One pole per conjugate pair, and the real poles.
+
+    The poles of the conjugate symmetric data come in pairs up to the
+    accuracy of AAA: a pole of the lower half-plane is matched to the closest
+    conjugate of an upper pole within `pair_tol` (relative). The poles
+    without a partner (near-real poles along the branch cut of the losses)
+    are folded into the upper half-plane rather than dropped.
+    """
+    is_real = np.abs(poles.imag) < 1e-8*np.abs(poles)
+    upper = list(poles[~is_real & (poles.imag > 0)])
+    matched = np.zeros(len(upper), dtype=bool)
+    unmatched = list()
+    for pole in poles[~is_real & (poles.imag < 0)]:
+        if upper:
+            distance = np.abs(np.array(upper) - pole.conj())
+            distance[matched] = np.inf
+            closest = np.argmin(distance)
+            if distance[closest] <= pair_tol*np.abs(pole):
+                matched[closest] = True
+                continue
+        unmatched.append(pole.conj())
+    return np.concatenate([poles[is_real].real, upper,
+                           unmatched]).astype(complex)
+
+
+def _fit_residues(s, impedance, poles):
+    """Real least squares fit of the residues and constant for given poles."""
+    pairs = poles.imag > 0
+    columns = [np.ones_like(s)]
+    for pole, is_pair in zip(poles, pairs):
+        if is_pair:
+            first = 1/(s - pole)
+            second = 1/(s - pole.conj())
+            columns += [first + second, 1j*(first - second)]
+        else:
+            columns.append(1/(s - pole.real))
+    A = np.array(columns).T
+    scale = np.linalg.norm(A, axis=0)
+    A_real = np.vstack([A.real, A.imag]) / scale
+    b_real = np.concatenate([impedance.real, impedance.imag])
+    x = lstsq(A_real, b_real)[0] / scale
+    residues = list()
+    k = 1
+    for is_pair in pairs:
+        if is_pair:
+            residues.append(x[k] + 1j*x[k + 1])
+            k += 2
+        else:
+            residues.append(x[k])
+            k += 1
+    return np.array(residues, dtype=complex), x[0]
+
+
+def fit_impedance(frequencies, impedance, tol=1e-6, max_order=100,
+                  cleanup_tol=1e-10):
+    """
+    Fit a stable pole-residue model on an impedance.
+
+    Parameters
+    ----------
+    frequencies : array of float
+        The frequencies in Hz (positive).
+    impedance : array of complex
+        The impedance at these frequencies.
+    tol : float, optional
+        The relative tolerance of the AAA algorithm. Default is 1e-6.
+    max_order : int, optional
+        The maximal number of support points of the AAA algorithm. Default is
+        100.
+    cleanup_tol : float, optional
+        The poles whose contribution on the frequency range is smaller than
+        `cleanup_tol` times the maximal impedance are removed. Default is
+        1e-10.
+
+    Returns
+    -------
+    :py:class:`RationalImpedance`
+
+    Warns
+    -----
+    UserWarning
+        If the fit error is above 10 times `tol`.
+    """
+    frequencies = np.asarray(frequencies, dtype=float)
+    impedance = np.asarray(impedance, dtype=complex)
+    valid = np.isfinite(impedance)
+    frequencies, impedance = frequencies[valid], impedance[valid]
+    omega_ref = 2*np.pi*np.max(frequencies)
+    s = 2j*np.pi*frequencies
+
+    # the poles, from the data and its conjugate symmetric (real system)
+    support, _, weights = aaa(np.concatenate([s, s.conj()]) / omega_ref,
+                              np.concatenate([impedance, impedance.conj()]),
+                              tol=tol, max_order=max_order)
+    poles = aaa_poles(support, weights) * omega_ref
+    # stability: reflection of the unstable poles
+    poles = np.where(poles.real > 0, -poles.conj(), poles)
+    poles = _pair_poles(poles)
+
+    residues, constant = _fit_residues(s, impedance, poles)
+    # remove the spurious poles and fit again
+    pairs = poles.imag > 0
+    contribution = np.max(np.abs(residues[:, np.newaxis]
+                                 / (s - poles[:, np.newaxis])), axis=1)
+    contribution[pairs] *= 2
+    keep = contribution > cleanup_tol*np.max(np.abs(impedance))
+    poles = poles[keep]
+    residues, constant = _fit_residues(s, impedance, poles)
+    model = RationalImpedance(poles, residues, constant)
+    model.fit_error = float(np.max(np.abs(model(frequencies) - impedance))
+                            / np.max(np.abs(impedance)))
+    if model.fit_error > 10*tol:
+        warnings.warn('The fit error {:.1e} is above the tolerance {:.1e}: '
+                      'increase max_order or sample the impedance more '
+                      'finely.'.format(model.fit_error, tol))
+    return model
+
+
+def fit_file(filename, **kwargs):
+    """
+    Fit a pole-residue model on an impedance file.
+
+    Parameters
+    ----------
+    filename : str
+        A text file (as written by openwind) or a binary file of
+        :py:mod:`tapas.impedance_store`.
+    **kwargs :
+        The options of :py:func:`fit_impedance`.
+
+    Returns
+    -------
+    :py:class:`RationalImpedance`
+    """
+    from .impedance_store import (EXTENSION, read_impedance_binary,
+                                  read_impedance_text)
+
+    if filename.endswith(EXTENSION):
+        frequencies, impedance, _ = read_impedance_binary(filename)
+    else:
+        frequencies, impedance = read_impedance_text(filename)
+    return fit_impedance(frequencies, impedance, **kwargs)
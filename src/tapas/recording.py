@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Recording of temporal simulations streamed to disk.
+
+:py:class:`RecordingDevice<openwind.temporal.recording_device.RecordingDevice>`
+appends every recorded quantity of every time step to Python lists until
+`stop_recording()`: for long simulations, or with `record_energy=True` which
+records several energies per pipe, the memory grows with the duration.
+:py:class:`DiskRecordingDevice` has the same use:
+
+.. code-block:: python
+
+    rec = DiskRecordingDevice('flute.hdf5', channels=['bell_radiation_pressure',
+                                                     'source_*'],
+                              decimation=4)
+    t_solver.run_simulation(15, callback=rec.callback)
+    rec.stop_recording()
+    bell_pressure = rec.values['bell_radiation_pressure']
+
+but keeps only the selected channels, optionally decimated, and writes them to
+a chunked HDF5 file as the simulation runs: the time steps are stored in
+preallocated blocks which are filtered and appended to the file by a
+background thread, so the memory used does not depend on the duration.
+"""
+
+import fnmatch
+import queue
+import threading
+
+import numpy as np
+
+from .resampling import PolyphaseResampler
+
+
+def _energy_getters(t_comp):
+    """The energies recorded by `RecordingDevice(record_energy=True)`."""
+    getters = dict()
+    for attr in dir(t_comp):
+        if attr.startswith('energy') and callable(getattr(t_comp, attr)):
+            getters[attr.replace('energy', 'E')] = getattr(t_comp, attr)
+    getters['Q'] = t_comp.dissipated_last_step
+    return getters
+
+
+class StoredValues:
+    """
+    The channels of a :py:class:`DiskRecordingDevice`, read from its file.
+
+    It is a read-only mapping: `values[channel]` reads the whole channel as a
+    numpy array. Parts of long channels can be read with `values.read()`.
+
+    Parameters
+    ----------
+    rec : :py:class:`DiskRecordingDevice`
+        The recording.
+    """
+
+    def __init__(self, rec):
+        self._rec = rec
+
+    def __repr__(self):
+        return '<tapas.recording.StoredValues({})>'.format(list(self))
+
+    def keys(self):
+        return list(self._rec.channels)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._rec.channels)
+
+    def __contains__(self, key):
+        return key in self._rec.channels
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def __getitem__(self, key):
+        return self.read(key)
+
+    def read(self, key, start=None, stop=None, step=None):
+        """
+        Read a channel, or a part of it.
+
+        Parameters
+        ----------
+        key : str
+            The channel.
+        start, stop, step : int, optional
+            The recorded instants read, as `slice(start, stop, step)`.
+
+        Returns
+        -------
+        array
+        """
+        if key not in self._rec.channels and key != 'ts':
+            raise KeyError(key)
+        return self._rec._read(key, slice(start, stop, step))
+
+
+class DiskRecordingDevice:
+    """
+    Record a temporal simulation in an HDF5 file, block by block.
+
+    It is used as :py:class:`RecordingDevice\
+    <openwind.temporal.recording_device.RecordingDevice>`: its
+    :py:meth:`callback` is given to `TemporalSolver.run_simulation()` and
+    :py:meth:`stop_recording` must be called at the end. The recorded
+    channels are named as the keys of `RecordingDevice.values`; with the
+    interpolation of the solver (`interp_grid`), 'P_interp', 'V_interp' and
+    'gradP_interp' are channels too.
+
+    With `decimation=q`, one instant out of `q` is kept. By default the
+    signals are low-pass filtered before (a windowed sinc
+    :py:class:`PolyphaseResampler<tapas.resampling.PolyphaseResampler>`,
+    cutting at 90% of the new Nyquist frequency), so that the recorded
+    sound is not aliased.
+
+    Parameters
+    ----------
+    filename : str
+        The HDF5 file, overwritten.
+    channels : list of str, optional
+        The recorded channels. Shell-style wildcards are accepted
+        ('bore*_E', 'source_*'). Default is None: all the channels.
+    record_energy : bool, optional
+        Make the energies of the components available as channels, as
+        `RecordingDevice(record_energy=True)`. Default is False.
+    decimation : int, optional
+        Keep one time step out of `decimation`. Default is 1.
+    anti_alias : bool, optional
+        Filter the channels before the decimation. Default is True.
+    block_size : int, optional
+        The number of time steps stored before being written. Default is
+        4096.
+    n_buffers : int, optional
+        The number of blocks allocated. When all of them are waiting to be
+        written, the simulation waits for the writer. Default is 4.
+    compression : str, optional
+        The compression of the datasets (see `h5py`), for example 'gzip'.
+        Default is None.
+
+    Attributes
+    ----------
+    channels : list of str
+        The recorded channels, known after the first time step.
+    values : :py:class:`StoredValues`
+        The recorded channels, read from the file.
+    dt : float
+        The time step of the recorded simulation (as `RecordingDevice.dt`).
+    t_solver : :py:class:`TemporalSolver<openwind.temporal.temporal_solver.TemporalSolver>`
+        The temporal solver recorded.
+    """
+
+    def __init__(self, filename, channels=None, record_energy=False,
+                 decimation=1, anti_alias=True, block_size=4096, n_buffers=4,
+                 compression=None):
+        if int(decimation) != decimation or decimation < 1:
+            raise ValueError('The decimation must be a positive integer, not '
+                             '{}.'.format(decimation))
+        if block_size < 1 or n_buffers < 1:
+            raise ValueError('The block size and the number of buffers must be'
+                             ' positive.')
+        self.filename = filename
+        self.patterns = channels
+        self.record_energy = record_energy
+        self.decimation = int(decimation)
+        self.anti_alias = anti_alias
+        self.block_size = int(block_size)
+        self.n_buffers = int(n_buffers)
+        self.compression = compression
+        self.channels = list()
+        self.values = StoredValues(self)
+        self.dt = None
+        self.t_solver = None
+        self.n_recorded = 0
+        self._stopped = False
+        self._file = None
+        self._sources = list()
+        self._filters = dict()
+        self._n_inputs = 0
+        self._block = None
+        self._row = 0
+        self._free = queue.Queue()
+        self._pending = queue.Queue()
+        self._writer = None
+        self._error = None
+
+    def __repr__(self):
+        return ("<tapas.recording.DiskRecordingDevice('{}', {}, channels={}, "
+                "decimation={}, n_recorded={})>".format(
+                    self.filename, 'stopped' if self._stopped else 'running',
+                    self.channels, self.decimation, self.n_recorded))
+
+    def _available_sources(self, t_solver):
+        """
+        The channels, grouped by the function giving their values.
+
+        Returns a list of `(getter, [(key, channel), ...])`: the value of the
+        channel is `getter()[key]`.
+        """
+        groups = list()
+        for t_comp in t_solver.t_components:
+            groups.append((t_comp.get_values_to_record,
+                           [(name, t_comp.label + '_' + name)
+                            for name in t_comp.get_values_to_record()]))
+            if self.record_energy:
+                for name, method in _energy_getters(t_comp).items():
+                    groups.append((lambda method=method: (method(),),
+                                   [(0, t_comp.label + '_' + name)]))
+        if t_solver.use_interp:
+            groups.append((t_solver.get_current_PVgradP_interp,
+                           [(0, 'P_interp'), (1, 'V_interp'),
+                            (2, 'gradP_interp')]))
+        return groups
+
+    def _select(self, available):
+        if self.patterns is None:
+            return list(available)
+        selected = list()
+        for pattern in self.patterns:
+            matches = fnmatch.filter(available, pattern)
+            if not matches:
+                raise ValueError("Unknown channel '{}', chose between {}"
+                                 .format(pattern, available))
+            selected += [name for name in matches if name not in selected]
+        return selected
+
+    def _start(self, t_solver):
+        """Create the datasets, the blocks and the writer thread."""
+        import h5py
+        self.t_solver = t_solver
+        self.dt = t_solver.get_dt()
+        groups = self._available_sources(t_solver)
+        selected = self._select([channel for _, keys in groups
+                                 for _, channel in keys])
+        self._sources = [(getter, [(key, channel) for key, channel in keys
+                                   if channel in selected])
+                         for getter, keys in groups]
+        self._sources = [source for source in self._sources if source[1]]
+        first = dict()
+        for getter, keys in self._sources:
+            values = getter()
+            for key, channel in keys:
+                first[channel] = np.asarray(values[key])
+        # the channels in the order of the solver
+        self.channels = list(first)
+        first = list(first.values())
+        chunk = max(self.block_size // self.decimation, 1)
+
+        self._file = h5py.File(self.filename, 'w')
+        self._file.attrs['dt'] = self.dt
+        self._file.attrs['decimation'] = self.decimation
+        self._file.attrs['anti_alias'] = self.anti_alias
+        self._file.create_dataset('ts', shape=(0,), maxshape=(None,),
+                                  dtype=np.float64, chunks=(chunk,))
+        for name, value in zip(self.channels, first):
+            self._file.create_dataset(name, shape=(0,) + value.shape,
+                                      maxshape=(None,) + value.shape,
+                                      dtype=value.dtype,
+                                      chunks=(chunk,) + value.shape,
+                                      compression=self.compression)
+        for _ in range(self.n_buffers):
+            block = {name: np.empty((self.block_size,) + value.shape,
+                                    dtype=value.dtype)
+                     for name, value in zip(self.channels, first)}
+            block['ts'] = np.empty(self.block_size)
+            self._free.put(block)
+        self._block = self._free.get()
+        self._row = 0
+
+        self._filters = dict()
+        if self.decimation > 1 and self.anti_alias:
+            # one filter per scalar signal, exact steps of `decimation` inputs
+            self._filters = {name: [PolyphaseResampler(self.decimation, 1)
+                                    for _ in range(max(value.size, 1))]
+                             for name, value in zip(self.channels, first)}
+        self._n_inputs = 0
+        self._writer = threading.Thread(target=self._write_loop,
+                                        name='tapas-recording', daemon=True)
+        self._writer.start()
+
+    def callback(self, t_solver):
+        """
+        Record the current time step.
+
+        It must be given as an option of `TemporalSolver.run_simulation()`,
+        as `RecordingDevice.callback()`.
+
+        Parameters
+        ----------
+        t_solver : :py:class:`TemporalSolver<openwind.temporal.temporal_solver.TemporalSolver>`
+            The temporal solver recorded.
+        """
+        if self._stopped:
+            raise RuntimeError('The recording is stopped.')
+        if self._error is not None:
+            raise self._error
+        if self._file is None:
+            self._start(t_solver)
+        block, row = self._block, self._row
+        # Recording saves values from time t = dt*(n-1/2)
+        block['ts'][row] = t_solver.get_current_time() - self.dt/2
+        for getter, keys in self._sources:
+            values = getter()
+            for key, channel in keys:
+                block[channel][row] = values[key]
+        self._row += 1
+        if self._row == self.block_size:
+            self._submit()
+
+    def _submit(self):
+        """Give the current block to the writer and take a free one."""
+        self._pending.put((self._block, self._row))
+        self._block = self._free.get()
+        self._row = 0
+
+    def _decimate(self, name, data, flush=False):
+        """The kept instants of `data`, following the previous blocks."""
+        if self.decimation == 1:
+            return data
+        if not self.anti_alias or name == 'ts':
+            first = -self._n_inputs % self.decimation
+            return data[first::self.decimation]
+        filters = self._filters[name]
+        if flush:
+            out = [resampler.flush() for resampler in filters]
+        else:
+            columns = data.reshape(len(data), -1)
+            out = [resampler.process(columns[:, k])
+                   for k, resampler in enumerate(filters)]
+        shape = self._file[name].shape[1:]
+        return np.stack(out, axis=-1).reshape((-1,) + shape)
+
+    def _append(self, name, data):
+        dset = self._file[name]
+        n = dset.shape[0]
+        dset.resize(n + len(data), axis=0)
+        dset[n:] = data
+
+    def _write_loop(self):
+        """Write the blocks (in the writer thread)."""
+        while True:
+            item = self._pending.get()
+            try:
+                if item is None:
+                    if self._filters:
+                        for name in self.channels:
+                            self._append(name, self._decimate(name, None,
+                                                              flush=True))
+                    self._file.flush()
+                    return
+                block, n_rows = item
+                if self._error is None:
+                    for name in ['ts'] + self.channels:
+                        self._append(name, self._decimate(name,
+                                                          block[name][:n_rows]))
+                    self._n_inputs += n_rows
+                self._free.put(block)
+            except Exception as error:
+                self._error = error
+                if item is not None:
+                    self._free.put(item[0])
+            finally:
+                self._pending.task_done()
+
+    def flush(self):
+        """
+        Wait until the blocks already filled are written in the file.
+
+        The time steps of the current block are not written yet.
+        """
+        if self._writer is not None and not self._stopped:
+            self._pending.join()
+        if self._error is not None:
+            raise self._error
+
+    def stop_recording(self):
+        """
+        Notify the device that the simulation is over.
+
+        Writes the last time steps and closes the file, which can then be read
+        through :py:attr:`values` and :py:attr:`ts`.
+        """
+        if self._stopped:
+            return
+        self._stopped = True
+        if self._file is None:
+            return
+        if self._row > 0:
+            self._pending.put((self._block, self._row))
+        self._pending.put(None)
+        self._writer.join()
+        self.n_recorded = self._file['ts'].shape[0]
+        self._file.close()
+        self._file = None
+        self._block = None
+        while not self._free.empty():
+            self._free.get()
+        if self._error is not None:
+            raise self._error
+
+    def _read(self, key, index):
+        import h5py
+        if not self._stopped:
+            raise RuntimeError('The recording must be stopped before being '
+                               'read.')
+        with h5py.File(self.filename, 'r') as file:
+            return file[key][index]
+
+    @property
+    def ts(self):
+        """array of float: The recorded instants."""
+        return self.values.read('ts')
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reduced order model of the frequential problem (rational Krylov).
+
+For each frequency, the direct solver of openwind factorizes the sparse
+matrix `Ah(w) = A + diag(D(w))` of size `n_tot`, where only the diagonal
+`D(w)` depends on the frequency. The :py:class:`ReducedFrequentialSolver`
+factorizes it at a few expansion frequencies only. At each of them, the
+solution and its first derivatives with respect to the frequency (the
+moments) are added to a projection basis `V`. The problem is then solved on
+the whole band in the subspace spanned by `V`, with the small dense system
+`V^H Ah(w) V y = V^H Lh`.
+
+The diagonal is compressed beforehand (truncated SVD of a subsample of
+`D(w)`): the reduced matrices are combinations of a few precomputed
+matrices. The a posteriori error indicator is the correction of the impedance
+due to the residual `Lh - Ah(w) V y` of the full problem, computed with the
+factorization of the closest expansion frequency. Expansion points are added
+at its maximum until it is below the tolerance everywhere.
+
+.. code-block:: python
+
+    f_solver = ReducedFrequentialSolver(instru_phy, frequencies, rtol=1e-6)
+    f_solver.solve()
+    f_solver.impedance, f_solver.error_indicator
+    f_solver.model.expansion_frequencies
+
+The :py:class:`ReducedModel` is independent of the solver: it can be given
+to another solver (e.g. after a modification of the geometry during an
+inversion), whose solve starts from its expansion frequencies instead of
+searching them. The basis is rebuilt at these frequencies: the vectors of
+another problem only approximate the new solutions, and the error indicator
+would add as many vectors again to correct them.
+"""
+
+import warnings
+
+import numpy as np
+from scipy.sparse import diags
+from scipy.sparse.linalg import splu
+
+from openwind import FrequentialSolver
+
+
+class ReducedModel:
+    """
+    A projection basis of the frequential problem.
+
+    The unknowns of the problem spread over many orders of magnitude: the
+    basis is orthonormal for the scaled unknowns `x / scale`, which improves
+    the conditioning of the reduced systems by several orders of magnitude.
+
+    Parameters
+    ----------
+    scale : array of float
+        The scaling of the degrees of freedom, see :py:func:`dof_scale`.
+
+    Attributes
+    ----------
+    basis : array of complex
+        The orthonormal basis of the scaled unknowns, of shape
+        `(n_tot, order)`. The basis of the unknowns is `scale * basis`.
+    expansion_frequencies : list of float
+        The frequencies at which the full problem has been factorized.
+    """
+
+    def __init__(self, scale):
+        self.scale = np.asarray(scale)
+        self.basis = np.zeros((len(self.scale), 0), dtype=np.complex128)
+        self.expansion_frequencies = list()
+
+    def __repr__(self):
+        return ("<tapas.reduced.ReducedModel(order {}, {} expansion "
+                "frequencies)>".format(self.order,
+                                       len(self.expansion_frequencies)))
+
+    @property
+    def order(self):
+        """int: The dimension of the reduced space."""
+        return self.basis.shape[1]
+
+    def extend(self, vectors, drop_tol=1e-10):
+        """
+        Add vectors to the basis.
+
+        They are scaled and orthonormalized against the basis (Gram-Schmidt
+        applied twice); those already (almost) in the reduced space are
+        dropped.
+
+        Parameters
+        ----------
+        vectors : array of complex
+            The vectors of unknowns, of shape `(n_tot, n_vectors)`.
+        drop_tol : float, optional
+            The relative norm under which a vector is dropped. Default is
+            1e-10.
+
+        Returns
+        -------
+        int
+            The number of vectors added.
+        """
+        added = 0
+        for vector in np.asarray(vectors).T / self.scale:
+            norm = np.linalg.norm(vector)
+            if norm == 0:
+                continue
+            vector = vector / norm
+            for _ in range(2):
+                vector = vector - self.basis @ (self.basis.conj().T @ vector)
+            norm = np.linalg.norm(vector)
+            if norm > drop_tol:
+                self.basis = np.column_stack([self.basis, vector / norm])
+                added += 1
+        return added
+
+
+class ReducedFrequentialSolver(FrequentialSolver):
+    """
+    A :py:class:`FrequentialSolver<openwind.frequential.frequential_solver.FrequentialSolver>`
+    which solves a reduced order model of the problem.
+
+    The reduced path is used by :py:meth:`solve` for the direct methods
+    ('FEM', 'TMM', 'hybrid') without interpolation of the fields; the other
+    cases fall back to the solve of openwind.
+
+    Parameters
+    ----------
+    instru_physics : :py:class:`InstrumentPhysics<openwind.continuous.instrument_physics.InstrumentPhysics>`
+        The instrument.
+    frequencies : array of float
+        The frequencies.
+    rtol : float, optional
+        The tolerance on the estimated relative error of the impedance at
+        each frequency. Default is 1e-6.
+    n_moments : int, optional
+        The number of vectors added per expansion frequency (the solution and
+        its `n_moments - 1` first derivatives). Default is 2.
+    n_initial : int, optional
+        The number of initial expansion frequencies, uniformly spread on the
+        band. Default is 3.
+    max_expansions : int, optional
+        The maximal number of expansion frequencies per solve. Default is 50.
+    model : :py:class:`ReducedModel`, optional
+        A model to start from, e.g. computed for a previous geometry: the
+        basis is rebuilt at its expansion frequencies. Default is None.
+    **kwargs :
+        The other options of :py:class:`FrequentialSolver\
+        <openwind.frequential.frequential_solver.FrequentialSolver>`.
+
+    Attributes
+    ----------
+    model : :py:class:`ReducedModel`
+        The basis, rebuilt by each solve.
+    error_indicator : array of float
+        The estimated relative error of the impedance at each frequency.
+    n_factorizations : int
+        The number of sparse factorizations of the last solve.
+    """
+
+    def __init__(self, instru_physics, frequencies, rtol=1e-6, n_moments=2,
+                 n_initial=3, max_expansions=50, model=None, **kwargs):
+        self.rtol = rtol
+        self.n_moments = n_moments
+        self.n_initial = n_initial
+        self.max_expansions = max_expansions
+        self.model = model
+        self.error_indicator = None
+        self.n_factorizations = 0
+        super().__init__(instru_physics, frequencies, **kwargs)
+
+    def solve_with_method_direct(self, interp=False, interp_grad=False,
+                                 enable_tracker_display=False, **kwargs):
+        if interp or interp_grad:
+            return super().solve_with_method_direct(
+                interp=interp, interp_grad=interp_grad,
+                enable_tracker_display=enable_tracker_display, **kwargs)
+        entrance_H1 = self._solve_reduced()
+
+        # rescale data, as FrequentialSolver
+        convention = self.source_ref.get_convention()
+        if convention == 'PH1' and not self.source_ref.is_flute_like():
+            self.impedance = self.scaling.get_impedance() * entrance_H1
+        else:
+            self.impedance = self.scaling.get_impedance() / entrance_H1
+
+    # ------------------------------------------------------------- reduction
+    def _solve_reduced(self):
+        Ah, ind_diag = self._initialize_Ah_diag()
+        offdiag = self.Ah_nodiag.tocsr()
+        offdiag = offdiag - diags(offdiag.diagonal())
+        Lh = self.Lh.toarray().ravel()
+        ind_source = self.source_ref.get_source_index()
+        n_freq = len(self.frequencies)
+        previous = list()
+        if self.model is not None:
+            previous = self.model.expansion_frequencies
+        self.model = ReducedModel(dof_scale(offdiag, self.Ah_diags))
+        diag_modes, diag_coefs = _compress_diagonal(self.Ah_diags)
+
+        # the adjoint solutions for the estimator, by index of frequency
+        self._adjoints = dict()
+        if len(previous) == 0:
+            initial = np.linspace(0, n_freq - 1, min(self.n_initial, n_freq))
+        else:
+            initial = np.argmin(np.abs(self.frequencies[:, np.newaxis]
+                                       - np.array(previous)), axis=0)
+        for index in np.unique(np.round(initial).astype(int)):
+            self._expand(Ah, ind_diag, Lh, ind_source, index)
+        while True:
+            reduced = self._reduced_states(offdiag, diag_modes, diag_coefs, Lh)
+            errors = self._estimate_errors(offdiag, Lh, reduced, ind_source)
+            worst = int(np.argmax(errors))
+            new_points = self._new_expansion_points(errors)
+            if len(new_points) == 0:
+                break
+            for index in new_points:
+                self._expand(Ah, ind_diag, Lh, ind_source, index)
+        self.n_factorizations = len(self._adjoints)
+        del self._adjoints
+        if errors[worst] > self.rtol:
+            warnings.warn('The reduced model did not reach the tolerance: '
+                          'estimated error {:.2e} at {:g} Hz.'.format(
+                              errors[worst], self.frequencies[worst]))
+        self.error_indicator = errors
+        return self._basis()[ind_source] @ reduced
+
+    def _new_expansion_points(self, errors):
+        """The worst frequency between each pair of expansion frequencies."""
+        bounds = sorted(self._adjoints)
+        bounds = [-1] + bounds + [len(errors)]
+        candidates = list()
+        for left, right in zip(bounds[:-1], bounds[1:]):
+            if right - left > 1:
+                index = left + 1 + int(np.argmax(errors[left + 1:right]))
+                if errors[index] > self.rtol:
+                    candidates.append(index)
+        # the worst ones first, within the budget of factorizations
+        candidates.sort(key=lambda index: -errors[index])
+        return candidates[:max(0, self.max_expansions - len(self._adjoints))]
+
+    def _expand(self, Ah, ind_diag, Lh, ind_source, index):
+        """Add the moments at the frequency `index` to the basis."""
+        Ah.data[ind_diag] = self.Ah_diags[:, index]
+        lu = splu(Ah, permc_spec='NATURAL')
+        unit = np.zeros(self.n_tot)
+        unit[ind_source] = 1
+        self._adjoints[index] = lu.solve(unit, trans='T')
+        moments = [lu.solve(Lh)]
+        if self.n_moments > 1 and len(self.frequencies) > 1:
+            # derivative of the diagonal by finite differences on the axis
+            before = max(index - 1, 0)
+            after = min(index + 1, len(self.frequencies) - 1)
+            dD = ((self.Ah_diags[:, after] - self.Ah_diags[:, before])
+                  / (self.frequencies[after] - self.frequencies[before]))
+            for _ in range(self.n_moments - 1):
+                moments.append(-lu.solve(dD * moments[-1]))
+        self.model.expansion_frequencies.append(float(self.frequencies[index]))
+        self.model.extend(np.array(moments).T)
+
+    def _basis(self):
+        return self.model.scale[:, np.newaxis] * self.model.basis
+
+    def _reduced_states(self, offdiag, diag_modes, diag_coefs, Lh):
+        """The coordinates of the reduced solutions, (order, n_freq)."""
+        V = self._basis()
+        Vh = V.conj().T
+        A_red = Vh @ (offdiag @ V)
+        # V^H diag(D(w)) V = sum_r coefs[r, w] V^H diag(modes[:, r]) V
+        modes_red = np.array([Vh @ (mode[:, np.newaxis] * V)
+                              for mode in diag_modes.T])
+        systems = (A_red[np.newaxis]
+                   + np.tensordot(diag_coefs.T, modes_red, axes=1))
+        rhs = np.broadcast_to(Vh @ Lh, systems.shape[:2])
+        return np.linalg.solve(systems, rhs[..., np.newaxis])[..., 0].T
+
+    def _estimate_errors(self, offdiag, Lh, reduced, ind_source,
+                         chunk_size=1024):
+        """
+        The estimated relative errors of the impedance at each frequency.
+
+        The error `Ah(w)^-1 r(w)` due to the residual `r(w)` of the full
+        problem is approximated with the factorization of the closest
+        expansion frequency (the matrix being sensitive to its scaling, the
+        norm of the residual itself is not a reliable indicator). Only its
+        entry at the source is needed: it is the product of the residual with
+        the solution of the adjoint problem `Ah^T a = e_source`.
+        """
+        indices = np.array(sorted(self._adjoints))
+        closest = indices[np.argmin(np.abs(
+            self.frequencies[:, np.newaxis] - self.frequencies[indices]), axis=1)]
+        errors = np.empty(reduced.shape[1])
+        V = self._basis()
+        entrance = V[ind_source] @ reduced
+        for index in indices:
+            # a^T r(w) = a^T Lh - a^T A V y - (V^T (a * D(w)))^T y
+            adjoint = self._adjoints[index]
+            source = adjoint @ Lh
+            coupling = (offdiag.T @ adjoint) @ V
+            cols = np.nonzero(closest == index)[0]
+            for start in range(0, len(cols), chunk_size):
+                chunk = cols[start:start + chunk_size]
+                weighted = V.T @ (adjoint[:, np.newaxis] * self.Ah_diags[:, chunk])
+                correction = (source - coupling @ reduced[:, chunk]
+                              - np.sum(weighted * reduced[:, chunk], axis=0))
+                errors[chunk] = np.abs(correction) / np.abs(entrance[chunk])
+        return errors
+
+
+def dof_scale(offdiag, Ah_diags):
+    """
+    The scaling of the degrees of freedom of a frequential problem.
+
+    The scaled matrix `diag(scale) Ah(w) diag(scale)` has rows of maximal
+    modulus of the order of 1 on the frequency band.
+
+    Parameters
+    ----------
+    offdiag : sparse matrix
+        The frequency independent part of the matrix, without its diagonal.
+    Ah_diags : array of complex
+        The diagonals of the matrix at each frequency, `(n_tot, n_freq)`.
+
+    Returns
+    -------
+    array of float
+    """
+    row_max = np.maximum(np.max(np.abs(Ah_diags), axis=1),
+                         abs(offdiag).max(axis=1).toarray().ravel())
+    row_max[row_max == 0] = 1
+    return 1 / np.sqrt(row_max)
+
+
+def _compress_diagonal(Ah_diags, n_samples=256, tol=1e-14):
+    """
+    Low-rank decomposition of the diagonals, `Ah_diags ~ modes @ coefs`.
+
+    The modes are the dominant left singular vectors of a subsample of the
+    frequencies; the coefficients are the projections of all the diagonals.
+    The coefficients of the diagonal spread over several orders of magnitude
+    and the problem is sensitive to all of them: the decomposition is
+    computed on the diagonals normalized row by row (each coefficient by its
+    maximum over the frequencies) and column by column.
+    """
+    Ah_diags = np.asarray(Ah_diags)
+    row_scale = np.max(np.abs(Ah_diags), axis=1)
+    row_scale[row_scale == 0] = 1
+    normalized = Ah_diags / row_scale[:, np.newaxis]
+    step = max(1, Ah_diags.shape[1] // n_samples)
+    samples = normalized[:, ::step]
+    samples = samples / np.linalg.norm(samples, axis=0)
+    U, sv, _ = np.linalg.svd(samples, full_matrices=False)
+    rank = max(1, int(np.count_nonzero(sv > tol*sv[0])))
+    modes = U[:, :rank]
+    return row_scale[:, np.newaxis] * modes, modes.conj().T @ normalized
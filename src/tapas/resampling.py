@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming conversion of the solver sample rate to an audio sample rate.
+
+The time step of a :py:class:`TemporalSolver\
+<openwind.temporal.temporal_solver.TemporalSolver>` follows from the CFL
+condition, so its sample rate `1/dt` is arbitrary and generally not a rational
+fraction of an audio rate. The :py:class:`PolyphaseResampler` converts it with
+a Kaiser-windowed sinc interpolator evaluated from a table of polyphase
+filters, block by block and with a bounded latency.
+"""
+
+import numpy as np
+
+
+def kaiser_sinc_table(half_width, n_phases, cutoff, beta):
+    """
+    Tabulate a Kaiser-windowed sinc kernel for fractional delays.
+
+    Parameters
+    ----------
+    half_width : int
+        Half of the number of taps of each phase.
+    n_phases : int
+        The number of fractional delays tabulated between two input samples.
+    cutoff : float
+        The cutoff frequency, normalized by the input Nyquist frequency.
+    beta : float
+        The shape parameter of the Kaiser window.
+
+    Returns
+    -------
+    array of float, shape (n_phases+1, 2*half_width)
+        The row `p` gives the taps applied to the input samples
+        `i-half_width+1, ..., i+half_width` to obtain the output at the
+        position `i + p/n_phases`. Each row is normalized to a unit DC gain.
+    """
+    offsets = np.arange(-half_width + 1, half_width + 1)
+    fractions = np.arange(n_phases + 1) / n_phases
+    delays = offsets[np.newaxis, :] - fractions[:, np.newaxis]
+    window = np.i0(beta*np.sqrt(np.clip(1 - (delays/half_width)**2, 0, 1)))
+    table = cutoff * np.sinc(cutoff*delays) * window / np.i0(beta)
+    return table / np.sum(table, axis=1, keepdims=True)
+
+
+class PolyphaseResampler:
+    """
+    Stateful windowed-sinc resampler for arbitrary rate ratios.
+
+    Each output sample is computed at its exact (fractional) position in the
+    input signal, with the taps linearly interpolated between the two nearest
+    tabulated phases. All the outputs of a block are computed at once.
+
+    The output sample at time `t` needs the inputs up to `t` plus
+    :py:attr:`latency`: outputs are returned as soon as these inputs have been
+    received, the remaining ones are obtained with :py:meth:`flush`.
+
+    .. code-block:: python
+
+        resampler = PolyphaseResampler(1/t_solver.get_dt(), 48000)
+        for block in blocks:
+            audio = resampler.process(block)
+        audio_end = resampler.flush()
+
+    Parameters
+    ----------
+    input_rate, output_rate : float
+        The sample rates of the input and output signals, in Hz.
+    n_zeros : int, optional
+        The number of zero crossings of the sinc kept on each side of the
+        kernel. It sets the steepness of the filter. Default is 16.
+    n_phases : int, optional
+        The number of tabulated fractional delays. Default is 128.
+    rolloff : float, optional
+        The cutoff frequency relatively to the lowest Nyquist frequency of
+        the input and the output. Default is 0.9.
+    beta : float, optional
+        The shape parameter of the Kaiser window (stopband attenuation).
+        Default is 8.6 (about 90 dB).
+    """
+
+    def __init__(self, input_rate, output_rate, n_zeros=16, n_phases=128,
+                 rolloff=0.9, beta=8.6):
+        if input_rate <= 0 or output_rate <= 0:
+            raise ValueError('The sample rates must be positive.')
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self._step = input_rate / output_rate
+        # when decimating, the kernel is stretched to cut at the output Nyquist
+        cutoff = rolloff * min(1, output_rate/input_rate)
+        self.half_width = int(np.ceil(n_zeros / cutoff))
+        self.n_phases = n_phases
+        self._table = kaiser_sinc_table(self.half_width, n_phases, cutoff, beta)
+        self._offsets = np.arange(-self.half_width + 1, self.half_width + 1)
+        self._history = np.zeros(2*self.half_width)
+        self._n_received = 0   # number of input samples received
+        self._next_time = 0.0  # position of the next output, in input samples
+
+    def __repr__(self):
+        return ("<tapas.resampling.PolyphaseResampler(input_rate={:.1f}, "
+                "output_rate={:.1f}, taps={}, latency={:.2e}s)>"
+                .format(self.input_rate, self.output_rate,
+                        2*self.half_width, self.latency))
+
+    @property
+    def latency(self):
+        """float: The delay between an input sample and its output, in s."""
+        return self.half_width / self.input_rate
+
+    def reset(self):
+        """Forget the input received, as a new instance."""
+        self._history[:] = 0
+        self._n_received = 0
+        self._next_time = 0.0
+
+    def process(self, chunk):
+        """
+        Resample a new block of the input signal.
+
+        Parameters
+        ----------
+        chunk : array of float
+            The next input samples.
+
+        Returns
+        -------
+        array of float
+            The new output samples.
+        """
+        chunk = np.asarray(chunk, dtype=float)
+        buffer = np.concatenate((self._history, chunk))
+        first_index = self._n_received - len(self._history)
+        self._n_received += len(chunk)
+        self._history = buffer[-len(self._history):]
+
+        # outputs at t need the inputs up to floor(t) + half_width
+        last_time = self._n_received - 1 - self.half_width
+        if last_time < self._next_time:
+            return np.zeros(0)
+        n_out = int(np.floor((last_time - self._next_time) / self._step)) + 1
+        times = self._next_time + self._step*np.arange(n_out)
+        self._next_time = times[-1] + self._step
+
+        indices = np.floor(times).astype(int)
+        phases = (times - indices) * self.n_phases
+        phase_ind = np.minimum(phases.astype(int), self.n_phases - 1)
+        weight = (phases - phase_ind)[:, np.newaxis]
+        taps = ((1 - weight)*self._table[phase_ind]
+                + weight*self._table[phase_ind + 1])
+        samples = buffer[indices[:, np.newaxis] + self._offsets - first_index]
+        return np.einsum('ij,ij->i', taps, samples)
+
+    def flush(self):
+        """
+        Compute the outputs still waiting for future inputs, assuming the
+        input signal is zero after the last sample received.
+
+        Returns
+        -------
+        array of float
+            The output samples up to the last input sample.
+        """
+        # half_width zeros release exactly the outputs up to the last input
+        return self.process(np.zeros(self.half_width))
+
+
+def resample(signal, input_rate, output_rate, block_size=65536, **kwargs):
+    """
+    Resample a whole signal with a :py:class:`PolyphaseResampler`.
+
+    The signal is processed by blocks, so it can be a memory-mapped array.
+
+    Parameters
+    ----------
+    signal : array of float
+        The input signal.
+    input_rate, output_rate : float
+        The sample rates of the input and output signals, in Hz.
+    block_size : int, optional
+        The number of input samples processed at once. Default is 65536.
+    **kwargs : keyword arguments
+        Options of :py:class:`PolyphaseResampler`.
+
+    Returns
+    -------
+    array of float
+        The resampled signal.
+    """
+    resampler = PolyphaseResampler(input_rate, output_rate, **kwargs)
+    out = [resampler.process(signal[k:k + block_size])
+           for k in range(0, len(signal), block_size)]
+    out.append(resampler.flush())
+    return np.concatenate(out)
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Block-based streaming synthesis around openwind's TemporalSolver.
+
+The :py:class:`StreamingEngine` advances the numerical scheme by fixed blocks
+of time steps and pushes the recorded signal (by default the radiated pressure
+at the bell) into a :py:class:`RingBuffer`, from which an audio consumer can
+pull samples while the simulation keeps running, optionally after resampling
+them to an audio rate.
+"""
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from .resampling import PolyphaseResampler
+
+
+def find_channel(t_solver, channel):
+    """
+    Find the component recording a given quantity.
+
+    Parameters
+    ----------
+    t_solver : :py:class:`TemporalSolver<openwind.temporal.temporal_solver.TemporalSolver>`
+        The solver of the instrument.
+    channel : str
+        The name of the quantity, with the same naming as the keys of
+        :py:attr:`RecordingDevice.values\
+        <openwind.temporal.recording_device.RecordingDevice.values>`, for
+        example 'bell_radiation_pressure'.
+
+    Returns
+    -------
+    t_comp : :py:class:`TemporalComponent<openwind.temporal.tcomponent.TemporalComponent>`
+        The component.
+    key : str
+        The key of the quantity in :py:meth:`get_values_to_record()\
+        <openwind.temporal.tcomponent.TemporalComponent.get_values_to_record>`.
+    """
+    for t_comp in t_solver.t_components:
+        prefix = t_comp.label + '_'
+        if channel.startswith(prefix):
+            key = channel[len(prefix):]
+            if key in t_comp.get_values_to_record():
+                return t_comp, key
+    available = [t_comp.label + '_' + key for t_comp in t_solver.t_components
+                 for key in t_comp.get_values_to_record()]
+    raise ValueError("Unknown channel '{}', chose between {}".format(channel,
+                                                                    available))
+
+
+class RingBuffer:
+    """
+    Lock-free single-producer / single-consumer ring buffer of samples.
+
+    The producer only ever moves the write counter and the consumer only ever
+    moves the read counter. Both counters grow monotonically and are wrapped
+    with a bit mask, so no lock is needed as long as there is exactly one
+    producer thread and one consumer thread.
+
+    Parameters
+    ----------
+    capacity : int
+        Minimal number of samples the buffer can hold. It is rounded up to the
+        next power of two.
+    dtype : numpy.dtype, optional
+        The sample type. Default is float64.
+
+    Attributes
+    ----------
+    overruns : int
+        Number of samples dropped because the buffer was full when pushed.
+    underruns : int
+        Number of samples requested by the consumer which were not available.
+    """
+
+    def __init__(self, capacity, dtype=np.float64):
+        if capacity < 1:
+            raise ValueError('The capacity of the ring buffer must be positive.')
+        size = 1 << int(np.ceil(np.log2(capacity)))
+        self._data = np.zeros(size, dtype=dtype)
+        self._mask = size - 1
+        self._write = 0
+        self._read = 0
+        self.overruns = 0
+        self.underruns = 0
+
+    def __len__(self):
+        return self._write - self._read
+
+    def __repr__(self):
+        return ("<tapas.streaming.RingBuffer(capacity={}, available={}, "
+                "overruns={}, underruns={})>".format(self.capacity, len(self),
+                                                     self.overruns,
+                                                     self.underruns))
+
+    @property
+    def capacity(self):
+        """int: The maximal number of samples stored at once."""
+        return self._mask + 1
+
+    def free(self):
+        """
+        Returns
+        -------
+        int
+            The number of samples which can be pushed without overrun.
+        """
+        return self.capacity - (self._write - self._read)
+
+    def push(self, samples):
+        """
+        Write samples at the end of the buffer (producer side).
+
+        If the buffer does not have room for all the samples, the samples
+        which do not fit are dropped and counted in :py:attr:`overruns`.
+
+        Parameters
+        ----------
+        samples : array-like
+            The samples to write.
+
+        Returns
+        -------
+        int
+            The number of samples actually written.
+        """
+        samples = np.asarray(samples, dtype=self._data.dtype).ravel()
+        n = min(len(samples), self.free())
+        self.overruns += len(samples) - n
+        if n == 0:
+            return 0
+        start = self._write & self._mask
+        first = min(n, self.capacity - start)
+        self._data[start:start + first] = samples[:first]
+        self._data[:n - first] = samples[first:n]
+        self._write += n  # publish only once the data is in place
+        return n
+
+    def pull(self, n_samples, pad=False):
+        """
+        Read and consume samples from the buffer (consumer side).
+
+        Parameters
+        ----------
+        n_samples : int
+            The number of samples requested.
+        pad : bool, optional
+            If True, always return `n_samples` samples, completing with zeros
+            (counted in :py:attr:`underruns`) when not enough are available,
+            as an audio callback needs. Default is False.
+
+        Returns
+        -------
+        numpy.array
+            The samples read.
+        """
+        n = min(n_samples, self._write - self._read)
+        start = self._read & self._mask
+        first = min(n, self.capacity - start)
+        out = np.zeros(n_samples if pad else n, dtype=self._data.dtype)
+        out[:first] = self._data[start:start + first]
+        out[first:n] = self._data[:n - first]
+        self._read += n  # release the space only once the data is copied
+        if pad:
+            self.underruns += n_samples - n
+        return out
+
+
+class StreamingEngine:
+    """
+    Run a temporal simulation block by block and stream its output.
+
+    Each call to :py:meth:`process_block` performs `block_size` time steps of
+    the scheme and pushes the corresponding samples of `channel` in
+    :py:attr:`buffer`. The duration of every block is measured, which gives
+    the latency of the engine and its real-time factor (simulated time over
+    wall-clock time, it must stay above 1 to keep up with an audio device).
+
+    .. code-block:: python
+
+        t_solver = TemporalSolver(InstrumentPhysics(geom, 25, player, 'diffrepr'),
+                                  l_ele=0.1, order=4)
+        engine = StreamingEngine(t_solver, block_size=128)
+        engine.start_thread()
+        block = engine.buffer.pull(512, pad=True)
+        ...
+        engine.stop()
+        print(engine.stats())
+
+    Parameters
+    ----------
+    t_solver : :py:class:`TemporalSolver<openwind.temporal.temporal_solver.TemporalSolver>`
+        The solver of the instrument, already discretized.
+    block_size : int, optional
+        The number of time steps computed per block. Default is 128.
+    channel : str, optional
+        The recorded quantity streamed, with the same naming as the keys of
+        :py:attr:`RecordingDevice.values\
+        <openwind.temporal.recording_device.RecordingDevice.values>`.
+        Default is 'bell_radiation_pressure'.
+    buffer_blocks : int, optional
+        The capacity of the ring buffer, in number of blocks. Default is 32.
+    history : int, optional
+        The number of block durations kept to compute the latency
+        statistics. Default is 1000.
+    output_rate : float, optional
+        If given, the samples are converted to this rate (in Hz) by a
+        :py:class:`PolyphaseResampler<tapas.resampling.PolyphaseResampler>`
+        before being pushed in the buffer. Default is None: the samples are
+        pushed at :py:attr:`samplerate`.
+
+    Attributes
+    ----------
+    buffer : :py:class:`RingBuffer`
+        The buffer in which the samples are pushed.
+    samplerate : float
+        The sample rate of the solver, which is the inverse of the time step.
+    resampler : :py:class:`PolyphaseResampler<tapas.resampling.PolyphaseResampler>` or None
+        The resampler applied before the buffer, if `output_rate` is given.
+    """
+
+    def __init__(self, t_solver, block_size=128, channel='bell_radiation_pressure',
+                 buffer_blocks=32, history=1000, output_rate=None):
+        if block_size < 1:
+            raise ValueError('The block size must be a positive integer.')
+        self.t_solver = t_solver
+        self.block_size = int(block_size)
+        self.channel = channel
+        self.resampler = None
+        self._pushed_size = self.block_size  # samples pushed per block, at most
+        if output_rate:
+            self.resampler = PolyphaseResampler(self.samplerate, output_rate)
+            self._pushed_size = int(np.ceil(self.block_size*output_rate
+                                            / self.samplerate)) + 1
+        self.buffer = RingBuffer(self._pushed_size*buffer_blocks)
+        self._block_durations = deque(maxlen=history)
+        self._component, self._key = find_channel(t_solver, channel)
+        self._block = np.zeros(self.block_size)
+        self._thread = None
+        self._running = threading.Event()
+        self._started = False
+        self.n_blocks = 0
+        self.wall_time = 0.0
+
+    def __repr__(self):
+        return ("<tapas.streaming.StreamingEngine(channel='{}', block_size={},"
+                " samplerate={:.1f}, n_blocks={})>".format(self.channel,
+                                                           self.block_size,
+                                                           self.samplerate,
+                                                           self.n_blocks))
+
+    @property
+    def dt(self):
+        """float: The physical duration of one time step (in s)."""
+        return self.t_solver.get_dt() * self.t_solver.scaling.get_time()
+
+    @property
+    def samplerate(self):
+        """float: The number of samples computed per simulated second."""
+        return 1/self.dt
+
+    @property
+    def block_duration(self):
+        """float: The simulated duration of one block (in s)."""
+        return self.block_size * self.dt
+
+    def start(self):
+        """
+        Reset the solver and prepare the controls before the first block.
+
+        It is called automatically by the first :py:meth:`process_block`.
+        """
+        t_solver = self.t_solver
+        t_solver.reset()
+        t_solver._execute_score.set_score(t_solver.instru_physics.player.get_score())
+        t_solver.instru_physics._update_player()
+        t_solver.cur_step = 0
+        if self.resampler is not None:
+            self.resampler.reset()
+        self._block_durations.clear()
+        self.n_blocks = 0
+        self.wall_time = 0.0
+        self._started = True
+
+    def process_block(self):
+        """
+        Compute one block of time steps and push it into the buffer.
+
+        Returns
+        -------
+        numpy.array
+            The samples of the block at the solver rate (the array is reused
+            by the next block).
+        """
+        if not self._started:
+            self.start()
+        t_solver = self.t_solver
+        component, key = self._component, self._key
+        block = self._block
+        tic = time.perf_counter()
+        for k in range(self.block_size):
+            t_solver.one_step()
+            t_solver.cur_step += 1
+            block[k] = component.get_values_to_record()[key]
+        if self.resampler is None:
+            self.buffer.push(block)
+        else:
+            self.buffer.push(self.resampler.process(block))
+        duration = time.perf_counter() - tic
+        self._block_durations.append(duration)
+        self.wall_time += duration
+        self.n_blocks += 1
+        return block
+
+    def run(self, duration):
+        """
+        Compute blocks until `duration` seconds have been simulated.
+
+        Blocks are computed as long as the buffer has room for them, it is
+        the responsability of the consumer to pull the samples.
+
+        Parameters
+        ----------
+        duration : float
+            The simulated duration (in s).
+        """
+        n_blocks = int(np.ceil(duration / self.block_duration))
+        for _ in range(n_blocks):
+            self._wait_for_room()
+            self.process_block()
+
+    def _wait_for_room(self):
+        while self.buffer.free() < self._pushed_size:
+            if self._thread is not None and not self._running.is_set():
+                return
+            time.sleep(0.25*self.block_duration)
+
+    def start_thread(self, duration=np.inf):
+        """
+        Run the engine in a background (producer) thread.
+
+        Parameters
+        ----------
+        duration : float, optional
+            Simulated duration after which the thread stops. Default is
+            infinite: the thread runs until :py:meth:`stop` is called.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            raise RuntimeError('The streaming thread is already running.')
+        self._running.set()
+
+        def loop():
+            n_blocks = 0
+            while (self._running.is_set()
+                   and n_blocks*self.block_duration < duration):
+                self._wait_for_room()
+                if self._running.is_set():
+                    self.process_block()
+                    n_blocks += 1
+            self._running.clear()
+
+        self._thread = threading.Thread(target=loop, name='tapas-streaming',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread started by :py:meth:`start_thread`."""
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def is_running(self):
+        """
+        Returns
+        -------
+        bool
+            True if the background thread is computing blocks.
+        """
+        return self._running.is_set()
+
+    def real_time_factor(self):
+        """
+        Ratio between the simulated duration and the computation time.
+
+        A value above 1 means that the engine computes faster than real time
+        and can feed an audio device at :py:attr:`samplerate`.
+
+        Returns
+        -------
+        float
+        """
+        if self.wall_time == 0:
+            return np.nan
+        return self.n_blocks*self.block_duration / self.wall_time
+
+    def block_latencies(self):
+        """
+        Returns
+        -------
+        numpy.array
+            The computation time of the last blocks (in s).
+        """
+        return np.array(self._block_durations)
+
+    def stats(self):
+        """
+        Summary of the performance of the engine.
+
+        Returns
+        -------
+        dict
+            The number of blocks, the block duration, the mean, 99th percentile
+            and maximal block computation time (all in s), and the real-time
+            factor.
+        """
+        latencies = self.block_latencies()
+        if len(latencies) == 0:
+            latencies = np.array([np.nan])
+        return {'n_blocks': self.n_blocks,
+                'block_duration': self.block_duration,
+                'mean_latency': np.mean(latencies),
+                'p99_latency': np.percentile(latencies, 99),
+                'max_latency': np.max(latencies),
+                'real_time_factor': self.real_time_factor()}
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Regression surrogates of :py:class:`ImpedanceComputation\
+<openwind.impedance_computation.ImpedanceComputation>`.
+
+An :py:class:`ImpedanceSurrogate` learns the map from the geometric parameter
+vector of an instrument (the active values of the `optim_params` of its
+:py:class:`InstrumentGeometry\
+<openwind.technical.instrument_geometry.InstrumentGeometry>`) to
+
+- its resonances (frequency, quality factor and normalized amplitude of the
+  first peaks), with `target='resonances'`;
+- its normalized input impedance on a fixed frequency axis, with
+  `target='impedance'`.
+
+The model is a ridge regression on polynomial features of the standardized
+parameters, optionally completed with random Fourier features. It is trained
+on the datasets of :py:func:`tapas.dataset.generate_dataset` and evaluated
+by batches with a few matrix products, orders of magnitude faster than the
+finite elements:
+
+.. code-block:: python
+
+    surrogate = ImpedanceSurrogate.from_dataset('saxo_dataset', degree=3)
+    f_res, Q, Z_res = surrogate.predict(params)
+    report = validate(surrogate, test_geometries, frequencies)
+    print(report['summary'])
+
+:py:func:`validate` compares the predictions to the finite element
+computation on held-out geometries, with the frequency deviations in cents
+and the amplitude deviations in dB.
+"""
+
+import itertools
+import json
+import time
+import warnings
+
+import numpy as np
+from scipy.linalg import solve
+
+
+TARGETS = ['resonances', 'impedance']
+"""list of str: The quantities which can be learned."""
+
+
+def deviations(f_ref, a_ref, f_est, a_est):
+    """
+    Deviations between two sets of resonances.
+
+    Parameters
+    ----------
+    f_ref, a_ref : array of float
+        The reference frequencies and amplitudes.
+    f_est, a_est : array of float
+        The estimated frequencies and amplitudes.
+
+    Returns
+    -------
+    cents : array of float
+        `1200*log2(f_est/f_ref)`
+    dB : array of float
+        `20*log10(|a_est|/|a_ref|)`
+    """
+    cents = 1200*np.log2(np.asarray(f_est) / np.asarray(f_ref))
+    dB = 20*np.log10(np.abs(a_est) / np.abs(a_ref))
+    return cents, dB
+
+
+def curve_peaks(frequencies, impedance, n_peaks, prominence=6.):
+    """
+    Locate the first maxima of impedance curves.
+
+    The maxima of `|Z|` on the frequency grid which emerge by at least
+    `prominence` dB are refined by a parabolic interpolation of `log|Z|`.
+
+    Parameters
+    ----------
+    frequencies : array of float
+        The frequency axis (uniform), of length `n_freq`.
+    impedance : array of complex
+        The impedances, of shape `(n_freq,)` or `(n_instruments, n_freq)`.
+    n_peaks : int
+        The number of peaks.
+    prominence : float, optional
+        The minimal prominence of the peaks, in dB. Default is 6.
+
+    Returns
+    -------
+    f_peaks, a_peaks : array of float
+        The frequencies and amplitudes of the peaks, of shape
+        `(n_instruments, n_peaks)`, padded with NaN.
+    """
+    from scipy.signal import find_peaks
+
+    log_abs = np.log(np.abs(np.atleast_2d(impedance)))
+    f_peaks = np.full((len(log_abs), n_peaks), np.nan)
+    a_peaks = np.full((len(log_abs), n_peaks), np.nan)
+    step = frequencies[1] - frequencies[0]
+    for k, curve in enumerate(log_abs):
+        maxima = find_peaks(curve, prominence=prominence*np.log(10)/20)[0][:n_peaks]
+        left, center, right = curve[maxima - 1], curve[maxima], curve[maxima + 1]
+        shift = 0.5*(left - right) / (left - 2*center + right)
+        f_peaks[k, :len(maxima)] = frequencies[maxima] + shift*step
+        a_peaks[k, :len(maxima)] = np.exp(center - 0.25*(left - right)*shift)
+    return f_peaks, a_peaks
+
+
+class ImpedanceSurrogate:
+    """
+    Ridge regression from geometric parameters to acoustic features.
+
+    Parameters
+    ----------
+    target : {'resonances', 'impedance'}, optional
+        The learned quantity. Default is 'resonances'.
+    degree : int, optional
+        The degree of the polynomial features. Default is 2.
+    n_fourier : int, optional
+        The number of random Fourier features added to the polynomial ones.
+        Default is 0.
+    length_scale : float, optional
+        The length scale of the random Fourier features, relatively to the
+        standard deviation of the parameters. Default is 1.
+    alpha : float, optional
+        The ridge regularization. Default is 1e-8.
+    n_peaks : int, optional
+        The number of resonances learned (`target='resonances'`). Default is
+        None (all the resonances of the training data).
+    n_components : int, optional
+        The number of principal components of the impedance curves kept
+        (`target='impedance'`). Default is 64.
+    seed : int, optional
+        The seed of the random Fourier features. Default is 0.
+
+    Attributes
+    ----------
+    param_labels : list of str
+        The labels of the parameters, in the order of the input vectors.
+    frequencies : array of float
+        The frequency axis (`target='impedance'`).
+    """
+
+    def __init__(self, target='resonances', degree=2, n_fourier=0,
+                 length_scale=1., alpha=1e-8, n_peaks=None, n_components=64,
+                 seed=0):
+        if target not in TARGETS:
+            raise ValueError("Unknown target '{}', chose between {}"
+                             .format(target, TARGETS))
+        self.target = target
+        self.degree = degree
+        self.n_fourier = n_fourier
+        self.length_scale = length_scale
+        self.alpha = alpha
+        self.n_peaks = n_peaks
+        self.n_components = n_components
+        self.seed = seed
+        self.param_labels = list()
+        self.frequencies = None
+        self._fitted = False
+
+    def __repr__(self):
+        return ("<tapas.surrogate.ImpedanceSurrogate(target='{}', degree={}, "
+                "n_fourier={}, n_params={})>".format(self.target, self.degree,
+                                                     self.n_fourier,
+                                                     len(self.param_labels)))
+
+    # ---------------------------------------------------------------- features
+    def _features(self, params):
+        x = (np.atleast_2d(params) - self._x_mean) / self._x_scale
+        columns = [np.ones((len(x), 1))]
+        for d in range(1, self.degree + 1):
+            for combination in itertools.combinations_with_replacement(
+                    range(x.shape[1]), d):
+                columns.append(np.prod(x[:, combination], axis=1, keepdims=True))
+        if self.n_fourier:
+            projection = x @ self._omega + self._phase
+            columns.append(np.sqrt(2/self.n_fourier) * np.cos(projection))
+        return np.hstack(columns)
+
+    # ----------------------------------------------------------------- targets
+    def _encode(self, data):
+        if self.target == 'resonances':
+            f_res, q_res, z_res = data
+            return np.hstack([np.log(f_res), np.log(q_res), np.log(np.abs(z_res))])
+        impedance = np.asarray(data)
+        return np.hstack([np.log(np.abs(impedance)), np.angle(impedance)])
+
+    def _decode(self, y):
+        if self.target == 'resonances':
+            n = self.n_peaks
+            return np.exp(y[:, :n]), np.exp(y[:, n:2*n]), np.exp(y[:, 2*n:])
+        n = len(self.frequencies)
+        return np.exp(y[:, :n] + 1j*y[:, n:])
+
+    # --------------------------------------------------------------------- fit
+    def fit(self, params, data, param_labels=None, frequencies=None):
+        """
+        Train the model.
+
+        Parameters
+        ----------
+        params : array of float
+            The parameter vectors, of shape `(n_instruments, n_params)`.
+        data : tuple of arrays or array
+            With `target='resonances'`, the tuple `(f_res, Q, Z_res)` of
+            arrays of shape `(n_instruments, n_peaks)`, `Z_res` normalized by
+            the characteristic impedance. The instruments with less
+            resonances (NaN) only contribute to the ones they have. With
+            `target='impedance'`, the normalized impedances of shape
+            `(n_instruments, n_freq)`; the incomplete ones are discarded.
+        param_labels : list of str, optional
+            The labels of the parameters.
+        frequencies : array of float, optional
+            The frequency axis of the impedances (`target='impedance'`).
+
+        Returns
+        -------
+        self
+
+        Warns
+        -----
+        UserWarning
+            If some instruments have less resonances than `n_peaks`, or if
+            some impedances are discarded.
+        """
+        params = np.atleast_2d(np.asarray(params, dtype=float))
+        if self.target == 'resonances':
+            n_peaks = self.n_peaks or np.asarray(data[0]).shape[1]
+            data = tuple(np.asarray(val)[:, :n_peaks] for val in data)
+            self.n_peaks = n_peaks
+        else:
+            if frequencies is None:
+                raise ValueError('The frequencies are needed to learn the '
+                                 'impedance.')
+            self.frequencies = np.asarray(frequencies, dtype=float)
+        y = self._encode(data).real
+        observed = np.isfinite(y) & np.all(np.isfinite(params), axis=1,
+                                           keepdims=True)
+        incomplete = np.count_nonzero(np.any(observed, axis=1)
+                                      & ~np.all(observed, axis=1))
+        if self.target == 'impedance':
+            # the curves are compressed together: only the complete ones
+            observed &= np.all(observed, axis=1, keepdims=True)
+            if incomplete:
+                warnings.warn('{} of the {} impedances are not finite: they '
+                              'are discarded.'.format(incomplete, len(y)))
+        elif incomplete:
+            warnings.warn('{} of the {} instruments have less than {} '
+                          'resonances: they only contribute to their first '
+                          'ones.'.format(incomplete, len(y), self.n_peaks))
+        used = np.any(observed, axis=1)
+        params, y, observed = params[used], y[used], observed[used]
+        if len(params) == 0:
+            raise ValueError('No complete sample to train the surrogate.')
+        missing = np.nonzero(~np.any(observed, axis=0))[0]
+        if len(missing):
+            raise ValueError('No instrument has {} resonances, chose a lower '
+                             'n_peaks.'.format(missing[0] % self.n_peaks + 1))
+        self.param_labels = list(param_labels) if param_labels is not None else list()
+        self.n_train = len(params)
+
+        self._x_mean = params.mean(axis=0)
+        self._x_scale = params.std(axis=0)
+        self._x_scale[self._x_scale == 0] = 1
+        rng = np.random.default_rng(self.seed)
+        self._omega = rng.normal(size=(params.shape[1], self.n_fourier)) / self.length_scale
+        self._phase = rng.uniform(0, 2*np.pi, self.n_fourier)
+
+        self._y_mean = np.array([column[mask].mean() for column, mask
+                                 in zip(y.T, observed.T)])
+        y = np.where(observed, y - self._y_mean, 0)
+        if self.target == 'impedance':
+            # the curves are compressed on their principal components
+            _, _, vh = np.linalg.svd(y, full_matrices=False)
+            self._basis = vh[:self.n_components]
+            y = y @ self._basis.T
+            observed = np.ones(y.shape, dtype=bool)
+        else:
+            self._basis = None
+
+        features = self._features(params)
+        self._weights = np.empty((features.shape[1], y.shape[1]))
+        # one system per set of samples (the instruments having a resonance)
+        masks, groups = np.unique(observed.T, axis=0, return_inverse=True)
+        for k, mask in enumerate(masks):
+            columns = np.nonzero(groups.ravel() == k)[0]
+            gram = features[mask].T @ features[mask]
+            gram[np.diag_indices_from(gram)] += self.alpha * np.count_nonzero(mask)
+            self._weights[:, columns] = solve(gram,
+                                              features[mask].T @ y[mask][:, columns],
+                                              assume_a='pos')
+        self._fitted = True
+        return self
+
+    @classmethod
+    def from_dataset(cls, output_dir, target='resonances', **kwargs):
+        """
+        Train a surrogate on a dataset of :py:func:`tapas.dataset.generate_dataset`.
+
+        Parameters
+        ----------
+        output_dir : str
+            The directory of the dataset.
+        target : {'resonances', 'impedance'}, optional
+            The learned quantity. Default is 'resonances'.
+        **kwargs :
+            The options of :py:class:`ImpedanceSurrogate`.
+
+        Returns
+        -------
+        :py:class:`ImpedanceSurrogate`
+        """
+        from .dataset import load_dataset
+
+        if target == 'resonances':
+            keys = ['resonance_frequencies', 'quality_factors',
+                    'resonance_impedance']
+        else:
+            keys = ['impedance']
+        data, attrs = load_dataset(output_dir, keys=['params'] + keys)
+        values = tuple(data[key] for key in keys)
+        surrogate = cls(target=target, **kwargs)
+        return surrogate.fit(data['params'], values if target == 'resonances'
+                             else values[0],
+                             param_labels=attrs.get('param_labels'),
+                             frequencies=attrs['frequencies'])
+
+    # --------------------------------------------------------------- inference
+    def predict(self, params, batch_size=4096):
+        """
+        Evaluate the surrogate on a batch of parameter vectors.
+
+        Parameters
+        ----------
+        params : array of float
+            The parameter vectors, of shape `(n_instruments, n_params)` (or
+            `(n_params,)` for a single instrument).
+        batch_size : int, optional
+            The number of instruments evaluated at once, to bound the memory
+            used by the features. Default is 4096.
+
+        Returns
+        -------
+        tuple of arrays or array
+            With `target='resonances'`, the frequencies, quality factors and
+            normalized amplitudes `(f_res, Q, |Z_res|)`, of shape
+            `(n_instruments, n_peaks)`. With `target='impedance'`, the
+            normalized impedances, of shape `(n_instruments, n_freq)`.
+        """
+        if not self._fitted:
+            raise ValueError('The surrogate must be trained before prediction.')
+        params = np.atleast_2d(np.asarray(params, dtype=float))
+        outputs = list()
+        for start in range(0, len(params), batch_size):
+            y = self._features(params[start:start + batch_size]) @ self._weights
+            if self._basis is not None:
+                y = y @ self._basis
+            outputs.append(self._decode(y + self._y_mean))
+        if self.target == 'resonances':
+            return tuple(np.concatenate(val) for val in zip(*outputs))
+        return np.concatenate(outputs)
+
+    # ---------------------------------------------------------- serialization
+    _ARRAYS = ['_x_mean', '_x_scale', '_omega', '_phase', '_y_mean',
+               '_weights', '_basis', 'frequencies']
+    _OPTIONS = ['target', 'degree', 'n_fourier', 'length_scale', 'alpha',
+                'n_peaks', 'n_components', 'seed']
+
+    def save(self, filename):
+        """
+        Save the trained surrogate in a `.npz` file.
+
+        Parameters
+        ----------
+        filename : str
+            The file name.
+        """
+        if not self._fitted:
+            raise ValueError('The surrogate must be trained before saving.')
+        config = {key: getattr(self, key) for key in self._OPTIONS}
+        config.update(param_labels=self.param_labels, n_train=self.n_train)
+        arrays = {key: getattr(self, key) for key in self._ARRAYS
+                  if getattr(self, key) is not None}
+        np.savez(filename, config=json.dumps(config), **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load a surrogate saved with :py:meth:`save`.
+
+        Parameters
+        ----------
+        filename : str
+            The file name.
+
+        Returns
+        -------
+        :py:class:`ImpedanceSurrogate`
+        """
+        with np.load(filename) as file:
+            config = json.loads(str(file['config']))
+            surrogate = cls(**{key: config[key] for key in cls._OPTIONS})
+            for key in cls._ARRAYS:
+                setattr(surrogate, key, file[key] if key in file else None)
+        surrogate.param_labels = config['param_labels']
+        surrogate.n_train = config['n_train']
+        surrogate._fitted = True
+        return surrogate
+
+
+def _summary(values):
+    values = np.abs(values[np.isfinite(values)])
+    if len(values) == 0:
+        return dict(mean=np.nan, median=np.nan, p95=np.nan, max=np.nan)
+    return dict(mean=float(np.mean(values)), median=float(np.median(values)),
+                p95=float(np.percentile(values, 95)), max=float(np.max(values)))
+
+
+def validate(surrogate, geometries, frequencies, temperature=25,
+             n_peaks=None):
+    """
+    Compare a surrogate to the finite elements on held-out geometries.
+
+    The reference is computed with :py:class:`ImpedanceComputation\
+    <openwind.impedance_computation.ImpedanceComputation>`. The resonances
+    of an impedance surrogate are extracted with :py:func:`curve_peaks`.
+
+    Parameters
+    ----------
+    surrogate : :py:class:`ImpedanceSurrogate`
+        The trained surrogate.
+    geometries : list of tuple
+        The `(main_bore, holes)` of the test instruments, with their
+        parameters marked as design variables ('~'), for example drawn with
+        :py:meth:`BoreFamily.sample<tapas.dataset.BoreFamily.sample>` with
+        another seed than the training set.
+    frequencies : array of float
+        The frequency axis of the reference computation.
+    temperature : float, optional
+        The temperature in °C. Default is 25.
+    n_peaks : int, optional
+        The number of resonances compared. Default is None: the ones learned
+        by a resonances surrogate, 8 for an impedance surrogate.
+
+    Returns
+    -------
+    dict
+        - 'cents', 'dB': the deviations of the resonance frequencies and
+          amplitudes, of shape `(n_instruments, n_peaks)`, NaN for the
+          resonances missing from the reference or the prediction;
+        - 'dB_curve' (impedance target): the deviation of `|Z|` on the
+          frequency axis, of shape `(n_instruments, n_freq)`;
+        - 'fem_time', 'surrogate_time', 'speedup': the durations (s) of the
+          reference and of the batched prediction;
+        - 'summary': the mean, median, 95th percentile and max of the
+          absolute deviations.
+    """
+    from .dataset import compute_sample
+    from .lazy import import_openwind
+
+    openwind = import_openwind()
+    frequencies = np.asarray(frequencies, dtype=float)
+    if n_peaks is None:
+        n_peaks = surrogate.n_peaks or 8
+    elif surrogate.target == 'resonances' and n_peaks > surrogate.n_peaks:
+        raise ValueError('The surrogate learned {} resonances, not {}.'
+                         .format(surrogate.n_peaks, n_peaks))
+    references = list()
+    tic = time.perf_counter()
+    for main_bore, holes in geometries:
+        references.append(compute_sample(main_bore, holes, openwind,
+                                         frequencies, n_peaks=n_peaks,
+                                         temperature=temperature))
+    fem_time = time.perf_counter() - tic
+    labels = references[0]['param_labels']
+    if surrogate.param_labels and labels != surrogate.param_labels:
+        raise ValueError('The parameters of the test geometries {} differ '
+                         'from the ones of the surrogate {}.'
+                         .format(labels, surrogate.param_labels))
+    params = np.array([ref['params'] for ref in references])
+
+    tic = time.perf_counter()
+    prediction = surrogate.predict(params)
+    surrogate_time = time.perf_counter() - tic
+
+    f_ref = np.array([ref['resonance_frequencies'] for ref in references])
+    a_ref = np.abs([ref['resonance_impedance'] for ref in references])
+    report = dict()
+    if surrogate.target == 'resonances':
+        f_est, _, a_est = (val[:, :n_peaks] for val in prediction)
+    else:
+        f_est, a_est = curve_peaks(surrogate.frequencies, prediction, n_peaks)
+        z_ref = np.array([np.interp(surrogate.frequencies, frequencies,
+                                    np.abs(ref['impedance']))
+                          for ref in references])
+        report['dB_curve'] = 20*np.log10(np.abs(prediction) / z_ref)
+    report['cents'], report['dB'] = deviations(f_ref, a_ref, f_est, a_est)
+    report.update(fem_time=fem_time, surrogate_time=surrogate_time,
+                  speedup=fem_time / surrogate_time)
+    report['summary'] = {key: _summary(report[key])
+                         for key in ['cents', 'dB', 'dB_curve'] if key in report}
+    return report
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parallel sweeps of the control parameters of a temporal simulation.
+
+Tuning a player (lips frequency, reed opening, blowing pressure...) means
+running the same :py:class:`TemporalSolver\
+<openwind.temporal.temporal_solver.TemporalSolver>` many times, only the
+curves of the :py:class:`Player<openwind.technical.player.Player>` changing:
+
+.. code-block:: python
+
+    for zeta in zeta_list:
+        player.update_curve('zeta', zeta)
+        t_solver.reset()
+        t_solver.run_simulation(1.5, callback=rec.callback)
+
+:py:func:`run_sweep` runs these variants concurrently. The worker processes
+are forked from the current process: they inherit the assembled solver
+(mesh, operators, time step) without rebuilding nor pickling it. Each
+variant starts from the curves and the time step of the solver as it was
+given, whatever the previous variants run by the worker.
+
+.. code-block:: python
+
+    variants = curve_grid(zeta=[0.3, 0.4, 0.5], gamma=[0.3, 0.4, 0.5])
+    results = run_sweep(t_solver, variants, 1.5, 'sweep_reed', n_jobs=4)
+    ts, values, variant = load_variant('sweep_reed', 0)
+
+With `initial_state` (see :py:mod:`tapas.checkpoint`), the variants start
+from a saved state (a settled oscillation) instead of the rest, and continue
+it for `duration`.
+
+The recording of each variant is written by its worker as soon as it is
+finished (`variant_<k>.npz`), and the timings (wall time, steps per second
+of each variant and each worker) are gathered in `summary.json`.
+"""
+
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from openwind.temporal import RecordingDevice
+
+from .checkpoint import read_state, resume_simulation, set_state
+from .parallel import default_n_jobs
+
+
+_WORKER_STATE = dict()
+"""dict: The solver and the variants, in the worker processes."""
+
+
+def curve_grid(**curves):
+    """
+    All the combinations of some values of the curves.
+
+    Parameters
+    ----------
+    **curves : list
+        The values (numbers or time functions) of each curve.
+
+    Returns
+    -------
+    list of dict
+        The variants, the last curve varying the fastest.
+
+    Examples
+    --------
+    >>> curve_grid(zeta=[0.3, 0.4], gamma=[0.5])
+    [{'zeta': 0.3, 'gamma': 0.5}, {'zeta': 0.4, 'gamma': 0.5}]
+    """
+    labels = list(curves)
+    return [dict(zip(labels, values))
+            for values in itertools.product(*curves.values())]
+
+
+def variant_filename(output_dir, index):
+    """
+    The file of the recording of a variant.
+
+    Parameters
+    ----------
+    output_dir : str
+        The directory of the sweep.
+    index : int
+        The index of the variant.
+
+    Returns
+    -------
+    str
+    """
+    return os.path.join(output_dir, 'variant_{:04d}.npz'.format(index))
+
+
+def _describe(variant):
+    # JSON description of a variant, the time functions by their repr
+    return {label: value if isinstance(value, (int, float, str)) else repr(value)
+            for label, value in variant.items()}
+
+
+def _init_worker(state):
+    _WORKER_STATE.clear()
+    _WORKER_STATE.update(state)
+
+
+def _run_variant(index):
+    """Simulate and save one variant (in a worker process)."""
+    t_solver = _WORKER_STATE['t_solver']
+    variant = _WORKER_STATE['variants'][index]
+    player = t_solver.instru_physics.player
+    # start from the state of the solver given to the sweep
+    player.control_parameters.clear()
+    player.control_parameters.update(_WORKER_STATE['curves'])
+    if t_solver.get_dt() != _WORKER_STATE['dt']:
+        t_solver._set_dt(_WORKER_STATE['dt'])
+    for label, curve in variant.items():
+        player.update_curve(label, curve)
+    t_solver.reset()
+
+    recorder = RecordingDevice(record_energy=_WORKER_STATE['record_energy'])
+    tic = time.perf_counter()
+    if _WORKER_STATE['initial_state'] is None:
+        t_solver.run_simulation(_WORKER_STATE['duration'],
+                                callback=recorder.callback,
+                                enable_tracker_display=False)
+    else:
+        set_state(t_solver, _WORKER_STATE['initial_state'])
+        resume_simulation(t_solver, _WORKER_STATE['duration'],
+                          callback=recorder.callback)
+    wall_time = time.perf_counter() - tic
+    recorder.stop_recording()
+
+    filename = variant_filename(_WORKER_STATE['output_dir'], index)
+    values = {label: np.asarray(value)
+              for label, value in recorder.values.items()}
+    np.savez(filename, ts=np.asarray(recorder.ts),
+             variant=json.dumps(_describe(variant)), **values)
+    n_steps = len(recorder.ts)
+    return {'index': index, 'variant': _describe(variant), 'file': filename,
+            'worker': os.getpid(), 'wall_time': wall_time, 'n_steps': n_steps,
+            'steps_per_second': n_steps / wall_time if wall_time else np.nan}
+
+
+def run_sweep(t_solver, variants, duration, output_dir, n_jobs=None,
+              record_energy=False, mp_context=None, progress=False,
+              initial_state=None):
+    """
+    Simulate the variants of the player of a temporal solver concurrently.
+
+    Parameters
+    ----------
+    t_solver : :py:class:`TemporalSolver<openwind.temporal.temporal_solver.TemporalSolver>`
+        The assembled solver. It is not modified in the current process when
+        workers are used.
+    variants : list of dict
+        For each variant, the curves of the player to override, as
+        `{label: curve}` (see `Player.update_curve()` and
+        :py:func:`curve_grid`).
+    duration : float
+        The simulated duration of each variant, in s.
+    output_dir : str
+        The directory of the recordings and of the summary. It is created if
+        needed.
+    n_jobs : int, optional
+        The number of worker processes. Default is None (the number of
+        available CPUs). With 1, the variants are run in the current process.
+    record_energy : bool, optional
+        Record also the energies, see :py:class:`RecordingDevice\
+        <openwind.temporal.recording_device.RecordingDevice>`. Default is
+        False.
+    mp_context : str, optional
+        The start method of the workers. Default is 'fork' when available;
+        with the other methods, the solver is pickled to each worker.
+    progress : bool, optional
+        Print one line per variant finished. Default is False.
+    initial_state : str or dict, optional
+        The state from which each variant starts, as a file written by
+        :py:func:`save_state<tapas.checkpoint.save_state>` or given by
+        :py:func:`get_state<tapas.checkpoint.get_state>`. The variants are
+        then simulated from its time, with its time step. Default is None:
+        they start from the rest at t=0.
+
+    Returns
+    -------
+    list of dict
+        For each variant, in the order of `variants`: its 'index', its
+        description ('variant'), the recording ('file'), the process which ran
+        it ('worker'), the duration of the simulation ('wall_time'), the
+        number of time steps ('n_steps') and 'steps_per_second'. They are
+        also written in `output_dir/summary.json`, with the totals of each
+        worker.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    n_jobs = n_jobs if n_jobs is not None else default_n_jobs()
+    player = t_solver.instru_physics.player
+    if isinstance(initial_state, (str, os.PathLike)):
+        initial_state = read_state(initial_state)
+    state = dict(t_solver=t_solver, initial_state=initial_state, variants=list(variants),
+                 curves=dict(player.control_parameters), dt=t_solver.get_dt(),
+                 duration=duration, output_dir=output_dir,
+                 record_energy=record_energy)
+    results = dict()
+    tic = time.perf_counter()
+
+    def report(result):
+        results[result['index']] = result
+        if progress:
+            print('[{}/{}] variant {} ({:.2f}s, {:.0f} steps/s)'.format(
+                len(results), len(state['variants']), result['variant'],
+                result['wall_time'], result['steps_per_second']), flush=True)
+
+    if n_jobs <= 1:
+        _init_worker(state)
+        try:
+            for index in range(len(state['variants'])):
+                report(_run_variant(index))
+        finally:
+            # leave the solver as it was given
+            player.control_parameters.clear()
+            player.control_parameters.update(state['curves'])
+            t_solver._set_dt(state['dt'])
+            t_solver.reset()
+            _WORKER_STATE.clear()
+    else:
+        if mp_context is None:
+            methods = multiprocessing.get_all_start_methods()
+            mp_context = 'fork' if 'fork' in methods else methods[0]
+        n_workers = min(n_jobs, len(state['variants']))
+        with ProcessPoolExecutor(max_workers=max(n_workers, 1),
+                                 mp_context=multiprocessing.get_context(mp_context),
+                                 initializer=_init_worker,
+                                 initargs=(state,)) as executor:
+            futures = [executor.submit(_run_variant, index)
+                       for index in range(len(state['variants']))]
+            for future in as_completed(futures):
+                report(future.result())
+
+    results = [results[index] for index in range(len(state['variants']))]
+    workers = dict()
+    for result in results:
+        worker = workers.setdefault(str(result['worker']),
+                                    {'variants': 0, 'wall_time': 0.,
+                                     'n_steps': 0})
+        worker['variants'] += 1
+        worker['wall_time'] += result['wall_time']
+        worker['n_steps'] += result['n_steps']
+    for worker in workers.values():
+        worker['steps_per_second'] = worker['n_steps'] / worker['wall_time']
+    summary = {'wall_time': time.perf_counter() - tic, 'duration': duration,
+               'n_jobs': n_jobs, 'workers': workers, 'results': results}
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as file:
+        json.dump(summary, file, indent=2)
+    return results
+
+
+def load_variant(output_dir, index):
+    """
+    Read the recording of a variant.
+
+    Parameters
+    ----------
+    output_dir : str
+        The directory of the sweep.
+    index : int
+        The index of the variant.
+
+    Returns
+    -------
+    ts : array of float
+        The recorded instants.
+    values : dict
+        The recorded signals, as `RecordingDevice.values`.
+    variant : dict
+        The description of the variant.
+    """
+    with np.load(variant_filename(output_dir, index)) as data:
+        values = {key: data[key] for key in data.files
+                  if key not in ('ts', 'variant')}
+        return data['ts'], values, json.loads(str(data['variant']))
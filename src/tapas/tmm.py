@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vectorized transfer matrix method (TMM) for main bores made of cones.
+
+With `compute_method='TMM'`, openwind computes the transfer matrix of each
+pipe in a loop over its subdivisions, and solves the assembled sparse system
+frequency by frequency. Here, all the 2x2 matrices of a bore (the cones,
+subdivided `nb_sub` times, and the masses of the discontinuities of section)
+are built at once as an array of shape `(n_freq, n_elements, 2, 2)`, with
+the closed forms of :py:mod:`openwind.frequential.tmm_tools`. They are then
+multiplied by pairs, in `log2(n_elements)` batched matrix products
+(:py:func:`chain_product`).
+
+Several bores can be computed together (they are padded with identities to
+the same number of elements), e.g. for the generation of datasets:
+
+.. code-block:: python
+
+    Z = tmm_impedance('Tr_co_MP', frequencies, nb_sub=10)
+    Z.shape     # (n_freq,)
+    Z = tmm_impedance([bore1, bore2, bore3], frequencies)
+    Z.shape     # (3, n_freq)
+
+The result is the one of :py:class:`ImpedanceComputation\
+<openwind.impedance_computation.ImpedanceComputation>` with
+`compute_method='TMM'` for a main bore without holes, up to rounding errors.
+"""
+
+import numpy as np
+
+from openwind import InstrumentGeometry
+from openwind.continuous import Physics, radiation_model
+from openwind.frequential.tmm_tools import compute_beta_S, zv_yt_TMM
+
+
+LOSSES = {True: 'bessel', 'bessel': 'bessel', 'keefe': 'keefe',
+          'minikeefe': 'minikeefe', False: None}
+"""dict: The losses models of the TMM, by value of the option `losses`."""
+
+
+def bore_segments(main_bore, unit='m', diameter=False):
+    """
+    The conical segments of a main bore.
+
+    Parameters
+    ----------
+    main_bore : str or list or array
+        The main bore, as given to :py:class:`InstrumentGeometry\
+        <openwind.technical.instrument_geometry.InstrumentGeometry>`, or
+        directly the array of segments.
+    unit, diameter : optional
+        The options of the geometry.
+
+    Returns
+    -------
+    array of float
+        The length, input radius and output radius of the segments, in m,
+        of shape `(n_segments, 3)`.
+    """
+    if isinstance(main_bore, np.ndarray) and main_bore.ndim == 2:
+        return main_bore
+    instru_geom = InstrumentGeometry(main_bore, unit=unit, diameter=diameter)
+    segments = list()
+    for shape in instru_geom.main_bore_shapes:
+        if not shape.is_TMM_compatible():
+            raise ValueError('The TMM can only be used with cones and not '
+                             '{}'.format(shape))
+        x_min, x_max = (pos.get_value()
+                        for pos in shape.get_endpoints_position())
+        segments.append([x_max - x_min, shape.get_radius_at(0),
+                         shape.get_radius_at(1)])
+    return np.array(segments)
+
+
+def _elements(segments, nb_sub, lossless, discontinuity_mass):
+    """
+    The elementary elements of a bore, in the order of the chain.
+
+    Returns the arrays of lengths, input and output radii of the cones
+    (subdivided as in :py:func:`cone_lossy\
+    <openwind.frequential.tmm_tools.cone_lossy>`), and the radii of the
+    discontinuities (length 0).
+    """
+    lengths, r_in, r_out = list(), list(), list()
+    for k, (lpart, Rbeg, Rend) in enumerate(segments):
+        if k > 0 and discontinuity_mass and r_out[-1] != Rbeg:
+            lengths.append(0.)
+            r_in.append(r_out[-1])
+            r_out.append(Rbeg)
+        n_sub = 1 if (lossless or Rbeg == Rend) else nb_sub
+        lcur = lpart / n_sub
+        for i in range(n_sub):
+            lengths.append(lcur)
+            r_in.append(Rend + (Rbeg - Rend) * (lpart - i*lcur) / lpart)
+            r_out.append(Rend + (Rbeg - Rend) * (lpart - (i + 1)*lcur) / lpart)
+    return np.array(lengths), np.array(r_in), np.array(r_out)
+
+
+def _cone_matrices(lengths, R0, R1, omegas, physics, loss_type, sph,
+                   reff_tmm_losses):
+    """
+    The transfer matrices of cones, as :py:func:`cone_lossy\
+    <openwind.frequential.tmm_tools.cone_lossy>` for one subdivision.
+
+    The geometric arrays have the shape `(..., n_elements)`, the result has
+    the shape `(..., n_freq, n_elements, 2, 2)`.
+    """
+    L = np.sqrt(lengths**2 + (R0 - R1)**2)
+    beta, S = compute_beta_S(R0, R1, lengths, sph)
+    Rmin, Rmax = np.minimum(R0, R1), np.maximum(R0, R1)
+    if loss_type is None:
+        Req = Rmin
+    elif reff_tmm_losses == 'mean':
+        Req = (Rmin + Rmax) / 2
+    elif reff_tmm_losses == 'third':
+        Req = (2*Rmin + Rmax) / 3
+    elif reff_tmm_losses == 'integral':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            Req = np.where(Rmax == Rmin, Rmin,
+                           (Rmax - Rmin) / np.log1p((Rmax - Rmin) / Rmin))
+    else:
+        raise ValueError("Unknown option for 'reff_tmm_losses' please chose "
+                         "between: {'integral', 'third', 'mean'}")
+    # the geometric arrays broadcast against the frequencies
+    expand = (Ellipsis, np.newaxis, slice(None))
+    beta, S, Req, R0, R1 = (value[expand] for value in (beta, S, Req, R0, R1))
+    length = (L if sph else lengths)[expand]
+    omegas = omegas[:, np.newaxis]
+    if loss_type is None:
+        celerity, rho = physics.get_coefs(0, 'c', 'rho')
+        Zv = 1j*omegas*rho / S
+        Yt = 1j*omegas*S / (rho*celerity**2)
+    else:
+        Zv, Yt = zv_yt_TMM(Req, S, omegas, physics, loss_type)
+    Gamma = np.sqrt(Zv * Yt)
+    Zcc = np.sqrt(Zv / Yt)
+    coshGL = np.cosh(Gamma*length)
+    sinhGL = np.sinh(Gamma*length)
+
+    matrices = np.empty(coshGL.shape + (2, 2), dtype=np.complex128)
+    matrices[..., 0, 0] = R1/R0 * coshGL - beta/Gamma * sinhGL
+    matrices[..., 0, 1] = R0/R1 * Zcc * sinhGL
+    matrices[..., 1, 0] = 1/Zcc * ((R1/R0 - beta**2/Gamma**2) * sinhGL
+                                   + length * beta**2/Gamma * coshGL)
+    matrices[..., 1, 1] = R0/R1 * (coshGL + (beta/Gamma) * sinhGL)
+    return matrices
+
+
+def _discontinuity_mass(r1, r2, rho):
+    # as JunctionDiscontinuity.compute_mass(), not scaled
+    rmin, rmax = np.minimum(r1, r2), np.maximum(r1, r2)
+    alpha = rmin/rmax
+    mass = (.09616*alpha**6 - .12386*alpha**5 + 0.03816*alpha**4
+            + 0.0809*alpha**3 - .353*alpha + .26164)
+    return rho/rmin*mass
+
+
+def transfer_matrices(segments, frequencies, temperature=25, losses=True,
+                      nb_sub=1, spherical_waves=False,
+                      reff_tmm_losses='integral', discontinuity_mass=True,
+                      humidity=.5, carbon=4e-4):
+    """
+    The transfer matrices of the elements of one or several bores.
+
+    Parameters
+    ----------
+    segments : array or list of arrays
+        The segments of a bore (see :py:func:`bore_segments`), or a list of
+        them.
+    frequencies : array of float
+        The frequencies.
+    temperature : float, optional
+        The (uniform) temperature in °C. Default is 25.
+    losses : {True, False, 'bessel', 'keefe', 'minikeefe'}, optional
+        The losses model. Default is True.
+    nb_sub : int, optional
+        The number of subdivisions of the cones (not of the cylinders).
+        Default is 1.
+    spherical_waves : bool or str, optional
+        The spherical waves option of the cones. Default is False.
+    reff_tmm_losses : {'integral', 'third', 'mean'}, optional
+        The radius of the equivalent cylinder for the losses. Default is
+        'integral'.
+    discontinuity_mass : bool, optional
+        Include the masses of the discontinuities of section. Default is
+        True.
+    humidity, carbon : float, optional
+        The composition of the air.
+
+    Returns
+    -------
+    array of complex
+        The matrices, from the entrance to the end of the bore, of shape
+        `(n_freq, n_elements, 2, 2)` for one bore, or
+        `(n_bores, n_freq, n_elements, 2, 2)` for a list of bores (the
+        shortest are completed by identities).
+    """
+    if losses not in LOSSES:
+        raise ValueError("The TMM supports the losses {}, not '{}'."
+                         .format(list(LOSSES), losses))
+    loss_type = LOSSES[losses]
+    single = isinstance(segments, np.ndarray) and segments.ndim == 2
+    bores = [segments] if single else list(segments)
+    physics = Physics(temperature, humidity=humidity, carbon=carbon)
+    omegas = 2*np.pi*np.asarray(frequencies, dtype=float)
+
+    elements = [_elements(np.asarray(bore), nb_sub, loss_type is None,
+                          discontinuity_mass) for bore in bores]
+    n_elements = max(len(lengths) for lengths, _, _ in elements)
+    # the padding elements are dummy cylinders, replaced by identities
+    lengths, R0, R1 = (np.ones((len(bores), n_elements)) for _ in range(3))
+    kind = np.zeros((len(bores), n_elements), dtype=int)  # 0: padding
+    for k, (length, r_in, r_out) in enumerate(elements):
+        n = len(length)
+        kind[k, :n] = np.where(length > 0, 1, 2)  # 1: cone, 2: mass
+        cone = length > 0
+        lengths[k, :n][cone] = length[cone]
+        R0[k, :n][cone] = r_in[cone]
+        R1[k, :n][cone] = r_out[cone]
+        R0[k, :n][~cone] = r_in[~cone]      # radii of the discontinuities
+        R1[k, :n][~cone] = r_out[~cone]
+    is_mass = kind == 2
+    cone_R0 = np.where(is_mass, 1., R0)
+    cone_R1 = np.where(is_mass, 1., R1)
+
+    matrices = _cone_matrices(lengths, cone_R0, cone_R1, omegas, physics,
+                              loss_type, spherical_waves, reff_tmm_losses)
+    identity = np.eye(2)
+    matrices[np.broadcast_to((kind == 0)[:, np.newaxis],
+                             matrices.shape[:-2])] = identity
+    if np.any(is_mass):
+        rho = physics.get_coefs(0, 'rho')[0]
+        masses = _discontinuity_mass(R0[is_mass], R1[is_mass], rho)
+        series = np.zeros((len(omegas), len(masses), 2, 2), dtype=np.complex128)
+        series[..., 0, 0] = series[..., 1, 1] = 1
+        series[..., 0, 1] = 1j*omegas[:, np.newaxis]*masses
+        rows, cols = np.nonzero(is_mass)
+        matrices[rows, :, cols] = np.moveaxis(series, 0, 1)
+    return matrices[0] if single else matrices
+
+
+def chain_product(matrices):
+    """
+    The product of a chain of 2x2 matrices, by pairs.
+
+    The successive matrices are multiplied two by two (a batched product of
+    all the pairs), until one matrix remains: `log2(n)` vectorized steps
+    instead of `n` products.
+
+    Parameters
+    ----------
+    matrices : array
+        The matrices, of shape `(..., n, 2, 2)`, in the order of the product.
+
+    Returns
+    -------
+    array
+        The product, of shape `(..., 2, 2)`.
+    """
+    while matrices.shape[-3] > 1:
+        if matrices.shape[-3] % 2:
+            identity = np.broadcast_to(np.eye(2, dtype=matrices.dtype),
+                                       matrices.shape[:-3] + (1, 2, 2))
+            matrices = np.concatenate([matrices, identity], axis=-3)
+        matrices = matrices[..., 0::2, :, :] @ matrices[..., 1::2, :, :]
+    return matrices[..., 0, :, :]
+
+
+def tmm_impedance(main_bores, frequencies, temperature=25, losses=True,
+                  radiation_category='unflanged', nb_sub=1,
+                  spherical_waves=False, reff_tmm_losses='integral',
+                  discontinuity_mass=True, humidity=.5, carbon=4e-4,
+                  unit='m', diameter=False, max_size=2**22):
+    """
+    The input impedance of one or several main bores with the TMM.
+
+    Parameters
+    ----------
+    main_bores : str or list or array, or list of them
+        A main bore (file, list or segments, see :py:func:`bore_segments`),
+        or a list of main bores.
+    frequencies : array of float
+        The frequencies.
+    temperature : float, optional
+        The (uniform) temperature in °C. Default is 25.
+    losses : {True, False, 'bessel', 'keefe', 'minikeefe'}, optional
+        The losses model. Default is True.
+    radiation_category : str, optional
+        The radiation at the end of the bores, 'closed' and 'perfectly_open'
+        included. Default is 'unflanged'.
+    nb_sub, spherical_waves, reff_tmm_losses, discontinuity_mass,\
+    humidity, carbon :
+        See :py:func:`transfer_matrices`.
+    unit, diameter : optional
+        The options of the geometries.
+    max_size : int, optional
+        The maximal number of matrices built at once: the frequencies are
+        split in chunks to bound the memory. Default is 2**22 (256 MiB of
+        matrices).
+
+    Returns
+    -------
+    array of complex
+        The impedance, of shape `(n_freq,)` for one bore or
+        `(n_bores, n_freq)` for a list of bores.
+    """
+    single = not _is_bore_list(main_bores)
+    bores = [main_bores] if single else main_bores
+    segments = [bore_segments(bore, unit=unit, diameter=diameter)
+                for bore in bores]
+    frequencies = np.asarray(frequencies, dtype=float)
+    omegas = 2*np.pi*frequencies
+
+    physics = Physics(temperature, humidity=humidity, carbon=carbon)
+    rho, celerity = physics.get_coefs(0, 'rho', 'c')
+    radiation = radiation_model(radiation_category)
+    radius_end = np.array([segment[-1, 2] for segment in segments])
+    args = (omegas[np.newaxis, :], radius_end[:, np.newaxis], rho, celerity, 1)
+    shape = (len(segments), len(frequencies))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        Zr = np.broadcast_to(radiation.get_impedance(*args), shape)
+        Yr = np.broadcast_to(radiation.get_admitance(*args), shape)
+    # a closed end has an infinite impedance: its admittance is used instead
+    closed = ~np.isfinite(Zr)
+    Zr = np.where(closed, 0, Zr)
+    Yr = np.where(closed, Yr, 0)
+
+    options = dict(temperature=temperature, losses=losses, nb_sub=nb_sub,
+                   spherical_waves=spherical_waves,
+                   reff_tmm_losses=reff_tmm_losses,
+                   discontinuity_mass=discontinuity_mass, humidity=humidity,
+                   carbon=carbon)
+    n_elements = max(len(segment) for segment in segments)*(nb_sub + 1)
+    chunk = max(1, max_size // (len(segments)*n_elements))
+    impedance = np.empty((len(segments), len(frequencies)), dtype=np.complex128)
+    for start in range(0, len(frequencies), chunk):
+        stop = start + chunk
+        total = chain_product(transfer_matrices(segments, frequencies[start:stop],
+                                                **options))
+        A, B = total[..., 0, 0], total[..., 0, 1]
+        C, D = total[..., 1, 0], total[..., 1, 1]
+        Zr_chunk, Yr_chunk = Zr[:, start:stop], Yr[:, start:stop]
+        impedance[:, start:stop] = np.where(closed[:, start:stop],
+                                            (A + B*Yr_chunk) / (C + D*Yr_chunk),
+                                            (A*Zr_chunk + B) / (C*Zr_chunk + D))
+    return impedance[0] if single else impedance
+
+
+def _is_bore_list(value):
+    # a list of main bores, and not one main bore given as a list of points
+    # or of shapes
+    def is_bore(item):
+        return (isinstance(item, str)
+                or (isinstance(item, np.ndarray) and item.ndim == 2)
+                or (isinstance(item, (list, tuple)) and len(item) > 0
+                    and isinstance(item[0], (list, tuple))))
+    return (isinstance(value, (list, tuple)) and len(value) > 0
+            and all(is_bore(item) for item in value))
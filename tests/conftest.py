@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared instruments of the tests.
+
+The tests compare the tools of tapas to the reference computations of
+openwind on small instruments, so that the whole suite runs in a minute.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'src'))
+
+from openwind import InstrumentGeometry, InstrumentPhysics, Player  # noqa: E402
+from openwind.technical.temporal_curves import ADSR  # noqa: E402
+
+
+GEOMETRY = [[0.0, 5e-3], [0.2, 5e-3], [0.3, 8e-3], [0.5, 8e-3]]
+"""list: A cylinder followed by a cone and a cylinder, in m."""
+
+HOLES = [['label', 'position', 'radius', 'chimney'],
+         ['h1', .25, 2e-3, 3e-3]]
+"""list: A tonehole on the cone."""
+
+
+def reed_player(**curves):
+    """A clarinet-like reed, with an attack of 20 ms, and some `curves`."""
+    parameters = {'excitator_type': 'Reed1dof_scaled',
+                  'gamma': ADSR(0, 0.4, .45, 2e-2, 2e-2, 1, 2e-2),
+                  'zeta': .35, 'kappa': 0.35,
+                  'pulsation': 2*np.pi*2700, 'qfactor': 6,
+                  'model': 'inwards', 'contact_stifness': 1e4,
+                  'contact_exponent': 4, 'opening': 5e-4,
+                  'closing_pressure': 5e3}
+    parameters.update(curves)
+    return Player(parameters)
+
+
+def reed_physics(losses='diffrepr', holes=(), **curves):
+    """The instrument played with :py:func:`reed_player`."""
+    geometry = InstrumentGeometry(GEOMETRY, list(holes))
+    return InstrumentPhysics(geometry, 25, reed_player(**curves), losses)
+
+
+def assert_signals_close(reference, values, rtol=1e-9):
+    """The recorded signals are equal up to `rtol` of their maximum."""
+    for key, signal in reference.items():
+        signal = np.asarray(signal)
+        scale = np.max(np.abs(signal)) or 1
+        np.testing.assert_allclose(np.asarray(values[key]) / scale,
+                                   signal / scale, rtol=0, atol=rtol,
+                                   err_msg=key)
+
+
+@pytest.fixture
+def frequencies():
+    return np.arange(50, 2000, 10.)
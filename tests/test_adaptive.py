@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The adaptive impedance is the one of openwind on a dense axis."""
+
+import numpy as np
+
+from openwind import (FrequentialSolver, InstrumentGeometry,
+                      InstrumentPhysics, Player)
+
+from conftest import GEOMETRY, HOLES
+from tapas.adaptive import adaptive_impedance
+
+
+def physics():
+    return InstrumentPhysics(InstrumentGeometry(GEOMETRY, HOLES), 25,
+                             Player(), 'bessel')
+
+
+def test_adaptive_impedance_is_the_one_of_openwind(frequencies):
+    f_solver = FrequentialSolver(physics(), frequencies)
+    f_solver.solve()
+    impedance = f_solver.impedance.copy()
+    rtol = atol = 1e-4
+    result = adaptive_impedance(f_solver, rtol=rtol, atol=atol)
+    assert result.converged
+
+    # the solver is given back
+    np.testing.assert_array_equal(f_solver.frequencies, frequencies)
+    np.testing.assert_array_equal(f_solver.impedance, impedance)
+    f_solver.solve()
+    np.testing.assert_allclose(f_solver.impedance, impedance, rtol=1e-12)
+
+    # same mesh (adapted to the same highest frequency)
+    fresh = FrequentialSolver(physics(), result.frequencies)
+    fresh.solve()
+    np.testing.assert_allclose(result.impedance, fresh.impedance, rtol=1e-12)
+
+    dense = FrequentialSolver(physics(),
+                              np.arange(frequencies[0], frequencies[-1] + .1,
+                                        .5))
+    dense.solve()
+    assert result.n_solves < len(dense.frequencies) / 10
+    Zc = f_solver.get_ZC_adim()
+    error = np.abs(result(dense.frequencies) - dense.impedance) / Zc
+    assert np.all(error < atol + rtol*np.abs(dense.impedance) / Zc)
+
+    modulus = np.abs(dense.impedance)
+    maxima = np.nonzero((modulus[1:-1] > modulus[:-2])
+                        & (modulus[1:-1] > modulus[2:]))[0] + 1
+    peaks, _ = result.resonance_peaks(3)
+    np.testing.assert_allclose(peaks, dense.frequencies[maxima[:3]], rtol=0,
+                               atol=0.5)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The streamed WAV files hold the signal recorded by openwind."""
+
+import numpy as np
+import pytest
+from scipy.io import wavfile
+
+from openwind import TemporalSolver
+from openwind.temporal import RecordingDevice
+
+from conftest import reed_physics
+from tapas.audio import AudioSink, PeakLimiter, WavWriter
+from tapas.resampling import resample
+
+
+@pytest.mark.parametrize('sample_format, scale, atol',
+                         [('int16', 32767, 0.5/32767),
+                          ('int24', 8388607*256, 0.5/8388607),
+                          ('float32', 1, 1e-7)])
+def test_wav_writer_is_read_by_scipy(tmp_path, sample_format, scale, atol):
+    filename = str(tmp_path / 'sine.wav')
+    # an odd number of 3-byte samples needs a pad byte
+    signal = 0.5*np.sin(2*np.pi*440*np.arange(1001)/44100)
+    with WavWriter(filename, 44100, sample_format) as writer:
+        writer.write(signal[:500])
+        writer.write(signal[500:])
+    samplerate, data = wavfile.read(filename)
+    assert samplerate == 44100
+    np.testing.assert_allclose(data / scale, signal, rtol=0, atol=atol)
+
+
+def test_sink_writes_the_recorded_signal(tmp_path):
+    filename = str(tmp_path / 'reed.wav')
+    t_solver = TemporalSolver(reed_physics(), l_ele=0.05, order=4)
+    rec = RecordingDevice()
+    reference_peak = 1e4
+    sink = AudioSink(filename, samplerate=44100, sample_format='float32',
+                     reference_peak=reference_peak, chunk_size=500)
+
+    def callback(t_solver):
+        rec.callback(t_solver)
+        sink.callback(t_solver)
+
+    with sink:
+        t_solver.run_simulation_steps(3000, callback=callback,
+                                      enable_tracker_display=False)
+    rec.stop_recording()
+
+    pressure = np.asarray(rec.values['bell_radiation_pressure'])
+    assert np.max(np.abs(pressure)) < reference_peak
+    expected = resample(pressure, 1/rec.dt, 44100)
+    # constant gain, delayed by the look-ahead of the limiter
+    expected = np.concatenate([np.zeros(sink.limiter.lookahead),
+                               0.98 * expected / reference_peak])
+    samplerate, data = wavfile.read(filename)
+    assert samplerate == 44100
+    assert sink.get_duration() == len(data) / 44100
+    np.testing.assert_allclose(data, expected, rtol=0,
+                               atol=1e-6*np.max(np.abs(expected)))
+
+
+def test_limiter_never_exceeds_the_target():
+    rng = np.random.default_rng(0)
+    # a quiet attack followed by peaks 100 times louder
+    signal = np.concatenate([0.01*rng.standard_normal(1000),
+                             rng.standard_normal(3000)])
+    limiter = PeakLimiter(64, target=0.9)
+    out = np.concatenate([limiter.process(signal[k:k + 300])
+                          for k in range(0, len(signal), 300)]
+                         + [limiter.flush()])
+    assert np.max(np.abs(out)) <= 0.9 + 1e-12
+    # the output is the input delayed, with a gain going down only
+    gain = out[64:] / np.where(signal == 0, np.nan, signal)
+    np.testing.assert_array_less(np.diff(gain[np.isfinite(gain)]), 1e-12)
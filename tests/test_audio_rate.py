@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The audio-rate solver is the one of openwind with a chosen time step."""
+
+import numpy as np
+
+from openwind import TemporalSolver
+from openwind.temporal import RecordingDevice
+
+from conftest import assert_signals_close, reed_physics
+from tapas.audio_rate import AudioRateTemporalSolver
+
+
+def record(t_solver, n_steps):
+    rec = RecordingDevice()
+    t_solver.run_simulation_steps(n_steps, callback=rec.callback,
+                                  enable_tracker_display=False)
+    rec.stop_recording()
+    return rec
+
+
+def test_largest_time_step_on_the_audio_rate():
+    samplerate = 44100
+    t_solver = AudioRateTemporalSolver(reed_physics(), samplerate=samplerate,
+                                       l_ele=0.05, order=4)
+    reference = TemporalSolver(reed_physics(), l_ele=0.05, order=4)
+    K = t_solver.oversampling
+    cfl_dt = 0.9 * reference.cfl_of_components[0][1]
+    assert 1/(samplerate*K) <= cfl_dt < 1/(samplerate*(K - 1))
+    assert t_solver.get_dt() == 1/(samplerate*K)
+
+    reference._set_dt(t_solver.get_dt())
+    assert_signals_close(record(reference, 40*K).values,
+                         record(t_solver, 40*K).values)
+
+    t_solver.run_simulation(10/samplerate, enable_tracker_display=False)
+    assert t_solver.n_steps_run == 50*K
+    cost = t_solver.cost_per_sample()
+    assert cost['steps'] == K
+    assert cost['dof_updates'] == K*t_solver.get_n_dof()
+    assert cost['seconds'] > 0
+
+
+def test_mesh_coarsened_for_a_fixed_oversampling():
+    samplerate = 44100
+    fine = AudioRateTemporalSolver(reed_physics(), samplerate=samplerate,
+                                   l_ele=0.05, order=4)
+    K = fine.oversampling - 1
+    t_solver = AudioRateTemporalSolver(reed_physics(), samplerate=samplerate,
+                                       oversampling=K, l_ele=0.05, order=4)
+    assert t_solver.oversampling == K
+    assert t_solver.get_dt() <= t_solver.get_cfl_dt()
+    l_ele = t_solver._solver_kwargs['l_ele']
+    assert l_ele > 0.05
+    assert t_solver.get_n_dof() < fine.get_n_dof()
+
+    reference = TemporalSolver(reed_physics(), l_ele=l_ele, order=4)
+    reference._set_dt(t_solver.get_dt())
+    assert_signals_close(record(reference, 40*K).values,
+                         record(t_solver, 40*K).values)
+    assert np.isnan(fine.cost_per_sample()['seconds'])
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The batch renders each input to its own outputs, even when some fail."""
+
+import json
+import os
+
+import numpy as np
+
+from openwind import ImpedanceComputation
+from openwind.impedance_tools import read_impedance
+
+from conftest import GEOMETRY
+from tapas.batch import output_names, run_batch
+
+
+class _ExitOnLoad:
+    """An option killing the worker process which unpickles it."""
+
+    def __reduce__(self):
+        return (os._exit, (1,))
+
+
+def write_bores(tmp_path):
+    bores = {'a': GEOMETRY, 'b': [[0.0, 4e-3], [0.4, 6e-3]]}
+    filenames = list()
+    for folder, bore in bores.items():
+        os.makedirs(tmp_path / folder)
+        filename = str(tmp_path / folder / 'trumpet.txt')
+        np.savetxt(filename, bore)
+        filenames.append(filename)
+    return filenames, list(bores.values())
+
+
+def test_output_names():
+    assert output_names(['x/a/trumpet.txt', 'x/b/trumpet.csv',
+                         'x/a/trumpet.txt']) == [os.path.join('a', 'trumpet'),
+                                                 os.path.join('b', 'trumpet'),
+                                                 os.path.join('a', 'trumpet-2')]
+
+
+def test_same_file_names_and_duplicates(tmp_path, frequencies):
+    filenames, bores = write_bores(tmp_path)
+    output_dir = str(tmp_path / 'renders')
+    results = run_batch(filenames + filenames[:1], output_dir, jobs=1,
+                        progress=False, audio=False, frequencies=frequencies)
+    assert [result['status'] for result in results] == ['ok'] * 3
+    outputs = [result['outputs'][0] for result in results]
+    assert len(set(outputs)) == 3
+    for output, bore in zip(outputs, bores + bores[:1]):
+        reference = ImpedanceComputation(frequencies, bore, temperature=25)
+        _, impedance = read_impedance(output)
+        np.testing.assert_allclose(impedance, reference.impedance, rtol=1e-6)
+    with open(os.path.join(output_dir, 'summary.json')) as file:
+        assert len(json.load(file)['results']) == 3
+
+
+def test_crashed_worker_is_reported(tmp_path, frequencies):
+    filenames, _ = write_bores(tmp_path)
+    output_dir = str(tmp_path / 'renders')
+    results = run_batch(filenames, output_dir, jobs=2, progress=False,
+                        audio=False, frequencies=frequencies,
+                        holes_valves=_ExitOnLoad())
+    assert [result['status'] for result in results] == ['failed'] * 2
+    assert 'terminated abruptly' in results[0]['error']
+    with open(os.path.join(output_dir, 'summary.json')) as file:
+        assert len(json.load(file)['results']) == 2
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""A simulation resumed from a checkpoint continues the uninterrupted one."""
+
+import pytest
+
+from openwind import TemporalSolver
+from openwind.temporal import RecordingDevice
+
+from conftest import HOLES, assert_signals_close, reed_physics
+from tapas.checkpoint import load_state, resume_simulation, save_state
+
+
+@pytest.mark.parametrize('losses', ['diffrepr', False])
+def test_resume_matches_uninterrupted_run(tmp_path, losses):
+    n_steps = 500
+
+    def solver():
+        return TemporalSolver(reed_physics(losses, holes=HOLES), l_ele=0.05,
+                              order=4)
+
+    uninterrupted = solver()
+    rec = RecordingDevice()
+    uninterrupted.run_simulation_steps(2*n_steps, callback=rec.callback,
+                                       enable_tracker_display=False)
+    rec.stop_recording()
+
+    interrupted = solver()
+    interrupted.run_simulation_steps(n_steps, enable_tracker_display=False)
+    filename = str(tmp_path / 'state.npz')
+    save_state(interrupted, filename)
+
+    resumed = solver()
+    load_state(resumed, filename)
+    rec_resumed = RecordingDevice()
+    duration = n_steps * resumed.get_dt() * resumed.scaling.get_time()
+    assert resume_simulation(resumed, duration,
+                             callback=rec_resumed.callback) == n_steps
+    rec_resumed.stop_recording()
+    assert resumed.get_current_time() == pytest.approx(
+        uninterrupted.get_current_time())
+    assert_signals_close({key: value[n_steps:]
+                          for key, value in rec.values.items()},
+                         rec_resumed.values)
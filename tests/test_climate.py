@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The swept conditions give the impedance of a solver built for each one."""
+
+import numpy as np
+import pytest
+
+from openwind import FrequentialSolver, InstrumentGeometry, InstrumentPhysics
+from openwind import Player
+
+from conftest import GEOMETRY, HOLES
+from tapas.climate import ClimateSweep
+
+
+CHART = [['label', 'A', 'B'],
+         ['h1', 'x', 'o']]
+
+
+def gradient(x):
+    return 30 - 20*x
+
+
+def reference(frequencies, note=None, **condition):
+    geometry = InstrumentGeometry(GEOMETRY, HOLES, CHART)
+    instru_phy = InstrumentPhysics(geometry, player=Player(), losses=True,
+                                   **condition)
+    f_solver = FrequentialSolver(instru_phy, frequencies, l_ele=0.05,
+                                 order=4)
+    if note is not None:
+        f_solver.set_note(note)
+    f_solver.solve()
+    return f_solver.impedance
+
+
+def test_conditions_are_the_ones_of_fresh_solvers(frequencies):
+    sweep = ClimateSweep(frequencies, GEOMETRY, HOLES, CHART, l_ele=0.05,
+                         order=4)
+    temperatures = [10, 25, gradient]
+    impedances = sweep.impedance(temperature=temperatures, humidity=0.3)
+    assert impedances.shape == (3, len(frequencies))
+    for temperature, impedance in zip(temperatures, impedances):
+        expected = reference(frequencies, temperature=temperature,
+                             humidity=0.3)
+        np.testing.assert_allclose(impedance, expected, rtol=1e-10)
+
+    impedances = sweep.impedance(temperature=15, carbon=[4e-4, 1e-2],
+                                 notes=['A', 'B'])
+    assert impedances.shape == (2, 2, len(frequencies))
+    for carbon, by_note in zip([4e-4, 1e-2], impedances):
+        for note, impedance in zip(['A', 'B'], by_note):
+            expected = reference(frequencies, note, temperature=15,
+                                 humidity=0.5, carbon=carbon)
+            np.testing.assert_allclose(impedance, expected, rtol=1e-10)
+
+
+def test_conditions_of_different_lengths(frequencies):
+    sweep = ClimateSweep(frequencies, GEOMETRY, l_ele=0.05, order=4)
+    with pytest.raises(ValueError, match='same length'):
+        sweep.impedance(temperature=[10, 20], humidity=[.1, .2, .3])
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The simulation with sampled curves is the one of openwind."""
+
+import numpy as np
+import pytest
+
+from openwind import (InstrumentGeometry, InstrumentPhysics, Player,
+                      TemporalSolver)
+from openwind.technical.temporal_curves import add, gate
+from openwind.temporal import RecordingDevice
+
+from conftest import GEOMETRY, assert_signals_close, reed_physics
+from tapas.curves import SampledCurve, run_sampled_simulation, sampled_curves
+
+
+DURATION = 0.02
+
+
+def flute_physics():
+    """A recorder (without noise) whose jet velocity changes halfway."""
+    player = Player('SOPRANO_RECORDER')
+    player.update_curve('noise_level', 0.)
+    switch = DURATION / 2
+    player.update_curve('jet_velocity',
+                        add(gate(-5e-3, 5e-3, switch - 2e-3, switch + 2e-3,
+                                 shape='cos', a=25.),
+                            gate(switch - 2e-3, switch + 2e-3, DURATION,
+                                 DURATION + 5e-3, shape='cos', a=30.)))
+    return InstrumentPhysics(InstrumentGeometry(GEOMETRY), 25, player,
+                             'diffrepr')
+
+
+@pytest.mark.parametrize('physics', [reed_physics, flute_physics])
+def test_sampled_simulation_is_the_one_of_openwind(physics):
+    reference = RecordingDevice()
+    TemporalSolver(physics(), l_ele=0.05, order=4).run_simulation(
+        DURATION, callback=reference.callback, enable_tracker_display=False)
+    reference.stop_recording()
+
+    t_solver = TemporalSolver(physics(), l_ele=0.05, order=4)
+    curves = dict(t_solver.instru_physics.player.control_parameters)
+    rec = RecordingDevice()
+    n_steps = run_sampled_simulation(t_solver, DURATION,
+                                     callback=rec.callback,
+                                     enable_tracker_display=False)
+    rec.stop_recording()
+    assert n_steps == len(reference.ts)
+    np.testing.assert_allclose(rec.ts, reference.ts, rtol=1e-12)
+    assert_signals_close(reference.values, rec.values)
+    # the curves of the player are given back
+    assert t_solver.instru_physics.player.control_parameters == curves
+
+
+def test_live_curves_are_not_sampled():
+    t_solver = TemporalSolver(reed_physics(), l_ele=0.05, order=4)
+    player = t_solver.instru_physics.player
+    with sampled_curves(t_solver, 10, live=['gamma']):
+        assert not isinstance(player.control_parameters['gamma'],
+                              SampledCurve)
+    with pytest.raises(ValueError, match='no curves'):
+        with sampled_curves(t_solver, 10, live=['blowing']):
+            pass
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""A generation resumed after a crash gives the dataset of a single run."""
+
+import os
+
+import numpy as np
+
+from tapas import dataset
+from tapas.dataset import (BoreFamily, DatasetManifest, _compute_shard,
+                           generate_dataset, load_dataset)
+
+
+FAMILY = BoreFamily(length=(0.4, 0.6), n_segments=2, n_holes=1)
+
+
+def _crash_on_shard_1(path, *args):
+    """Kill the worker computing the shard 1, as an out of memory would."""
+    if os.path.basename(path) == DatasetManifest.shard_name(1):
+        os._exit(1)
+    return _compute_shard(path, *args)
+
+
+def generate(output_dir):
+    return generate_dataset(str(output_dir), FAMILY, n_samples=6,
+                            shard_size=2, seed=3,
+                            frequencies=np.arange(50, 1500, 10.), jobs=2,
+                            progress=False, max_retries=1)
+
+
+def test_resume_after_a_crash(tmp_path, monkeypatch):
+    with monkeypatch.context() as patch:
+        patch.setattr(dataset, '_compute_shard', _crash_on_shard_1)
+        manifest = generate(tmp_path / 'resumed')
+    states = {name: shard['status'] for name, shard in manifest.shards.items()}
+    assert states == {'shard_00000.h5': 'done', 'shard_00001.h5': 'failed',
+                      'shard_00002.h5': 'done'}
+    error = manifest.shards['shard_00001.h5']['error']
+    assert 'terminated abruptly (2 times)' in error
+    assert manifest.pending() == [1]
+    inodes = {name: os.stat(tmp_path / 'resumed' / name).st_ino
+              for name in manifest.done()}
+
+    manifest = generate(tmp_path / 'resumed')
+    assert manifest.pending() == []
+    # the complete shards are not computed again
+    assert inodes == {name: os.stat(tmp_path / 'resumed' / name).st_ino
+                      for name in inodes}
+
+    generate(tmp_path / 'single')
+    resumed, resumed_attrs = load_dataset(str(tmp_path / 'resumed'))
+    single, single_attrs = load_dataset(str(tmp_path / 'single'))
+    np.testing.assert_array_equal(resumed['index'], np.arange(6))
+    for key in single:
+        np.testing.assert_array_equal(resumed[key], single[key], err_msg=key)
+    assert resumed_attrs['param_labels'] == single_attrs['param_labels']
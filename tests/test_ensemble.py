@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Each variant of an ensemble follows its own TemporalSolver."""
+
+import numpy as np
+import pytest
+
+from openwind import TemporalSolver
+from openwind.temporal import RecordingDevice
+
+import tapas.ensemble
+from conftest import HOLES, assert_signals_close, reed_physics
+from tapas.ensemble import EnsembleTemporalSolver
+from tapas.sweep import curve_grid
+
+
+VARIANTS = curve_grid(zeta=[.3, .4], pulsation=[2*np.pi*2700, 2*np.pi*3000])
+
+
+@pytest.mark.parametrize('kernel', [True, False])
+@pytest.mark.parametrize('losses', ['diffrepr', False])
+def test_variants_match_individual_solvers(monkeypatch, losses, kernel):
+    if not kernel:
+        monkeypatch.setattr(tapas.ensemble, 'csr_matvecs', None)
+    n_steps = 400
+    ensemble = EnsembleTemporalSolver(reed_physics(losses, holes=HOLES),
+                                      VARIANTS, l_ele=0.05, order=4)
+    rec = RecordingDevice()
+    ensemble.run_simulation_steps(n_steps, callback=rec.callback,
+                                  enable_tracker_display=False)
+    rec.stop_recording()
+
+    for index, variant in enumerate(VARIANTS):
+        instru_physics = reed_physics(losses, holes=HOLES)
+        for label, curve in variant.items():
+            instru_physics.player.update_curve(label, curve)
+        t_solver = TemporalSolver(instru_physics, l_ele=0.05, order=4)
+        # the ensemble respects the CFL condition of all the variants
+        assert t_solver.get_dt() >= ensemble.get_dt()*(1 - 1e-12)
+        t_solver._set_dt(ensemble.get_dt())
+        rec_variant = RecordingDevice()
+        t_solver.run_simulation_steps(n_steps, callback=rec_variant.callback,
+                                      enable_tracker_display=False)
+        rec_variant.stop_recording()
+        assert_signals_close(rec_variant.values,
+                             ensemble.variant_values(rec.values, index))
+
+
+def test_unsupported_losses():
+    with pytest.raises(ValueError):
+        EnsembleTemporalSolver(reed_physics(True), VARIANTS)
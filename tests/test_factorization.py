@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The timed solvers count the factorizations without changing the results."""
+
+import threading
+
+import numpy as np
+import pytest
+from scipy.sparse import linalg
+
+from openwind import (FrequentialSolver, InstrumentGeometry,
+                      InstrumentPhysics, Player)
+from openwind.frequential import frequential_solver
+from openwind.inversion import InverseFrequentialResponse
+
+from conftest import GEOMETRY
+from tapas.factorization import (TimedFrequentialSolver,
+                                 TimedInverseFrequentialResponse)
+
+
+def physics(geometry=GEOMETRY):
+    return InstrumentPhysics(InstrumentGeometry(geometry), 25, Player(),
+                             'bessel')
+
+
+def test_solve_is_the_one_of_openwind(frequencies):
+    reference = FrequentialSolver(physics(), frequencies)
+    reference.solve()
+    f_solver = TimedFrequentialSolver(physics(), frequencies)
+    f_solver.solve()
+    np.testing.assert_array_equal(f_solver.impedance, reference.impedance)
+    assert f_solver.timer.counts['factorization'] == len(frequencies)
+    assert frequential_solver.spsolve is linalg.spsolve
+
+
+def test_inversion_is_the_one_of_openwind(frequencies):
+    target = FrequentialSolver(physics(), frequencies)
+    target.solve()
+    geometry = [[0.0, 5e-3], [0.2, '~4.5e-3'], [0.3, 8e-3], [0.5, 8e-3]]
+    results = list()
+    for cls in [InverseFrequentialResponse, TimedInverseFrequentialResponse]:
+        inverse = cls(physics(geometry), frequencies,
+                      target.impedance / target.get_ZC_adim())
+        results.append(inverse.get_cost_grad_hessian([4.8e-3],
+                                                     grad_type='adjoint'))
+    (cost, gradient, _), (timed_cost, timed_gradient, _) = results
+    assert timed_cost == cost
+    np.testing.assert_array_equal(timed_gradient, gradient)
+    assert inverse.timer.counts['factorization'] == len(frequencies)
+    assert set(inverse.timings) == {'update', 'evaluation', 'analysis',
+                                    'factorization', 'solve'}
+
+
+def test_other_threads_are_not_counted(frequencies):
+    f_solver = TimedFrequentialSolver(physics(), frequencies)
+    other = FrequentialSolver(physics(), frequencies)
+    with f_solver.timer.recording():
+        thread = threading.Thread(target=other.solve)
+        thread.start()
+        thread.join()
+    assert f_solver.timer.counts['factorization'] == 0
+    assert frequential_solver.spsolve is linalg.spsolve
+
+
+def test_pardiso_keeps_the_analysis(frequencies):
+    pytest.importorskip('pypardiso')
+    reference = FrequentialSolver(physics(), frequencies)
+    reference.solve()
+    f_solver = TimedFrequentialSolver(physics(), frequencies,
+                                      backend='pardiso')
+    f_solver.solve()
+    f_solver.solve()
+    np.testing.assert_allclose(f_solver.impedance, reference.impedance,
+                               rtol=1e-9)
+    assert f_solver.timer.counts == dict(analysis=1,
+                                         factorization=2*len(frequencies),
+                                         solve=2*len(frequencies))
+
+
+def test_pardiso_inversion(frequencies):
+    pytest.importorskip('pypardiso')
+    target = FrequentialSolver(physics(), frequencies)
+    target.solve()
+    geometry = [[0.0, 5e-3], [0.2, '~4.5e-3'], [0.3, 8e-3], [0.5, 8e-3]]
+    results = list()
+    for cls, kwargs in [(InverseFrequentialResponse, dict()),
+                        (TimedInverseFrequentialResponse,
+                         dict(backend='pardiso'))]:
+        inverse = cls(physics(geometry), frequencies,
+                      target.impedance / target.get_ZC_adim(), **kwargs)
+        # the adjoint state is solved with the transposed matrix
+        results.append([inverse.get_cost_grad_hessian([radius],
+                                                      grad_type='adjoint')
+                        for radius in [4.8e-3, 4.6e-3]])
+    for (cost, gradient, _), (timed_cost, timed_gradient, _) in zip(*results):
+        np.testing.assert_allclose(timed_cost, cost, rtol=1e-9)
+        np.testing.assert_allclose(timed_gradient, gradient, rtol=1e-9)
+    assert inverse.timer.counts['analysis'] == 1
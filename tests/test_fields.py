@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The lazy fields are the ones interpolated by the solve of openwind."""
+
+import numpy as np
+
+from openwind import FrequentialSolver, InstrumentGeometry, InstrumentPhysics
+from openwind import Player
+
+from conftest import GEOMETRY, HOLES
+from tapas.fields import LazyFields
+
+
+def f_solver(frequencies):
+    instru_phy = InstrumentPhysics(InstrumentGeometry(GEOMETRY, HOLES), 25,
+                                   Player(), True)
+    return FrequentialSolver(instru_phy, frequencies, l_ele=0.05, order=4)
+
+
+def test_fields_are_the_ones_of_openwind(tmp_path, frequencies):
+    reference = f_solver(frequencies)
+    reference.solve(interp=True, interp_grid=0.01, interp_grad=True)
+
+    cache_path = str(tmp_path / 'states.npy')
+    fields = LazyFields(f_solver(frequencies), interp_grid=0.01,
+                        cache_path=cache_path)
+    fields.solve()
+    np.testing.assert_array_equal(fields.impedance, reference.impedance)
+    np.testing.assert_array_equal(fields.x_interp, reference.x_interp)
+    for var in ['pressure', 'flow', 'dpressure']:
+        field = getattr(fields, var)
+        expected = getattr(reference, var)
+        assert field.shape == expected.shape
+        np.testing.assert_allclose(np.asarray(field), expected, rtol=1e-12)
+        np.testing.assert_allclose(field[10:20, ::3], expected[10:20, ::3],
+                                   rtol=1e-12)
+        np.testing.assert_allclose(field[5, 7], expected[5, 7], rtol=1e-12)
+    np.testing.assert_allclose(fields.pressure.at_frequency(495),
+                               reference.pressure[45], rtol=1e-12)
+
+    # the stored states, without solving again
+    loaded = LazyFields.load(f_solver(frequencies), cache_path,
+                             interp_grid=0.01)
+    np.testing.assert_array_equal(np.asarray(loaded.flow),
+                                  np.asarray(fields.flow))
+
+
+def test_evaluate_at_other_points(frequencies):
+    x = np.array([0.03, 0.21, 0.33, 0.47])
+    reference = f_solver(frequencies)
+    reference.solve(interp=True, interp_grid=x)
+    fields = LazyFields(f_solver(frequencies), interp_grid=0.01)
+    fields.solve()
+    np.testing.assert_allclose(fields.evaluate('pressure', x=x),
+                               reference.pressure, rtol=1e-12)
+    np.testing.assert_allclose(fields.evaluate('flow', [300, 1000], x),
+                               reference.flow[[25, 95]], rtol=1e-12)
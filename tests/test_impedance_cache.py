@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The impedances given by the cache are the ones of ImpedanceComputation."""
+
+import numpy as np
+
+from openwind import ImpedanceComputation
+
+from conftest import GEOMETRY, HOLES
+from tapas.impedance_cache import ImpedanceCache
+
+
+def test_hits_match_impedance_computation(tmp_path, frequencies):
+    reference = ImpedanceComputation(frequencies, GEOMETRY, HOLES,
+                                     temperature=25)
+    cache = ImpedanceCache(str(tmp_path))
+    first = cache.impedance(frequencies, GEOMETRY, HOLES, temperature=25)
+    assert first.n_computed == len(frequencies)
+    # from memory, then from the disk
+    for cached in [cache, ImpedanceCache(str(tmp_path))]:
+        hit = cached.impedance(frequencies, GEOMETRY, HOLES, temperature=25)
+        assert hit.n_computed == 0
+        assert hit.key == first.key
+        np.testing.assert_allclose(hit.impedance, reference.impedance,
+                                   rtol=1e-12)
+    assert cache.stats()['hits'] == 1
+
+
+def test_partial_hit_with_fixed_mesh(tmp_path, frequencies):
+    reference = ImpedanceComputation(frequencies, GEOMETRY, temperature=25,
+                                     l_ele=0.05, order=4)
+    cache = ImpedanceCache(str(tmp_path))
+    cache.impedance(frequencies[::2], GEOMETRY, temperature=25, l_ele=0.05,
+                    order=4)
+    partial = cache.impedance(frequencies, GEOMETRY, temperature=25,
+                              l_ele=0.05, order=4)
+    assert partial.n_computed == len(frequencies) - len(frequencies[::2])
+    np.testing.assert_allclose(partial.impedance, reference.impedance,
+                               rtol=1e-12)
+
+
+def test_callable_options_are_keyed_on_content(tmp_path, frequencies):
+    cache = ImpedanceCache(str(tmp_path))
+    for temperature in [20, 35]:
+        def profile(x, temperature=temperature):
+            return temperature + 0*x
+        reference = ImpedanceComputation(frequencies, GEOMETRY,
+                                         temperature=profile)
+        cached = cache.impedance(frequencies, GEOMETRY, temperature=profile)
+        assert cached.n_computed == len(frequencies)
+        np.testing.assert_allclose(cached.impedance, reference.impedance,
+                                   rtol=1e-12)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The binary impedance files hold the impedances of the text files."""
+
+import numpy as np
+
+from openwind.impedance_tools import read_impedance, write_impedance
+
+from tapas.impedance_store import (read_campaign, read_impedance_binary,
+                                   text_to_binary)
+
+
+def measurement(k, frequencies):
+    return (1 + k)*np.exp(1j*frequencies/100) / (1.1 + np.cos(frequencies/50))
+
+
+def test_text_to_binary(tmp_path, frequencies):
+    text_file = str(tmp_path / 'trumpet.txt')
+    write_impedance(frequencies, measurement(0, frequencies), text_file)
+    binary_file = text_to_binary(text_file, temperature=20)
+    freqs, impedance, metadata = read_impedance_binary(binary_file)
+    ref_freqs, ref_impedance = read_impedance(text_file)
+    np.testing.assert_array_equal(freqs, ref_freqs)
+    np.testing.assert_array_equal(impedance, ref_impedance)
+    assert metadata['temperature'] == 20
+
+
+def test_half_converted_campaign(tmp_path, frequencies):
+    for k in range(4):
+        write_impedance(frequencies, measurement(k, frequencies),
+                        str(tmp_path / 'note{}.txt'.format(k)))
+    for k in range(2):
+        text_to_binary(str(tmp_path / 'note{}.txt'.format(k)))
+    campaign = read_campaign(str(tmp_path))
+    assert campaign.names == ['note0', 'note1', 'note2', 'note3']
+    # the converted files are memory-mapped, the others parsed
+    assert [isinstance(impedance, np.memmap)
+            for impedance in campaign.impedances] == [True, True, False, False]
+    for k, name in enumerate(campaign):
+        _, impedance, _ = campaign[name]
+        np.testing.assert_allclose(impedance, measurement(k, frequencies),
+                                   rtol=1e-6)
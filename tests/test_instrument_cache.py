@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The solvers given by the instrument cache are the ones openwind builds."""
+
+import numpy as np
+import pytest
+
+from openwind import TemporalSolver
+from openwind.temporal import RecordingDevice
+
+from conftest import (GEOMETRY, HOLES, assert_signals_close, reed_physics,
+                      reed_player)
+from tapas.instrument_cache import InstrumentCache
+
+
+def test_frequential_hit_matches_fresh_solver(tmp_path, frequencies):
+    for cache in [InstrumentCache(str(tmp_path)),
+                  InstrumentCache(str(tmp_path))]:
+        f_solver = cache.frequential_solver(frequencies, GEOMETRY, HOLES)
+        f_solver.solve()
+    assert cache.hits == 1
+    reference = InstrumentCache(None).frequential_solver(frequencies,
+                                                         GEOMETRY, HOLES)
+    reference.solve()
+    np.testing.assert_allclose(f_solver.impedance, reference.impedance,
+                               rtol=1e-12)
+
+
+@pytest.mark.parametrize('theta', [0.25, 0])
+def test_temporal_hit_follows_the_player(tmp_path, theta):
+    options = dict(losses='diffrepr', l_ele=0.05, order=4,
+                   theta_scheme_parameter=theta)
+    cache = InstrumentCache(str(tmp_path))
+    cache.temporal_solver(GEOMETRY, player=reed_player(), **options)
+
+    # the CFL condition of the reed depends on its pulsation if theta < 1/4
+    pulsation = 2*np.pi*20000
+    t_solver = cache.temporal_solver(GEOMETRY,
+                                     player=reed_player(pulsation=pulsation),
+                                     **options)
+    assert cache.hits == 1
+    reference = TemporalSolver(reed_physics('diffrepr', pulsation=pulsation),
+                               l_ele=0.05, order=4,
+                               theta_scheme_parameter=theta)
+    assert t_solver.get_dt() == pytest.approx(reference.get_dt(), rel=1e-12)
+
+    records = list()
+    for solver in [t_solver, reference]:
+        rec = RecordingDevice()
+        solver.run_simulation_steps(300, callback=rec.callback,
+                                    enable_tracker_display=False)
+        rec.stop_recording()
+        records.append(rec.values)
+    assert_signals_close(records[1], records[0])
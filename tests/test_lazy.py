@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""openwind imported lazily computes what it computes when imported eagerly."""
+
+import os
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+
+from openwind import ImpedanceComputation, TemporalSolver
+from openwind.temporal import RecordingDevice
+
+from conftest import GEOMETRY, HOLES, reed_physics
+
+
+SRC = os.path.join(os.path.dirname(__file__), os.pardir, 'src')
+
+# run in a new interpreter: openwind is already imported by the tests
+SCRIPT = textwrap.dedent("""
+    import sys
+    sys.path[:0] = [{src!r}, {tests!r}]
+    import numpy as np
+    from tapas.lazy import import_openwind, is_loaded, LAZY_MODULES
+    openwind = import_openwind()
+    from openwind.temporal import RecordingDevice
+    from conftest import GEOMETRY, HOLES, reed_physics
+
+    result = openwind.ImpedanceComputation(
+        np.arange(50, 2000, 10.), GEOMETRY, HOLES, l_ele=0.05, order=4)
+    rec = RecordingDevice()
+    openwind.TemporalSolver(reed_physics(), l_ele=0.05, order=4
+                            ).run_simulation_steps(
+        300, callback=rec.callback, enable_tracker_display=False)
+    rec.stop_recording()
+    loaded = [name for name in LAZY_MODULES if is_loaded(name)]
+    np.savez({output!r}, impedance=result.impedance,
+             pressure=rec.values['bell_radiation_pressure'],
+             loaded=np.array(loaded, dtype=str))
+""")
+
+
+def test_lazy_openwind_gives_the_same_results(tmp_path):
+    output = str(tmp_path / 'lazy.npz')
+    script = SCRIPT.format(src=os.path.abspath(SRC),
+                           tests=os.path.abspath(os.path.dirname(__file__)),
+                           output=output)
+    subprocess.run([sys.executable, '-c', script], check=True,
+                   env=dict(os.environ, MPLBACKEND='Agg'))
+    lazy = np.load(output)
+
+    result = ImpedanceComputation(np.arange(50, 2000, 10.), GEOMETRY, HOLES,
+                                  l_ele=0.05, order=4)
+    np.testing.assert_allclose(lazy['impedance'], result.impedance,
+                               rtol=1e-12)
+    rec = RecordingDevice()
+    TemporalSolver(reed_physics(), l_ele=0.05, order=4).run_simulation_steps(
+        300, callback=rec.callback, enable_tracker_display=False)
+    rec.stop_recording()
+    pressure = np.asarray(rec.values['bell_radiation_pressure'])
+    np.testing.assert_allclose(lazy['pressure'], pressure, rtol=0,
+                               atol=1e-9*np.max(np.abs(pressure)))
+    # the computations load none of the lazy modules
+    assert lazy['loaded'].size == 0
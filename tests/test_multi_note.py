@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The notes updated from one factorization are the ones solved one by one."""
+
+import numpy as np
+
+from openwind import (FrequentialSolver, InstrumentGeometry,
+                      InstrumentPhysics, Player)
+
+from conftest import GEOMETRY
+from tapas.multi_note import MultiNoteSolver, impedance_several_notes
+
+
+HOLES = [['label', 'position', 'radius', 'chimney'],
+         ['h1', .25, 2e-3, 3e-3],
+         ['h2', .35, 3e-3, 3e-3]]
+
+CHART = [['label', 'A', 'B', 'C', 'D'],
+         ['h1', 'x', 'o', 'x', 'o'],
+         ['h2', 'x', 'x', 'o', 'o']]
+
+
+def f_solver(frequencies, **kwargs):
+    geometry = InstrumentGeometry(GEOMETRY, HOLES, CHART)
+    instru_phy = InstrumentPhysics(geometry, 25, Player(), 'bessel')
+    return FrequentialSolver(instru_phy, frequencies, **kwargs)
+
+
+def test_notes_are_the_ones_of_openwind(frequencies):
+    reference = f_solver(frequencies)
+    notes = ['A', 'B', 'C', 'D']
+    impedances = list()
+    for note in notes:
+        reference.set_note(note)
+        reference.solve()
+        impedances.append(reference.impedance)
+
+    solver = f_solver(frequencies)
+    solver.set_note('C')
+    multi = MultiNoteSolver(solver, notes)
+    multi.solve()
+    for note, impedance in zip(notes, impedances):
+        np.testing.assert_allclose(multi.impedance_of(note), impedance,
+                                   rtol=1e-9, err_msg=note)
+    # the solver is left on its note
+    assert solver.note == 'C'
+    solver.solve()
+    np.testing.assert_allclose(solver.impedance, impedances[2], rtol=1e-12)
+
+
+def test_any_reference_note(frequencies):
+    multi = MultiNoteSolver(f_solver(frequencies), reference='D').solve()
+    several = impedance_several_notes(f_solver(frequencies))
+    np.testing.assert_allclose(multi, several, rtol=1e-9)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The parallel solve gives the impedance of the serial solve of openwind."""
+
+import numpy as np
+import pytest
+
+from openwind import (FrequentialSolver, InstrumentGeometry, InstrumentPhysics,
+                      Player)
+
+from conftest import GEOMETRY, HOLES
+from tapas.parallel import ParallelFrequentialSolver
+
+
+def physics(holes=HOLES):
+    return InstrumentPhysics(InstrumentGeometry(GEOMETRY, holes), 25,
+                             Player(), 'diffrepr')
+
+
+@pytest.mark.parametrize('mp_context, chunk_size',
+                         [('fork', None), ('fork', 7), ('spawn', None)])
+def test_parallel_impedance_is_the_serial_one(frequencies, mp_context,
+                                              chunk_size):
+    instru_physics = physics()
+    f_solver = ParallelFrequentialSolver(instru_physics, frequencies,
+                                         n_jobs=2, chunk_size=chunk_size,
+                                         mp_context=mp_context,
+                                         l_ele=0.05, order=4)
+    f_solver.solve()
+    reference = FrequentialSolver(instru_physics, frequencies, l_ele=0.05,
+                                  order=4)
+    reference.solve()
+    # the same operations on each frequency
+    np.testing.assert_array_equal(f_solver.impedance, reference.impedance)
+
+
+def test_interpolated_fields_fall_back_to_the_serial_solve(frequencies):
+    instru_physics = physics([])
+    f_solver = ParallelFrequentialSolver(instru_physics, frequencies,
+                                         n_jobs=2, l_ele=0.05, order=4)
+    f_solver.solve(interp=True)
+    reference = FrequentialSolver(instru_physics, frequencies, l_ele=0.05,
+                                  order=4)
+    reference.solve(interp=True)
+    np.testing.assert_array_equal(f_solver.impedance, reference.impedance)
+    np.testing.assert_array_equal(f_solver.pressure, reference.pressure)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The rational model gives the impedance of openwind between the samples."""
+
+import numpy as np
+from scipy.signal import sosfilt
+
+from openwind import ImpedanceComputation
+
+from conftest import GEOMETRY, HOLES
+from tapas.rational import RationalImpedance, fit_impedance
+
+
+def impedance(frequencies):
+    return ImpedanceComputation(frequencies, GEOMETRY, HOLES, l_ele=0.05,
+                                order=4, temperature=25)
+
+
+def test_model_between_the_samples(tmp_path, frequencies):
+    result = impedance(frequencies)
+    model = fit_impedance(frequencies, result.impedance, tol=1e-6)
+    assert model.fit_error < 1e-5
+    assert np.all(model.poles.real < 0)
+
+    between = impedance(frequencies[:-1] + 5)
+    np.testing.assert_allclose(model(between.frequencies), between.impedance,
+                               rtol=0,
+                               atol=1e-5*np.max(np.abs(between.impedance)))
+    # a mode at each resonance of the instrument
+    modes = model.modal_bank()['frequencies']
+    for resonance in result.resonance_frequencies(3):
+        assert np.min(np.abs(modes - resonance)) < 1e-2*resonance
+
+    filename = str(tmp_path / 'model.json')
+    model.save(filename)
+    np.testing.assert_array_equal(RationalImpedance.load(filename)(frequencies),
+                                  model(frequencies))
+
+
+def test_sections_give_the_impulse_response(frequencies):
+    model = fit_impedance(frequencies, impedance(frequencies).impedance)
+    pulse = np.zeros(2000)
+    pulse[0] = 44100
+    out = sum(sosfilt(section[np.newaxis], pulse)
+              for section in model.to_sos(44100))
+    expected = model.impulse_response(44100, 2000/44100)
+    np.testing.assert_allclose(out, expected, rtol=0,
+                               atol=1e-12*np.max(np.abs(expected)))
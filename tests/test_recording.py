@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The recording written to disk is the one kept in memory by openwind."""
+
+import numpy as np
+
+from openwind import TemporalSolver
+from openwind.temporal import RecordingDevice
+
+from conftest import reed_physics
+from tapas.recording import DiskRecordingDevice
+from tapas.resampling import resample
+
+
+def test_disk_recording_is_the_one_of_openwind(tmp_path):
+    t_solver = TemporalSolver(reed_physics(), l_ele=0.05, order=4)
+    reference = RecordingDevice(record_energy=True)
+    # small blocks and buffers: the simulation waits for the writer thread
+    rec = DiskRecordingDevice(str(tmp_path / 'all.hdf5'), record_energy=True,
+                              block_size=100, n_buffers=2)
+    kept = DiskRecordingDevice(str(tmp_path / 'kept.hdf5'),
+                               channels=['bell_*', 'source_y'], decimation=4,
+                               anti_alias=False, block_size=333)
+    filtered = DiskRecordingDevice(str(tmp_path / 'filtered.hdf5'),
+                                   channels=['bell_radiation_pressure'],
+                                   decimation=4, block_size=777)
+
+    def callback(t_solver):
+        for device in [reference, rec, kept, filtered]:
+            device.callback(t_solver)
+
+    t_solver.run_simulation_steps(1500, callback=callback,
+                                  enable_tracker_display=False)
+    for device in [reference, rec, kept, filtered]:
+        device.stop_recording()
+
+    assert sorted(rec.values) == sorted(reference.values)
+    np.testing.assert_array_equal(rec.ts, reference.ts)
+    assert rec.dt == reference.dt
+    for key, signal in reference.values.items():
+        np.testing.assert_array_equal(rec.values[key], np.asarray(signal),
+                                      err_msg=key)
+
+    assert set(kept.values) == {'bell_radiation_pressure',
+                                'bell_radiation_flow', 'bell_radiation_y',
+                                'source_y'}
+    np.testing.assert_array_equal(kept.ts, reference.ts[::4])
+    for key in kept.values:
+        np.testing.assert_array_equal(kept.values[key],
+                                      np.asarray(reference.values[key])[::4],
+                                      err_msg=key)
+    source = np.asarray(reference.values['source_y'])
+    np.testing.assert_array_equal(kept.values.read('source_y', 10, 20),
+                                  source[40:80:4])
+
+    pressure = np.asarray(reference.values['bell_radiation_pressure'])
+    np.testing.assert_allclose(filtered.values['bell_radiation_pressure'],
+                               resample(pressure, 4, 1), rtol=0,
+                               atol=1e-12*np.max(np.abs(pressure)))
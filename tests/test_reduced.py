@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The reduced order model gives the impedance of the full solve."""
+
+import numpy as np
+
+from openwind import FrequentialSolver, InstrumentGeometry, InstrumentPhysics
+from openwind import Player
+
+from conftest import GEOMETRY, HOLES
+from tapas.reduced import ReducedFrequentialSolver
+
+
+def physics(temperature):
+    return InstrumentPhysics(InstrumentGeometry(GEOMETRY, HOLES), temperature,
+                             Player(), True)
+
+
+def test_matches_full_solve_and_reuses_model():
+    frequencies = np.arange(20, 3000, 2.)
+    first = ReducedFrequentialSolver(physics(20), frequencies, rtol=1e-6)
+    first.solve()
+    order = first.model.order
+
+    reference = FrequentialSolver(physics(25), frequencies)
+    reference.solve()
+    reused = ReducedFrequentialSolver(physics(25), frequencies, rtol=1e-6,
+                                      model=first.model)
+    reused.solve()
+    np.testing.assert_allclose(reused.impedance, reference.impedance,
+                               rtol=1e-5)
+    assert np.max(reused.error_indicator) <= 1e-6
+    # the basis is rebuilt, it does not accumulate the old vectors
+    assert reused.model.order <= order + 2*reused.n_moments
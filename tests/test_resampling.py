@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The resampler gives the band-limited signal at the new sample rate."""
+
+import numpy as np
+import pytest
+
+from tapas.resampling import PolyphaseResampler, resample
+
+
+INPUT_RATE = 123456.7
+"""float: A sample rate of the solver, set by a CFL condition."""
+
+FREQUENCIES = np.array([110., 1234.5, 8000., 15000.])
+AMPLITUDES = np.array([1, .5, .3, .2])
+
+
+def tones(times, frequencies=FREQUENCIES, amplitudes=AMPLITUDES):
+    return np.sum(amplitudes[:, np.newaxis]
+                  * np.sin(2*np.pi*frequencies[:, np.newaxis]*times), axis=0)
+
+
+@pytest.mark.parametrize('output_rate', [44100, 48000, 2.5*INPUT_RATE])
+def test_band_limited_signal(output_rate):
+    signal = tones(np.arange(int(0.1*INPUT_RATE)) / INPUT_RATE)
+    out = resample(signal, INPUT_RATE, output_rate)
+    # up to the last input sample
+    assert len(out) == int((len(signal) - 1)*output_rate/INPUT_RATE) + 1
+    # the edges are filtered with the zeros around the signal
+    edge = int(np.ceil(PolyphaseResampler(INPUT_RATE, output_rate).latency
+                       * output_rate)) + 2
+    expected = tones(np.arange(len(out)) / output_rate)
+    np.testing.assert_allclose(out[edge:-edge], expected[edge:-edge], rtol=0,
+                               atol=1e-4)
+
+
+def test_blocks_do_not_change_the_output():
+    rng = np.random.default_rng(0)
+    signal = rng.standard_normal(20000)
+    resampler = PolyphaseResampler(INPUT_RATE, 44100)
+    out = list()
+    start = 0
+    while start < len(signal):
+        size = rng.integers(1, 300)
+        out.append(resampler.process(signal[start:start + size]))
+        start += size
+    out.append(resampler.flush())
+    # the positions of the outputs are accumulated block by block
+    np.testing.assert_allclose(np.concatenate(out),
+                               resample(signal, INPUT_RATE, 44100),
+                               rtol=0, atol=1e-10)
+
+
+def test_frequencies_above_the_output_nyquist_are_removed():
+    signal = tones(np.arange(int(0.1*INPUT_RATE)) / INPUT_RATE,
+                   np.array([30000.]), np.array([1.]))
+    out = resample(signal, INPUT_RATE, 44100)
+    assert np.max(np.abs(out[100:-100])) < 1e-4
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The streaming engine computes the simulation of openwind."""
+
+import numpy as np
+import pytest
+
+from openwind import TemporalSolver
+from openwind.temporal import RecordingDevice
+
+from conftest import reed_physics
+from tapas.streaming import RingBuffer, StreamingEngine
+
+
+def test_ring_buffer_wraps_around():
+    buffer = RingBuffer(8)
+    buffer.push(np.arange(6.))
+    np.testing.assert_array_equal(buffer.pull(4), np.arange(4.))
+    buffer.push(np.arange(6., 12.))
+    assert len(buffer) == 8
+    np.testing.assert_array_equal(buffer.pull(8), np.arange(4., 12.))
+    np.testing.assert_array_equal(buffer.pull(3, pad=True), np.zeros(3))
+
+
+@pytest.mark.parametrize('losses', ['diffrepr', False])
+def test_blocks_match_run_simulation_steps(losses):
+    n_blocks, block_size = 8, 64
+    reference = TemporalSolver(reed_physics(losses), l_ele=0.05, order=4)
+    rec = RecordingDevice()
+    reference.run_simulation_steps(n_blocks*block_size, callback=rec.callback,
+                                   enable_tracker_display=False)
+    rec.stop_recording()
+
+    engine = StreamingEngine(TemporalSolver(reed_physics(losses), l_ele=0.05,
+                                            order=4),
+                             block_size=block_size, buffer_blocks=n_blocks)
+    engine.run(n_blocks*engine.block_duration)
+    assert engine.n_blocks == n_blocks
+    signal = np.asarray(rec.values['bell_radiation_pressure'])
+    streamed = engine.buffer.pull(n_blocks*block_size)
+    np.testing.assert_allclose(streamed, signal, rtol=0,
+                               atol=1e-9*np.max(np.abs(signal)))
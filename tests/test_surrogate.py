@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Training of the surrogates on incomplete samples."""
+
+import numpy as np
+import pytest
+
+from tapas.surrogate import ImpedanceSurrogate
+
+
+def resonances(params, n_peaks=4):
+    ranks = np.arange(1, n_peaks + 1)
+    f_res = 100*np.exp(np.outer(params[:, 0], ranks) / 3)
+    q_res = 10 + np.outer(params[:, 1], ranks)
+    z_res = 20 + params[:, [2]] + 0*ranks
+    return f_res, q_res, z_res
+
+
+def test_short_instruments_train_their_first_resonances():
+    params = np.random.default_rng(0).uniform(1, 2, (100, 3))
+    f_res, q_res, z_res = resonances(params)
+    short = params[:, 2] > 1.5
+    for values in (f_res, q_res, z_res):
+        values[short, 2:] = np.nan
+    with pytest.warns(UserWarning, match='{} of the 100'.format(sum(short))):
+        surrogate = ImpedanceSurrogate(degree=2).fit(params,
+                                                     (f_res, q_res, z_res))
+    assert surrogate.n_train == 100
+    f_est, _, _ = surrogate.predict(params[short])
+    np.testing.assert_allclose(f_est, resonances(params[short])[0], rtol=1e-2)
+
+
+def test_missing_resonance_is_an_error():
+    params = np.random.default_rng(0).uniform(1, 2, (20, 3))
+    data = resonances(params)
+    for values in data:
+        values[:, -1] = np.nan
+    with pytest.warns(UserWarning), pytest.raises(ValueError):
+        ImpedanceSurrogate().fit(params, data)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Each variant of a sweep is the simulation of a solver built for it."""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from openwind import TemporalSolver
+from openwind.technical.temporal_curves import ADSR
+from openwind.temporal import RecordingDevice
+
+from conftest import assert_signals_close, reed_physics
+from tapas.sweep import curve_grid, load_variant, run_sweep
+
+
+DURATION = 3e-3
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_variants_are_the_ones_of_openwind(tmp_path, n_jobs):
+    output_dir = str(tmp_path / 'sweep')
+    variants = curve_grid(zeta=[.3, .4],
+                          gamma=[.4, ADSR(0, 0.4, .5, 2e-3, 2e-3, 1, 2e-3)])
+    t_solver = TemporalSolver(reed_physics(), l_ele=0.05, order=4)
+    curves = dict(t_solver.instru_physics.player.control_parameters)
+    results = run_sweep(t_solver, variants, DURATION, output_dir,
+                        n_jobs=n_jobs)
+    assert [result['index'] for result in results] == [0, 1, 2, 3]
+    # the solver is given back unchanged
+    assert t_solver.instru_physics.player.control_parameters == curves
+
+    for index, variant in enumerate(variants):
+        reference = RecordingDevice()
+        TemporalSolver(reed_physics(**variant), l_ele=0.05,
+                       order=4).run_simulation(DURATION,
+                                               callback=reference.callback,
+                                               enable_tracker_display=False)
+        reference.stop_recording()
+        ts, values, _ = load_variant(output_dir, index)
+        np.testing.assert_array_equal(ts, reference.ts)
+        assert_signals_close(reference.values, values)
+        assert results[index]['n_steps'] == len(ts)
+
+    with open(os.path.join(output_dir, 'summary.json')) as file:
+        summary = json.load(file)
+    assert sum(worker['variants']
+               for worker in summary['workers'].values()) == 4
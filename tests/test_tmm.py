@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The vectorized TMM gives the impedance of openwind's TMM."""
+
+import numpy as np
+import pytest
+
+from openwind import ImpedanceComputation
+
+from conftest import GEOMETRY
+from tapas.tmm import chain_product, tmm_impedance
+
+
+def test_chain_product():
+    rng = np.random.default_rng(0)
+    matrices = rng.normal(size=(3, 7, 2, 2))
+    expected = matrices[:, 0]
+    for k in range(1, 7):
+        expected = expected @ matrices[:, k]
+    np.testing.assert_allclose(chain_product(matrices), expected)
+
+
+@pytest.mark.parametrize('radiation_category',
+                         ['unflanged', 'closed', 'perfectly_open'])
+@pytest.mark.parametrize('losses', [True, False])
+def test_matches_openwind_tmm(frequencies, radiation_category, losses):
+    reference = ImpedanceComputation(frequencies, GEOMETRY, temperature=25,
+                                     losses=losses,
+                                     radiation_category=radiation_category,
+                                     compute_method='TMM', nb_sub=10)
+    impedance = tmm_impedance(GEOMETRY, frequencies, losses=losses,
+                              radiation_category=radiation_category,
+                              nb_sub=10)
+    np.testing.assert_allclose(impedance, reference.impedance, rtol=1e-10)
+
+
+def test_several_bores(frequencies):
+    bores = [GEOMETRY, [[0.0, 4e-3], [0.4, 6e-3]]]
+    impedances = tmm_impedance(bores, frequencies, max_size=2**10)
+    assert impedances.shape == (2, len(frequencies))
+    for bore, impedance in zip(bores, impedances):
+        np.testing.assert_allclose(impedance, tmm_impedance(bore, frequencies),
+                                   rtol=1e-12)